@@ -0,0 +1,118 @@
+# =================================================================================================
+# Purpose:                  Step many matches at once, for training bots and hosting rooms in bulk
+# Misc:                     Needs numpy (pip3 install numpy), which the rest of the game does not.
+#                           Follows the rules in simulation.py exactly, one array element per match,
+#                           so any match can be handed to or from the scalar GameState.
+# =================================================================================================
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from assets.code.simulation import (BALL_SIZE, BALL_SPEED, PADDLE_HEIGHT, PADDLE_SPEED, PADDLE_WIDTH,
+                                    WALL_HEIGHT, WIN_SCORE, GameState)
+
+MOVES = ['', 'up', 'down']      # paddle input codes, same order as the binary wire format
+MOVE_UP = 1
+MOVE_DOWN = 2
+
+FIELDS = ['ballX', 'ballY', 'ballVX', 'ballVY', 'leftY', 'rightY', 'lScore', 'rScore', 'sync']
+
+
+# =====================================================================
+# Purpose: Hold count matches in numpy arrays, one element per match,
+#          and advance them all together.
+# Pre:  numpy must be importable. width and height are the screen size
+#       every match is played on.
+# Post: Creates count matches at their starting positions with the ball
+#       heading left and nobody scored.
+# =====================================================================
+class BatchSimulation:
+    def __init__(self, count: int, width: int = 640, height: int = 480) -> None:
+        if np is None:
+            raise RuntimeError("BatchSimulation needs numpy, run: pip3 install numpy")
+        self.count = count
+        self.width = width
+        self.height = height
+        for name in FIELDS:
+            setattr(self, name, np.zeros(count, dtype=np.int32))
+        self.bounced = np.zeros(count, dtype=bool)     # whether each ball bounced during the last tick
+        self.restart()
+
+    # start the matches picked by mask over, or all of them
+    def restart(self, mask=None) -> None:
+        mask = np.ones(self.count, dtype=bool) if mask is None else mask
+        start = GameState(self.width, self.height)
+        for name in FIELDS:
+            getattr(self, name)[mask] = getattr(start, name)
+        self.bounced[mask] = False
+
+    def isOver(self):
+        return (self.lScore >= WIN_SCORE) | (self.rScore >= WIN_SCORE)
+
+    # =====================================================================
+    # Purpose: Advance every match by one tick, in the same order as
+    #          simulation.advance.
+    # Pre:  leftMoves and rightMoves are move codes (an index into MOVES),
+    #       either one per match or a single code for all of them.
+    # Post: Every match is one tick later and its sync one higher. Balls in
+    #       finished matches do not move.
+    # =====================================================================
+    def advance(self, leftMoves, rightMoves) -> None:
+        self.leftY += self.paddleSteps(self.leftY, leftMoves)
+        self.rightY += self.paddleSteps(self.rightY, rightMoves)
+
+        active = ~self.isOver()
+        self.ballX += self.ballVX * active
+        self.ballY += self.ballVY * active
+
+        wentRight = active & (self.ballX > self.width)
+        wentLeft = active & ~wentRight & (self.ballX < 0)
+        self.lScore += wentRight
+        self.rScore += wentLeft
+        scored = wentRight | wentLeft
+        self.ballX[scored] = int(self.width/2)
+        self.ballY[scored] = int(self.height/2)
+        self.ballVX[scored] = np.where(wentRight[scored], -BALL_SPEED, BALL_SPEED)
+        self.ballVY[scored] = 0
+
+        hitLeft = active & self.touches(10, self.leftY, PADDLE_WIDTH, PADDLE_HEIGHT)
+        hitRight = active & ~hitLeft & self.touches(self.width-20, self.rightY, PADDLE_WIDTH, PADDLE_HEIGHT)
+        hit = hitLeft | hitRight
+        paddleY = np.where(hitLeft, self.leftY, self.rightY)
+        self.ballVX[hit] *= -1
+        self.ballVY[hit] = ((self.ballY[hit] + BALL_SIZE//2) - (paddleY[hit] + PADDLE_HEIGHT//2)) // 2
+
+        wallWidth = self.width + 20
+        wall = active & (self.touches(-10, 0, wallWidth, WALL_HEIGHT) |
+                         self.touches(-10, self.height-WALL_HEIGHT, wallWidth, WALL_HEIGHT))
+        self.ballVY[wall] *= -1
+
+        self.bounced = hit | wall
+        self.sync += 1
+
+    # how far each paddle moves this tick, using the same bounds as simulation.movePaddle
+    def paddleSteps(self, y, moves):
+        down = (moves == MOVE_DOWN) & (y + PADDLE_HEIGHT < self.height-10)
+        up = (moves == MOVE_UP) & (y > 10)
+        return (down.astype(np.int32) - up) * PADDLE_SPEED
+
+    # which balls overlap the rectangle, like pygame.Rect.colliderect
+    def touches(self, x, y, w, h):
+        return ((self.ballX < x + w) & (self.ballX + BALL_SIZE > x) &
+                (self.ballY < y + h) & (self.ballY + BALL_SIZE > y))
+
+    # copy one match out as a GameState
+    def state(self, index: int) -> GameState:
+        state = GameState(self.width, self.height)
+        for name in FIELDS:
+            setattr(state, name, int(getattr(self, name)[index]))
+        state.bounced = bool(self.bounced[index])
+        return state
+
+    # copy a GameState into one match
+    def load(self, index: int, state: GameState) -> None:
+        for name in FIELDS:
+            getattr(self, name)[index] = getattr(state, name)
+        self.bounced[index] = state.bounced
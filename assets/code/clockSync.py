@@ -0,0 +1,82 @@
+# =================================================================================================
+# Purpose:                  Measure round trip time to the server
+# Misc:                     The client sends {'ping': <its clock>, 'rtt': <last rtt in ms>} about once
+#                           a second and the server answers {'pong': <the same value>} at once. Each
+#                           answer gives one round trip time. The rtt carried in the ping is how the
+#                           server learns each client's latency without pinging anyone itself.
+# =================================================================================================
+
+import time
+
+PING_INTERVAL = 1.0     # seconds between pings, so the cost is a few dozen bytes a second
+RTT_GAIN = 0.125        # share of each new sample taken into the smoothed rtt, as TCP does
+JITTER_GAIN = 0.25      # the same for the rtt's variation
+
+
+# =====================================================================
+# Purpose: Keep the client's view of its connection to the server: the
+#          smoothed round trip time and its jitter.
+# Pre:  interval is the seconds between pings.
+# Post: Creates an estimator with no samples. rtt is None until the
+#       first pong arrives.
+# =====================================================================
+class ClockSync:
+    def __init__(self, interval: float = PING_INTERVAL) -> None:
+        self.interval = interval
+        self.rtt = None         # smoothed round trip, ms
+        self.jitter = 0.0       # smoothed difference between samples and rtt, ms
+        self.lastRtt = None     # newest sample, ms
+        self.minRtt = None
+        self.nextPing = 0.0
+        self.pings = 0
+        self.pongs = 0
+
+    # the ping to send now, or None if one went out less than interval ago
+    def pingDue(self, now: float = None):
+        now = time.monotonic() if now is None else now
+        if now < self.nextPing:
+            return None
+        self.nextPing = now + self.interval
+        self.pings += 1
+        return {'ping': now, 'rtt': round(self.rtt or 0.0, 3)}
+
+    # =====================================================================
+    # Purpose: Take in the server's answer to one of our pings.
+    # Pre:  msg is a pong message. now is our clock when it arrived.
+    # Post: rtt and jitter are updated. Answers that cannot be
+    #       ours (from the future) are ignored.
+    # =====================================================================
+    def onPong(self, msg: dict, now: float = None) -> None:
+        now = time.monotonic() if now is None else now
+        sentAt = msg.get('pong')
+        if not isinstance(sentAt, (int, float)) or sentAt > now:
+            return
+        self.pongs += 1
+        rtt = (now - sentAt) * 1000
+        self.lastRtt = rtt
+        self.minRtt = rtt if self.minRtt is None else min(self.minRtt, rtt)
+        if self.rtt is None:
+            self.rtt = rtt
+            self.jitter = rtt / 2
+        else:
+            self.jitter += (abs(rtt - self.rtt) - self.jitter) * JITTER_GAIN
+            self.rtt += (rtt - self.rtt) * RTT_GAIN
+
+
+# =====================================================================
+# Purpose: The server's answer to a ping.
+# Pre:  msg is a message with a 'ping' key.
+# Post: Returns the pong to send back, or None if the ping is malformed.
+# =====================================================================
+def pongFor(msg: dict):
+    if not isinstance(msg.get('ping'), (int, float)):
+        return None
+    return {'pong': msg['ping']}
+
+
+# the rtt in ms a ping reports, or None if it carries none yet
+def reportedRtt(msg: dict):
+    rtt = msg.get('rtt')
+    if isinstance(rtt, (int, float)) and rtt > 0:
+        return rtt
+    return None
@@ -0,0 +1,114 @@
+# =================================================================================================
+# Purpose:                  Run a match in lockstep, every peer simulating it from the same inputs
+# Misc:                     The server decides which inputs apply from which tick and sends them to
+#                           the room as turns, {'turn': sync, 'left': move, 'right': move}: every
+#                           tick after sync uses those inputs, and every tick up to sync is final.
+#                           simulation.py only uses integers, so every peer that runs the same ticks
+#                           with the same inputs has the same state and no state needs to be sent.
+#                           Every HASH_EVERY ticks each peer reports its stateHash. The server
+#                           compares it with its own and sends a peer that went wrong a resync,
+#                           which holds the whole state. Does not import pygame.
+# =================================================================================================
+
+from collections import deque
+
+from assets.code.simulation import GameState, advance, stateHash, sweep
+from assets.code.timestep import ticksPerSend
+
+HASH_EVERY = 6          # ticks between hash reports, 10 a second at 60 ticks
+HASH_HISTORY = 64       # reports the server keeps its own hashes for, late reports are not checked
+JITTER_TICKS = 3        # ticks a peer stays behind the newest turn, so a late turn does not stall it
+RESYNC_FIELDS = ('ballX', 'ballY', 'ballVX', 'ballVY', 'leftY', 'rightY', 'lScore', 'rScore', 'sync')
+
+
+# the inputs in force after tick sync, for the room
+def turnMessage(sync: int, inputs: dict) -> dict:
+    return {'turn': sync, 'left': inputs['left'], 'right': inputs['right']}
+
+
+# everything a peer needs to carry on from state, for one that diverged or joined late
+def resyncMessage(state: GameState, inputs: dict) -> dict:
+    fields = {name: getattr(state, name) for name in RESYNC_FIELDS}
+    fields['left'], fields['right'] = inputs['left'], inputs['right']
+    return {'resync': fields}
+
+
+# =====================================================================
+# Purpose: One peer's copy of a lockstep match. Runs game a tick at a
+#          time with the inputs the turns say, never past the newest
+#          turn, and reports the state's hash every HASH_EVERY ticks.
+# Pre:  game is the match at its start, or at the sync the first resync
+#       will set. tickRate, sendRate and swept are from the game info;
+#       turns come at least every tickRate / sendRate ticks.
+# Post: Creates a peer that waits for enough turns to start.
+# =====================================================================
+class LockstepPeer:
+    def __init__(self, game: GameState, tickRate: int = 60, sendRate: float = None, swept: bool = False) -> None:
+        self.game = game
+        self.advance = sweep if swept else advance      # the server's rules, a tick at a time
+        self.inputs = {'left': "", 'right': ""}
+        self.turns = deque()        # (sync, inputs) of turns that take effect after game.sync
+        self.confirmed = 0          # the newest sync a turn has made final
+        self.buffer = ticksPerSend(tickRate, sendRate) + JITTER_TICKS
+        self.waiting = True         # ran out of turns, wait for buffer of them before going on
+        self.waited = 0             # ticks waited so far, the match may have ended
+        self.resyncs = 0
+
+    # a new match, the caller restarts game
+    def clear(self) -> None:
+        self.inputs = {'left': "", 'right': ""}
+        self.turns.clear()
+        self.confirmed = 0
+        self.waiting = True
+        self.waited = 0
+
+    # take a turn or a resync, returns whether msg was one
+    def receive(self, msg: dict) -> bool:
+        if 'turn' in msg:
+            if msg['turn'] >= self.game.sync:
+                self.turns.append((msg['turn'], {'left': msg['left'], 'right': msg['right']}))
+                self.confirmed = max(self.confirmed, msg['turn'])
+            return True
+        if 'resync' in msg:
+            fields = msg['resync']
+            for name in RESYNC_FIELDS:
+                setattr(self.game, name, fields[name])
+            self.inputs = {'left': fields['left'], 'right': fields['right']}
+            self.turns = deque(turn for turn in self.turns if turn[0] > self.game.sync)
+            self.confirmed = max(self.confirmed, self.game.sync)
+            self.resyncs += 1
+            return True
+        return False
+
+    # =====================================================================
+    # Purpose: How many of the ticks the clock says are due may be run.
+    # Pre:  ticks is what FixedTimestep.due (or the caller's own clock)
+    #       returned.
+    # Post: Returns at most the ticks the turns have made final. Holds
+    #       back after running out until a buffer of turns is there again,
+    #       or one buffer's worth of ticks went by without any, and
+    #       catches up at once after falling more than two buffers behind.
+    # =====================================================================
+    def due(self, ticks: int) -> int:
+        backlog = self.confirmed - self.game.sync
+        if self.waiting:
+            self.waited += ticks
+            if backlog < self.buffer and self.waited < self.buffer:
+                return 0
+            self.waiting = False
+            self.waited = 0
+        if backlog > 2 * self.buffer:
+            return backlog - self.buffer
+        if ticks >= backlog:
+            self.waiting = True
+        return min(ticks, backlog)
+
+    # run one tick, returns the hash report to send the server when one is due
+    def tick(self):
+        game = self.game
+        while self.turns and self.turns[0][0] <= game.sync:
+            self.inputs = self.turns.popleft()[1]
+        self.advance(game, self.inputs)
+        if game.sync % HASH_EVERY == 0:
+            return {'hash': stateHash(game), 'sync': game.sync}
+        return None
@@ -0,0 +1,165 @@
+# =================================================================================================
+# Purpose:                  Hide network jitter from the game screens
+# Misc:                     SnapshotBuffer draws remote objects a little in the past, between the two
+#                           updates on either side, so late or missing updates no longer make them
+#                           teleport. PaddlePredictor moves the player's own paddle as soon as a key
+#                           is pressed and corrects it from the server's snapshots. VisualOffset
+#                           eases the ball onto a corrected position instead of jumping there.
+# =================================================================================================
+
+import time
+from collections import deque
+from assets.code.simulation import PADDLE_HEIGHT, movePaddle
+
+INTERP_DELAY = 0.1      # seconds remote objects are drawn behind the newest update
+MAX_SNAPSHOTS = 32      # updates kept per buffer
+RESTART_GAP = 60        # a sync this far behind the newest one means the game restarted
+CLOCK_CORRECTION = 0.1  # share of the render clock's error removed each frame
+SNAP_DISTANCE = 100     # pixels, bigger jumps (a point scored, a rematch) are not smoothed
+OFFSET_DECAY = 0.8      # share of a ball correction still left to ease out after each frame
+MAX_HISTORY = 256       # predicted paddle positions kept for reconciliation
+
+
+# =====================================================================
+# Purpose: Keep the latest updates for some remote objects, numbered by
+#          the sender's sync, and give back their position at a render
+#          time that trails the newest update by INTERP_DELAY.
+# Pre:  tickRate is how many sync steps the sender makes per second.
+# Post: Creates an empty buffer. sample returns None until the first push.
+# =====================================================================
+class SnapshotBuffer:
+    def __init__(self, tickRate: float, delay: float = INTERP_DELAY) -> None:
+        self.tickRate = tickRate
+        self.delayTicks = delay * tickRate
+        self.snapshots = deque(maxlen=MAX_SNAPSHOTS)    # (sync, values) oldest first
+        self.renderSync = None      # sync currently being drawn, runs on the local clock
+        self.lastSample = 0.0
+
+    def clear(self) -> None:
+        self.snapshots.clear()
+        self.renderSync = None
+
+    # add an update, values maps names to numbers
+    def push(self, sync: int, values: dict) -> None:
+        if self.snapshots and sync <= self.snapshots[-1][0]:
+            if sync + RESTART_GAP > self.snapshots[-1][0]:
+                return      # arrived out of order, a newer update is already here
+            self.clear()    # the sender started over, e.g. after a rematch
+        self.snapshots.append((sync, values))
+
+    # the values at the current render time, blended between the updates around it
+    def sample(self, now: float = None):
+        if not self.snapshots:
+            return None
+        now = time.monotonic() if now is None else now
+        target = self.snapshots[-1][0] - self.delayTicks
+        if self.renderSync is None or abs(target - self.renderSync) > self.delayTicks * 2 + 1:
+            self.renderSync = target
+        else:
+            # advance with the local clock and drift towards the target, so uneven arrival does not show
+            self.renderSync += (now - self.lastSample) * self.tickRate
+            self.renderSync += (target - self.renderSync) * CLOCK_CORRECTION
+        self.lastSample = now
+
+        older = self.snapshots[0]
+        if self.renderSync <= older[0]:
+            return older[1]
+        for newer in self.snapshots:
+            if newer[0] >= self.renderSync:
+                fraction = (self.renderSync - older[0]) / (newer[0] - older[0])
+                return {key: lerp(older[1][key], value, fraction) for key, value in newer[1].items()}
+            older = newer
+        return older[1]     # nothing newer yet, hold the last known position
+
+
+# how far behind to draw updates that arrive sendRate times a second, so two of them are always on hand
+def interpDelay(sendRate: float = None) -> float:
+    if not sendRate:
+        return INTERP_DELAY
+    return max(INTERP_DELAY, 2 / sendRate)
+
+
+# blend two positions, except across a jump too big to be movement
+def lerp(start: float, end: float, fraction: float) -> float:
+    if abs(end - start) > SNAP_DISTANCE:
+        return start if fraction < 1 else end
+    return start + (end - start) * fraction
+
+
+# =====================================================================
+# Purpose: Ease an object onto a corrected position over a few frames.
+#          The object itself moves straight to the correction so the
+#          game logic stays right, only where it is drawn is offset.
+# Pre:  None.
+# Post: Creates an offset of zero.
+# =====================================================================
+class VisualOffset:
+    def __init__(self) -> None:
+        self.x = 0.0
+        self.y = 0.0
+
+    # called when the object is moved from (oldX, oldY) to (newX, newY) by an update
+    def correct(self, oldX: float, oldY: float, newX: float, newY: float) -> None:
+        self.x += oldX - newX
+        self.y += oldY - newY
+        if abs(self.x) > SNAP_DISTANCE or abs(self.y) > SNAP_DISTANCE:
+            self.x = self.y = 0.0
+
+    # shrink the offset, once per frame, and return it rounded to whole pixels
+    def step(self) -> tuple[int, int]:
+        self.x *= OFFSET_DECAY
+        self.y *= OFFSET_DECAY
+        return round(self.x), round(self.y)
+
+
+# =====================================================================
+# Purpose: Predict the player's own paddle against an authoritative
+#          server. The paddle moves locally on every tick, each position
+#          is remembered by tick number, and when a snapshot reports
+#          where the server had the paddle at one of those ticks the
+#          difference is applied to the current position.
+# Pre:  y is the paddle's starting y, screenHeight and tickRate match
+#       the server's.
+# Post: Creates a predictor at tick 0 with the paddle not moving.
+# =====================================================================
+class PaddlePredictor:
+    def __init__(self, y: int, screenHeight: int, tickRate: float) -> None:
+        self.y = y
+        self.screenHeight = screenHeight
+        self.tickInterval = 1 / tickRate
+        self.tick = 0
+        self.history = deque([(0, y)], maxlen=MAX_HISTORY)     # (tick, y after that tick)
+        self.accumulated = 0.0
+        self.lastAdvance = None
+        self.corrections = 0
+
+    def reset(self, y: int) -> None:
+        self.y = y
+        self.history.clear()
+        self.history.append((self.tick, y))
+
+    # run every tick that has elapsed since the last call with the given input
+    def advance(self, moving: str, now: float = None) -> None:
+        now = time.monotonic() if now is None else now
+        if self.lastAdvance is not None:
+            self.accumulated += now - self.lastAdvance
+        self.lastAdvance = now
+        while self.accumulated >= self.tickInterval:
+            self.accumulated -= self.tickInterval
+            self.y = movePaddle(self.y, moving, self.screenHeight)
+            self.tick += 1
+            self.history.append((self.tick, self.y))
+
+    # serverY is where the server had the paddle at our tick ack
+    def reconcile(self, serverY: float, ack: int) -> None:
+        if ack > self.tick:
+            return      # the server is counting from before we started
+        while self.history and self.history[0][0] < ack:
+            self.history.popleft()
+        if not self.history or self.history[0][0] != ack:
+            return      # not a tick we remember, e.g. from before a rematch
+        error = serverY - self.history[0][1]
+        if error:
+            self.corrections += 1
+            self.y = min(max(self.y + error, 0), self.screenHeight - PADDLE_HEIGHT)
+            self.history = deque(((tick, y + error) for tick, y in self.history), maxlen=MAX_HISTORY)
@@ -0,0 +1,266 @@
+# =================================================================================================
+# Purpose:                  Record matches to compact append-only replay files, and read them back
+# Misc:                     A file is a FILE_HEADER followed by records, each a RECORD_HEADER and a
+#                           body. Authoritative matches are recorded as paddle inputs plus a keyframe
+#                           of the whole GameState about once a second, which is enough to rebuild
+#                           every tick since the simulation is deterministic. Relayed matches are
+#                           recorded as the players' state messages, with keyframes of the newest
+#                           positions (and no ball velocity, which relaying never sees).
+#                           The event loop only appends to an in-memory buffer. Full buffers are
+#                           handed to a RecordingWriter thread, so the disk never stalls the relay.
+# =================================================================================================
+
+import json
+import os
+import queue
+import struct
+import threading
+import time
+
+from assets.code.wireProtocol import ROLES, MOVES, STATE_BODY
+from assets.code.simulation import GameState
+
+RECORDING_SUFFIX = ".pongrec"
+MAGIC = b"PONGREC\0"
+FORMAT_VERSION = 1
+FLAG_AUTHORITATIVE = 1
+FLAG_SWEPT = 2      # the server moved the ball with simulation.sweep
+
+# magic, version, flags, width, height, tickRate, roomId, start (unix time)
+FILE_HEADER = struct.Struct("!8sBBHHHId")
+# type, body length, ms since the file was started
+RECORD_HEADER = struct.Struct("!BHI")
+
+REC_KEYFRAME = 1    # the whole game at one tick
+REC_INPUT = 2       # a paddle input, applied before the tick after sync
+REC_STATE = 3       # a player's state message, as relayed
+REC_EVENT = 4       # anything else (start, rematch, end), as UTF-8 JSON
+
+KEYFRAME_BODY = struct.Struct("!hhhhhhBBI")     # ballX ballY ballVX ballVY leftY rightY lScore rScore sync
+INPUT_BODY = struct.Struct("!BBI")              # role move sync
+KEYFRAME_FIELDS = ['ballX', 'ballY', 'ballVX', 'ballVY', 'leftY', 'rightY', 'lScore', 'rScore', 'sync']
+
+KEYFRAME_INTERVAL = 1.0         # seconds between keyframes, and between handing buffers to the writer
+FLUSH_SIZE = 64 * 1024          # bytes buffered before they are handed over early
+MAX_FILE_BYTES = 64 * 1024**2   # a recording this big is continued in a new part file
+
+
+# =====================================================================
+# Purpose: Append buffers to recording files from a thread of its own,
+#          shared by every recording in a server.
+# Pre:  directory exists or can be created.
+# Post: Starts the writer thread. stop flushes everything and ends it.
+# =====================================================================
+class RecordingWriter:
+    def __init__(self, directory: str, maxFileBytes: int = MAX_FILE_BYTES) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.maxFileBytes = maxFileBytes
+        self.queue = queue.SimpleQueue()    # (path, bytes) to append, or (path, None) to close
+        self.errors = 0
+        self.thread = threading.Thread(target=self.run, name="recording-writer", daemon=True)
+        self.thread.start()
+
+    def write(self, path: str, data: bytes) -> None:
+        self.queue.put((path, data))
+
+    def close(self, path: str) -> None:
+        self.queue.put((path, None))
+
+    def stop(self) -> None:
+        self.queue.put(None)
+        self.thread.join()
+
+    def run(self) -> None:
+        files = {}
+        while (item := self.queue.get()) is not None:
+            path, data = item
+            try:
+                if data is None:
+                    if path in files:
+                        files.pop(path).close()
+                    continue
+                if path not in files:
+                    files[path] = open(path, "ab")
+                files[path].write(data)
+            except OSError as error:
+                self.errors += 1
+                print(f"[RECORDING] could not write {path}: {error}")
+        for f in files.values():
+            f.close()
+
+
+# =====================================================================
+# Purpose: Record one room's match, from its start until the room
+#          closes, rotating to a new part file past the writer's size
+#          limit.
+# Pre:  writer is the server's RecordingWriter. authoritative says
+#       whether the server simulates the match, and swept whether it
+#       moves the ball with simulation.sweep.
+# Post: Creates the first part of the recording with its header.
+# =====================================================================
+class MatchRecorder:
+    def __init__(self, writer: RecordingWriter, roomId: int, width: int, height: int, tickRate: int,
+                 authoritative: bool, swept: bool = False) -> None:
+        self.writer = writer
+        self.roomId = roomId
+        flags = (FLAG_AUTHORITATIVE if authoritative else 0) | (FLAG_SWEPT if swept else 0)
+        self.header = (width, height, tickRate, roomId, flags)
+        self.name = f"room{roomId}-{time.strftime('%Y%m%d-%H%M%S')}"
+        self.part = 0
+        self.buffer = bytearray()
+        self.latest = {}        # the newest positions, for relayed matches
+        self.held = {}          # each paddle's newest input, for authoritative matches
+        self.resetLatest()
+        self.startPart()
+
+    def resetLatest(self) -> None:
+        start = GameState(*self.header[:2])
+        self.latest = {name: getattr(start, name) for name in KEYFRAME_FIELDS}
+        self.latest['ballVX'] = self.latest['ballVY'] = 0     # relaying never sees the velocity
+
+    def startPart(self) -> None:
+        self.part += 1
+        self.path = os.path.join(self.writer.directory, f"{self.name}-{self.part}{RECORDING_SUFFIX}")
+        self.started = time.monotonic()
+        self.partBytes = 0
+        self.nextKeyframe = 0.0
+        width, height, tickRate, roomId, flags = self.header
+        self.buffer += FILE_HEADER.pack(MAGIC, FORMAT_VERSION, flags, width, height, tickRate, roomId, time.time())
+
+    def append(self, recordType: int, body: bytes) -> None:
+        millis = int((time.monotonic() - self.started) * 1000)
+        self.buffer += RECORD_HEADER.pack(recordType, len(body), millis)
+        self.buffer += body
+        if len(self.buffer) >= FLUSH_SIZE:
+            self.flush()
+
+    # hand what is buffered to the writer thread
+    def flush(self) -> None:
+        if self.buffer:
+            self.partBytes += len(self.buffer)
+            self.writer.write(self.path, bytes(self.buffer))
+            self.buffer.clear()
+
+    # =====================================================================
+    # Purpose: Write a keyframe if one is due, or whenever force is set.
+    # Pre:  state is the match's GameState, or None for a relayed match,
+    #       whose newest relayed positions are used.
+    # Post: Buffers are handed to the writer, and a new part is started
+    #       (beginning with this keyframe and the inputs still held) if
+    #       the file grew too big.
+    # =====================================================================
+    def keyframe(self, state=None, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now < self.nextKeyframe:
+            return
+        rotated = self.partBytes + len(self.buffer) >= self.writer.maxFileBytes
+        if rotated:
+            self.flush()
+            self.writer.close(self.path)
+            self.startPart()
+        self.nextKeyframe = now + KEYFRAME_INTERVAL
+        values = self.latest if state is None else {name: getattr(state, name) for name in KEYFRAME_FIELDS}
+        try:
+            body = KEYFRAME_BODY.pack(*[values[name] for name in KEYFRAME_FIELDS])
+        except struct.error:
+            return      # a relayed value out of range, the next keyframe will do
+        self.append(REC_KEYFRAME, body)
+        if rotated and state is not None:
+            # a keyframe has no inputs, so a new part would not know a key was being held
+            for role, moving in self.held.items():
+                self.input(role, moving, state.sync)
+        self.flush()
+
+    # a paddle input an authoritative server applies after tick sync
+    def input(self, role: str, moving: str, sync: int) -> None:
+        if role in ('left', 'right') and moving in MOVES:
+            self.held[role] = moving
+            self.append(REC_INPUT, INPUT_BODY.pack(ROLES.index(role), MOVES.index(moving), sync))
+
+    # a player's state message that was relayed to the room
+    def state(self, msg: dict) -> None:
+        try:
+            body = STATE_BODY.pack(msg['ballX'], msg['ballY'], msg['paddleX'], msg['paddleY'],
+                                   msg['lScore'], msg['rScore'], ROLES.index(msg['role']), msg['sync'])
+        except (KeyError, ValueError, struct.error):
+            return      # not a state this format can hold, leave it out rather than the whole match
+        self.append(REC_STATE, body)
+        self.latest[msg['role'] + 'Y'] = msg['paddleY']
+        if msg['sync'] >= self.latest['sync']:
+            for name in ['ballX', 'ballY', 'lScore', 'rScore', 'sync']:
+                self.latest[name] = msg[name]
+        self.keyframe()
+
+    def event(self, msg: dict) -> None:
+        self.append(REC_EVENT, json.dumps(msg).encode())
+
+    # both players agreed to play again, state is the restarted GameState if the server simulates
+    def rematch(self, state=None) -> None:
+        self.event({'rematch': True})
+        self.held = {}      # the server lets go of both paddles for the new match
+        if state is None:
+            self.resetLatest()
+        self.keyframe(state, force=True)
+
+    def close(self) -> None:
+        self.event({'end': True})
+        self.flush()
+        self.writer.close(self.path)
+
+
+# =====================================================================
+# Purpose: Read the header at the start of a recording.
+# Pre:  data is the recording, or at least its first FILE_HEADER.size
+#       bytes, as bytes, a memoryview or an mmap.
+# Post: Returns the header as a dict. Raises ValueError if data is not
+#       a recording this code can read.
+# =====================================================================
+def readHeader(data) -> dict:
+    if len(data) < FILE_HEADER.size:
+        raise ValueError("too short to be a recording")
+    magic, version, flags, width, height, tickRate, roomId, started = FILE_HEADER.unpack_from(data)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError("not a pong recording, or from a newer version")
+    return {'authoritative': bool(flags & FLAG_AUTHORITATIVE), 'swept': bool(flags & FLAG_SWEPT),
+            'width': width, 'height': height,
+            'tickRate': tickRate, 'roomId': roomId, 'started': started}
+
+
+# =====================================================================
+# Purpose: Walk the records of a recording without copying it.
+# Pre:  data is as for readHeader. offset is where a record starts,
+#       FILE_HEADER.size for the first one.
+# Post: Yields (offset, type, ms, bodyStart, bodyEnd) for each whole
+#       record. A record cut short at the end (the server was still
+#       writing, or stopped) ends the walk.
+# =====================================================================
+def iterRecords(data, offset: int = FILE_HEADER.size):
+    end = len(data)
+    while offset + RECORD_HEADER.size <= end:
+        recordType, length, millis = RECORD_HEADER.unpack_from(data, offset)
+        bodyStart = offset + RECORD_HEADER.size
+        if bodyStart + length > end:
+            return
+        yield offset, recordType, millis, bodyStart, bodyStart + length
+        offset = bodyStart + length
+
+
+# =====================================================================
+# Purpose: Decode one record's body.
+# Pre:  recordType and the body's bounds come from iterRecords.
+# Post: Returns the record as a dict, or None for unknown types.
+# =====================================================================
+def decodeRecord(data, recordType: int, bodyStart: int, bodyEnd: int):
+    if recordType == REC_KEYFRAME:
+        return dict(zip(KEYFRAME_FIELDS, KEYFRAME_BODY.unpack_from(data, bodyStart)))
+    if recordType == REC_INPUT:
+        role, moving, sync = INPUT_BODY.unpack_from(data, bodyStart)
+        return {'role': ROLES[role], 'input': MOVES[moving], 'sync': sync}
+    if recordType == REC_STATE:
+        ballX, ballY, paddleX, paddleY, lScore, rScore, role, sync = STATE_BODY.unpack_from(data, bodyStart)
+        return {'ballX': ballX, 'ballY': ballY, 'paddleX': paddleX, 'paddleY': paddleY,
+                'lScore': lScore, 'rScore': rScore, 'role': ROLES[role], 'sync': sync}
+    if recordType == REC_EVENT:
+        return json.loads(bytes(data[bodyStart:bodyEnd]))
+    return None
@@ -0,0 +1,89 @@
+# =================================================================================================
+# Purpose:                  Draw the game field without redrawing what has not changed
+# Misc:                     The background, walls and center line never move, so they are drawn once
+#                           to a surface of their own. Each frame only the areas drawn over during
+#                           the last frame are restored from it, and only those and the newly drawn
+#                           areas are handed to the display. Rendered text is cached by its content,
+#                           so the score is only rendered again when it changes.
+# =================================================================================================
+
+import pygame
+
+TEXT_CACHE_SIZE = 64    # rendered strings kept, the oldest is dropped first
+
+
+# =====================================================================
+# Purpose: Draw frames onto the display's surface, updating only the
+#          parts of the window that changed.
+# Pre:  screen is the surface pygame.display.set_mode returned.
+#       background and lineColor are the field's colors.
+# Post: Draws the static field once. The first frame is shown whole.
+# =====================================================================
+class FieldRenderer:
+    def __init__(self, screen: pygame.surface.Surface, background, lineColor) -> None:
+        self.screen = screen
+        width, height = screen.get_size()
+        self.field = pygame.Surface((width, height)).convert(screen)
+        self.field.fill(background)
+        # the dotted line in the center and the walls
+        for y in range(0, height, 10):
+            pygame.draw.rect(self.field, lineColor, pygame.Rect((width/2)-5, y, 5, 5))
+        pygame.draw.rect(self.field, lineColor, pygame.Rect(-10, 0, width+20, 10))
+        pygame.draw.rect(self.field, lineColor, pygame.Rect(-10, height-10, width+20, 10))
+        self.texts = {}         # (font, text, color, background) -> rendered surface
+        self.drawn = []         # areas drawn over the field this frame
+        self.erased = []        # areas drawn last frame, restored by begin
+        self.full = True        # the next frame is drawn and shown whole
+
+    # show the whole window again next frame, for when something was drawn without the renderer
+    def invalidate(self) -> None:
+        self.full = True
+
+    # start a frame: put the field back wherever the last frame drew
+    def begin(self) -> None:
+        if self.full:
+            self.screen.blit(self.field, (0, 0))
+        else:
+            for area in self.drawn:
+                self.screen.blit(self.field, area, area)
+        self.erased = self.drawn
+        self.drawn = []
+
+    def rect(self, color, rect: pygame.Rect) -> pygame.Rect:
+        area = pygame.draw.rect(self.screen, color, rect)
+        self.drawn.append(area)
+        return area
+
+    # =====================================================================
+    # Purpose: Render a string once and reuse the surface while it stays
+    #          the same.
+    # Pre:  font is a pygame font. background is a color or None.
+    # Post: Returns the rendered surface, from the cache if it was there.
+    # =====================================================================
+    def render(self, font: pygame.font.Font, text: str, color, background=None) -> pygame.surface.Surface:
+        key = (font, text, color, background)
+        surface = self.texts.get(key)
+        if surface is None:
+            if len(self.texts) >= TEXT_CACHE_SIZE:
+                del self.texts[next(iter(self.texts))]
+            surface = self.texts[key] = font.render(text, False, color, background)
+        return surface
+
+    # draw a string, placed by any pygame.Rect position such as center= or topleft=
+    def text(self, font: pygame.font.Font, text: str, color, background=None, **position) -> pygame.Rect:
+        surface = self.render(font, text, color, background)
+        area = self.screen.blit(surface, surface.get_rect(**position))
+        self.drawn.append(area)
+        return area
+
+    # the score, where helperCode's updateScore puts it
+    def score(self, font: pygame.font.Font, lScore: int, rScore: int, color) -> pygame.Rect:
+        return self.text(font, f"{lScore}   {rScore}", color, center=((self.screen.get_width()/2)+5, 50))
+
+    # end a frame: show what was erased and what was drawn, or everything after invalidate
+    def present(self) -> None:
+        if self.full:
+            pygame.display.flip()
+            self.full = False
+        else:
+            pygame.display.update(self.erased + self.drawn)
@@ -0,0 +1,350 @@
+# =================================================================================================
+# Purpose:                  Play back recordings made with pongServer.py --record, with no pygame
+# Misc:                     A Replay maps its file into memory rather than reading it, so opening a
+#                           big recording costs one walk over the record headers and the operating
+#                           system only pages in what is looked at. That walk builds an index of
+#                           every keyframe, so any moment is found with a binary search and rebuilt
+#                           from the keyframe before it (at most a second of records) instead of
+#                           from the start. pongClient.py --replay draws it, replayStats and
+#                           scanArchive read it without a window.
+# =================================================================================================
+
+import bisect
+import mmap
+import os
+import time
+
+from assets.code.recording import (RECORDING_SUFFIX, REC_EVENT, REC_INPUT, REC_KEYFRAME, REC_STATE,
+                                   KEYFRAME_BODY, KEYFRAME_FIELDS, decodeRecord, iterRecords, readHeader)
+from assets.code.simulation import BALL_SIZE, PADDLE_WIDTH, WALL_HEIGHT, WIN_SCORE, GameState, advance, isOver, sweep
+
+SYNC_OFFSET = KEYFRAME_BODY.size - 4    # where the sync sits in a keyframe's body
+NEAR = 20       # px from a paddle or wall a turn of the ball must happen within to count as hitting it
+
+
+# =====================================================================
+# Purpose: One recording, opened for seeking to any moment in it.
+# Pre:  path is a recording file.
+# Post: Maps the file and indexes its keyframes. Raises ValueError if it
+#       is not a recording, OSError if it cannot be opened.
+# =====================================================================
+class Replay:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                raise ValueError("empty file")
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self.header = readHeader(self.data)
+        except ValueError:
+            self.data.close()
+            raise
+        self.authoritative = self.header['authoritative']
+        self.advance = sweep if self.header['swept'] else advance    # the rules the server ticked the match with
+        self.tickRate = self.header['tickRate'] or 60
+        self.buildIndex()
+        self.state = None           # the game at self.time, rebuilt by seek
+        self.time = -1
+        self.keyIndex = -1          # the keyframe self.state was rebuilt from
+        self.cursor = 0             # offset of the first record not yet applied to self.state
+        self.inputs = {}
+
+    def __enter__(self) -> "Replay":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.data.close()
+
+    # =====================================================================
+    # Purpose: Walk the record headers once, noting where each keyframe
+    #          is. Only keyframe syncs and inputs are decoded.
+    # Pre:  self.data holds the recording.
+    # Post: keyTimes, keyOffsets, keySyncs and keyInputs hold one entry
+    #       per keyframe in file order. duration is the last record's ms.
+    # =====================================================================
+    def buildIndex(self) -> None:
+        self.keyTimes = []      # ms, never decreasing, so bisect finds the keyframe before a moment
+        self.keyOffsets = []    # where the record after each keyframe starts
+        self.keySyncs = []
+        self.keyInputs = []     # the inputs held when each keyframe was taken, keyframes leave them out
+        self.duration = 0
+        self.records = 0
+        held = {'left': "", 'right': ""}
+        data = self.data
+        for offset, recordType, millis, bodyStart, bodyEnd in iterRecords(data):
+            self.records += 1
+            self.duration = millis
+            if recordType == REC_KEYFRAME:
+                self.keyTimes.append(millis)
+                self.keyOffsets.append(bodyEnd)
+                self.keySyncs.append(int.from_bytes(data[bodyStart + SYNC_OFFSET:bodyEnd], "big"))
+                self.keyInputs.append(dict(held))
+            elif recordType == REC_INPUT and self.authoritative:
+                record = decodeRecord(data, recordType, bodyStart, bodyEnd)
+                held[record['role']] = record['input']
+            elif recordType == REC_EVENT and decodeRecord(data, recordType, bodyStart, bodyEnd).get('rematch'):
+                held = {'left': "", 'right': ""}
+        if not self.keyTimes:
+            raise ValueError("recording has no keyframe")
+
+    # the index of the last keyframe at or before millis, the first one before it starts
+    def keyframeBefore(self, millis: int) -> int:
+        return max(bisect.bisect_right(self.keyTimes, millis) - 1, 0)
+
+    def loadKeyframe(self, index: int) -> None:
+        offset = self.keyOffsets[index]
+        values = dict(zip(KEYFRAME_FIELDS, KEYFRAME_BODY.unpack_from(self.data, offset - KEYFRAME_BODY.size)))
+        state = GameState(self.header['width'], self.header['height'])
+        for name, value in values.items():
+            setattr(state, name, value)
+        self.state = state
+        self.time = self.keyTimes[index]
+        self.keyIndex = index
+        self.cursor = offset
+        self.inputs = dict(self.keyInputs[index])
+
+    # =====================================================================
+    # Purpose: The tick an authoritative match had reached at millis.
+    # Pre:  index is keyframeBefore(millis).
+    # Post: Returns a sync between the keyframes either side, in step
+    #       with the time between them, so the countdown and a finished
+    #       match (when the server does not tick) come out right.
+    # =====================================================================
+    def syncAt(self, index: int, millis: int) -> int:
+        startTime, startSync = self.keyTimes[index], self.keySyncs[index]
+        if millis <= startTime:
+            return startSync
+        if index + 1 < len(self.keyTimes) and self.keySyncs[index + 1] >= startSync:
+            endTime, endSync = self.keyTimes[index + 1], self.keySyncs[index + 1]
+            if endTime <= startTime:
+                return endSync
+            return startSync + (endSync - startSync) * (millis - startTime) // (endTime - startTime)
+        # the last keyframe of the file or of a match, carry on at the tick rate
+        return startSync + (millis - startTime) * self.tickRate // 1000
+
+    # =====================================================================
+    # Purpose: Rebuild the game as it was at millis into the recording.
+    # Pre:  millis is any time, it is clamped to the recording.
+    # Post: Returns the GameState, which is replay's own and is changed by
+    #       the next seek. Moving forward within a keyframe's second goes
+    #       on from the last seek, anything else starts from the keyframe
+    #       found by binary search.
+    # =====================================================================
+    def seek(self, millis: int) -> GameState:
+        millis = min(max(int(millis), 0), self.duration)
+        index = self.keyframeBefore(millis)
+        if index != self.keyIndex or millis < self.time:
+            self.loadKeyframe(index)
+        if self.authoritative:
+            self.simulateTo(self.syncAt(index, millis), millis)
+        else:
+            self.relayTo(millis)
+        self.time = millis
+        return self.state
+
+    # re-run the simulation up to sync target from the inputs, which carry the sync they took effect after
+    def simulateTo(self, target: int, millis: int) -> None:
+        state, inputs, data = self.state, self.inputs, self.data
+        for offset, recordType, recordTime, bodyStart, bodyEnd in iterRecords(data, self.cursor):
+            if recordType == REC_INPUT:
+                record = decodeRecord(data, recordType, bodyStart, bodyEnd)
+                if record['sync'] >= target:
+                    break
+                while state.sync < record['sync']:
+                    self.advance(state, inputs)
+                inputs[record['role']] = record['input']
+            elif recordType == REC_KEYFRAME or recordTime > millis:
+                break
+            self.cursor = bodyEnd
+        # the server stops ticking once a match is over, only the paddles could still move
+        while state.sync < target and not isOver(state):
+            self.advance(state, inputs)
+
+    # apply the players' state messages, the newest sync deciding the ball and score as watchGame does
+    def relayTo(self, millis: int) -> None:
+        state, data = self.state, self.data
+        for offset, recordType, recordTime, bodyStart, bodyEnd in iterRecords(data, self.cursor):
+            if recordTime > millis:
+                break
+            if recordType == REC_STATE:
+                record = decodeRecord(data, recordType, bodyStart, bodyEnd)
+                setattr(state, record['role'] + 'Y', record['paddleY'])
+                if record['sync'] > state.sync:
+                    state.ballX, state.ballY = record['ballX'], record['ballY']
+                    state.lScore, state.rScore, state.sync = record['lScore'], record['rScore'], record['sync']
+            elif recordType == REC_EVENT and decodeRecord(data, recordType, bodyStart, bodyEnd).get('rematch'):
+                self.state = state = GameState(self.header['width'], self.header['height'])
+            self.cursor = bodyEnd
+
+
+# =====================================================================
+# Purpose: Notice what happened between two states of a match that are a
+#          tick or so apart: points, paddle hits and wall bounces.
+#          Works from positions alone, so relayed recordings (which have
+#          no ball velocity) are read the same way as simulated ones. The
+#          players of a relayed match can disagree about the ball, so it
+#          only counts turns that happen next to a paddle or a wall.
+# Pre:  None.
+# Post: Creates a tracker that has seen nothing yet.
+# =====================================================================
+class MatchEvents:
+    def __init__(self) -> None:
+        self.points = 0
+        self.hits = 0
+        self.bounces = 0
+        self.longestRally = 0
+        self.rally = 0
+        self.results = []       # (lScore, rScore) of each finished match
+        self.forget()
+
+    # the next state is not a tick after the last, e.g. after a seek
+    def forget(self) -> None:
+        self.last = None
+        self.moveX = self.moveY = 0
+
+    # =====================================================================
+    # Purpose: Compare the next state with the one before it.
+    # Pre:  state is the next GameState to look at.
+    # Post: Returns the set of 'point', 'hit' and 'bounce' that happened
+    #       in between, and counts them.
+    # =====================================================================
+    def observe(self, state: GameState) -> set:
+        happened = set()
+        last = self.last
+        self.last = (state.ballX, state.ballY, state.lScore, state.rScore)
+        if last is None:
+            return happened
+        lastX, lastY, lScore, rScore = last
+        if (state.lScore, state.rScore) != (lScore, rScore):
+            if state.lScore + state.rScore < lScore + rScore:
+                if max(lScore, rScore) >= WIN_SCORE:
+                    self.results.append((lScore, rScore))     # a rematch started over
+            else:
+                happened.add('point')
+                self.points += 1
+            self.rally = 0
+            self.moveX = self.moveY = 0
+            return happened
+        moveX, moveY = state.ballX - lastX, state.ballY - lastY
+        if moveX:
+            nearPaddle = (state.ballX <= state.leftX + PADDLE_WIDTH + NEAR or
+                          state.ballX + BALL_SIZE >= state.rightX - NEAR)
+            if self.moveX and (moveX > 0) != (self.moveX > 0) and nearPaddle:
+                happened.add('hit')
+                self.hits += 1
+                self.rally += 1
+                self.longestRally = max(self.longestRally, self.rally)
+            self.moveX = moveX
+        if moveY:
+            nearWall = (state.ballY <= WALL_HEIGHT + NEAR or
+                        state.ballY + BALL_SIZE >= state.height - WALL_HEIGHT - NEAR)
+            if self.moveY and (moveY > 0) != (self.moveY > 0) and nearWall and 'hit' not in happened:
+                happened.add('bounce')
+                self.bounces += 1
+            self.moveY = moveY
+        return happened
+
+
+# =====================================================================
+# Purpose: Play a whole recording without a window, a tick at a time,
+#          and report what happened and how fast it could be played.
+# Pre:  path is a recording file.
+# Post: Returns the report as a dict.
+# =====================================================================
+def replayStats(path: str) -> dict:
+    started = time.perf_counter()
+    with Replay(path) as replay:
+        events = MatchEvents()
+        tick = 1000 / replay.tickRate
+        frames = 0
+        state = None
+        millis = 0.0
+        while millis <= replay.duration:
+            state = replay.seek(millis)
+            events.observe(state)
+            frames += 1
+            millis += tick
+        if state is not None and isOver(state):
+            events.results.append((state.lScore, state.rScore))
+        elapsed = time.perf_counter() - started
+        return {
+            'path': path,
+            **replay.header,
+            'bytes': len(replay.data),
+            'records': replay.records,
+            'keyframes': len(replay.keyTimes),
+            'seconds': round(replay.duration / 1000, 1),
+            'bytesPerSec': round(len(replay.data) / max(replay.duration / 1000, 1e-3)),
+            'frames': frames,
+            'points': events.points,
+            'hits': events.hits,
+            'bounces': events.bounces,
+            'longestRally': events.longestRally,
+            'matches': [f"{lScore}-{rScore}" for lScore, rScore in events.results],
+            'finalScore': f"{state.lScore}-{state.rScore}" if state is not None else None,
+            'framesPerSec': round(frames / max(elapsed, 1e-9)),
+        }
+
+
+# =====================================================================
+# Purpose: Summarise one recording from its headers, its keyframes and
+#          its events, without decoding its inputs or states.
+# Pre:  path is a file, not necessarily a recording.
+# Post: Returns a dict. A file that is not a readable recording gets an
+#       'error' entry instead of the summary.
+# =====================================================================
+def scanRecording(path: str) -> dict:
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return {'path': path, 'error': "empty file"}
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except OSError as error:
+        return {'path': path, 'error': str(error)}
+    try:
+        summary = {'path': path, **readHeader(data), 'bytes': size}
+        counts = dict.fromkeys([REC_KEYFRAME, REC_INPUT, REC_STATE, REC_EVENT], 0)
+        millis, lastKeyframe, rematches, ended = 0, None, 0, False
+        for offset, recordType, millis, bodyStart, bodyEnd in iterRecords(data):
+            counts[recordType] = counts.get(recordType, 0) + 1
+            if recordType == REC_KEYFRAME:
+                lastKeyframe = bodyStart
+            elif recordType == REC_EVENT:
+                event = decodeRecord(data, recordType, bodyStart, bodyEnd)
+                rematches += bool(event.get('rematch'))
+                ended = ended or bool(event.get('end'))
+        summary.update({
+            'seconds': round(millis / 1000, 1),
+            'keyframes': counts[REC_KEYFRAME],
+            'inputs': counts[REC_INPUT],
+            'states': counts[REC_STATE],
+            'rematches': rematches,
+            'complete': ended,      # the server closed it, rather than stopping or still writing
+        })
+        if lastKeyframe is not None:
+            values = dict(zip(KEYFRAME_FIELDS, KEYFRAME_BODY.unpack_from(data, lastKeyframe)))
+            summary['lastScore'] = f"{values['lScore']}-{values['rScore']}"
+        return summary
+    except ValueError as error:
+        return {'path': path, 'error': str(error)}
+    finally:
+        data.close()
+
+
+# =====================================================================
+# Purpose: Summarise every recording in a directory, however many there
+#          are and however big they are.
+# Pre:  directory exists.
+# Post: Yields one scanRecording summary per recording, by file name.
+#       Only one file is mapped at a time.
+# =====================================================================
+def scanArchive(directory: str):
+    names = sorted(entry.name for entry in os.scandir(directory)
+                   if entry.is_file() and entry.name.endswith(RECORDING_SUFFIX))
+    for name in names:
+        yield scanRecording(os.path.join(directory, name))
@@ -0,0 +1,289 @@
+# =================================================================================================
+# Purpose:                  Counters and histograms for pongServer, and the ways to read them
+# Misc:                     The server only creates a ServerMetrics when --stats-port or
+#                           --stats-interval is given, and skips every measurement otherwise, so
+#                           metrics cost nothing unless asked for. StatsEndpoint answers plain HTTP
+#                           GETs: / in the Prometheus text format, /json as one JSON object. In the
+#                           event loop server its sockets are non-blocking and share the server's
+#                           selector, so a slow or idle reader never holds up a match.
+# =================================================================================================
+
+import bisect
+import json
+import re
+import selectors
+import socket
+import time
+
+LATENCY_BOUNDS = [2**i for i in range(21)]              # microseconds, 1 us up to about 1 s
+QUEUE_BOUNDS = [0] + [2**i for i in range(6, 21)]       # bytes, nothing queued up to 1 MB
+REQUEST_TIMEOUT = 0.2   # seconds a stats request may take to arrive before it is answered anyway
+RESPONSE_TIMEOUT = 5.0  # seconds a reader has to take the response before it is hung up on
+REQUEST_SIZE = 4096     # bytes of a request read at most, only its first line is looked at
+METRIC_PREFIX = "pong_"
+
+# everything counted since the server started
+COUNTERS = [
+    'connectionsAccepted',
+    'connectionsClosed',
+    'messagesIn',       # frames and datagrams decoded from clients
+    'bytesIn',
+    'messagesOut',      # messages queued or sent to clients, once per recipient
+    'bytesOut',         # bytes the kernel accepted, TCP and UDP
+    'relayed',          # player updates forwarded to the rest of their room
+    'matchesStarted',
+    'rematches',
+    'coalesced',        # state messages replaced by a newer one before they were sent
+    'evictions',
+    'resyncs',          # lockstep clients sent the whole state after their hash stopped matching
+]
+
+
+# =====================================================================
+# Purpose: Count observations into fixed buckets, so recording a value
+#          is cheap and memory does not grow with traffic.
+# Pre:  bounds are the buckets' upper edges in increasing order.
+# Post: Creates an empty histogram. Values above the last bound land in
+#       an overflow bucket.
+# =====================================================================
+class Histogram:
+    def __init__(self, bounds: list) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def observe(self, value) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    # the upper edge of the bucket holding the given share of observations
+    def percentile(self, share: float):
+        if not self.count:
+            return None
+        rank = share * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            'count': self.count,
+            'mean': round(self.total / self.count, 1) if self.count else None,
+            'p50': self.percentile(0.5),
+            'p99': self.percentile(0.99),
+            'max': self.max,
+        }
+
+
+# =====================================================================
+# Purpose: Everything the server measures about itself.
+# Pre:  gauges, if given, returns a dict of values that are read rather
+#       than counted, like how many clients are connected right now.
+# Post: Creates zeroed counters and empty histograms.
+# =====================================================================
+class ServerMetrics:
+    def __init__(self, gauges=None, labels: dict = None) -> None:
+        self.gauges = gauges or dict
+        self.labels = labels or {}      # added to every reading, e.g. which worker it came from
+        self.started = time.monotonic()
+        for name in COUNTERS:
+            setattr(self, name, 0)
+        self.relayLatency = Histogram(LATENCY_BOUNDS)   # us from reading an update to handing it to every recipient
+        self.queueDepth = Histogram(QUEUE_BOUNDS)       # bytes a recipient had waiting when a message was queued for it
+        self.clientRtt = Histogram(LATENCY_BOUNDS)      # us, round trip times the clients report in their pings
+        self.lastLog = self.started
+        self.lastCounts = dict.fromkeys(COUNTERS, 0)
+
+    def histograms(self) -> dict:
+        return {'relayLatencyUs': self.relayLatency, 'queueDepthBytes': self.queueDepth, 'clientRttUs': self.clientRtt}
+
+    def snapshot(self) -> dict:
+        return {
+            **self.labels,
+            'uptime': round(time.monotonic() - self.started, 1),
+            **{name: getattr(self, name) for name in COUNTERS},
+            **self.gauges(),
+            **{name: histogram.summary() for name, histogram in self.histograms().items()},
+        }
+
+    # =====================================================================
+    # Purpose: One structured log line, with rates over the time since
+    #          the previous line.
+    # Pre:  None.
+    # Post: Returns the line as JSON and starts the next interval.
+    # =====================================================================
+    def logLine(self) -> str:
+        now = time.monotonic()
+        elapsed = max(now - self.lastLog, 1e-9)
+        reading = self.snapshot()
+        for name in ['messagesIn', 'bytesIn', 'messagesOut', 'bytesOut', 'relayed']:
+            reading[name + 'PerSec'] = round((reading[name] - self.lastCounts[name]) / elapsed, 1)
+        self.lastLog = now
+        self.lastCounts = {name: reading[name] for name in COUNTERS}
+        return json.dumps(reading)
+
+    # the Prometheus text format, so any scraper can collect the server
+    def render(self) -> str:
+        lines = [self.sample("uptime_seconds", f"{time.monotonic() - self.started:.1f}")]
+        for name in COUNTERS:
+            lines.append(self.sample(snakeCase(name) + "_total", getattr(self, name)))
+        for name, value in self.gauges().items():
+            lines.append(self.sample(snakeCase(name), value))
+        for name, histogram in self.histograms().items():
+            metric = snakeCase(name)
+            cumulative = 0
+            for bound, count in zip(histogram.bounds, histogram.counts):
+                cumulative += count
+                lines.append(self.sample(metric + "_bucket", cumulative, le=bound))
+            lines.append(self.sample(metric + "_bucket", histogram.count, le="+Inf"))
+            lines.append(self.sample(metric + "_sum", histogram.total))
+            lines.append(self.sample(metric + "_count", histogram.count))
+        return "\n".join(lines) + "\n"
+
+    # one line of the text format, with this server's labels and any extra ones
+    def sample(self, name: str, value, **extra) -> str:
+        labels = ",".join(f'{key}="{label}"' for key, label in {**self.labels, **extra}.items())
+        return f"{METRIC_PREFIX}{name}{{{labels}}} {value}" if labels else f"{METRIC_PREFIX}{name} {value}"
+
+
+# relayLatencyUs -> relay_latency_us
+def snakeCase(name: str) -> str:
+    return re.sub(r"(?<!^)(?=[A-Z])", "_", name).lower()
+
+
+# one connection to the stats endpoint, read and answered a piece at a time from the event loop
+class StatsRequest:
+    def __init__(self, sock: socket.socket) -> None:
+        self.sock = sock
+        self.received = bytearray()
+        self.response = None        # bytes still to send, once the request has been answered
+        self.deadline = time.monotonic() + REQUEST_TIMEOUT
+
+
+# =====================================================================
+# Purpose: A tiny HTTP listener that reports a ServerMetrics. The event
+#          loop server passes its selector, registers sock and calls
+#          accept when it is readable and service for each StatsRequest
+#          the selector returns; the threaded server runs serveForever
+#          on a thread of its own.
+# Pre:  host and port are where to listen, meant to be local.
+# Post: Binds and listens. Each request gets one response and the
+#       connection is closed.
+# =====================================================================
+class StatsEndpoint:
+    def __init__(self, metrics: ServerMetrics, host: str, port: int, selector: selectors.BaseSelector = None) -> None:
+        self.metrics = metrics
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen()
+        self.selector = selector
+        self.requests = []          # open StatsRequests, only with a selector
+        if selector is not None:
+            self.sock.setblocking(False)
+
+    def serveForever(self) -> None:
+        while True:
+            self.handle()
+
+    # the whole response to a request's first line
+    def answer(self, line: bytes) -> bytes:
+        request = line.split()
+        path = request[1].decode(errors="replace") if len(request) > 1 else "/"
+        if path.startswith("/json"):
+            body, kind = json.dumps(self.metrics.snapshot()), "application/json"
+        else:
+            body, kind = self.metrics.render(), "text/plain; version=0.0.4"
+        body = body.encode()
+        head = f"HTTP/1.0 200 OK\r\nContent-Type: {kind}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n"
+        return head.encode() + body
+
+    # answer one connection, blocking, for serveForever
+    def handle(self) -> None:
+        try:
+            conn, _ = self.sock.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        with conn:
+            conn.settimeout(REQUEST_TIMEOUT)
+            try:
+                line = conn.recv(REQUEST_SIZE).split(b"\r\n", 1)[0]
+            except OSError:
+                line = b""
+            try:
+                conn.sendall(self.answer(line))
+            except OSError:
+                pass
+
+    # take a new connection without waiting for its request
+    def accept(self) -> None:
+        try:
+            conn, _ = self.sock.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        conn.setblocking(False)
+        request = StatsRequest(conn)
+        self.requests.append(request)
+        self.selector.register(conn, selectors.EVENT_READ, request)
+
+    # read what the request's socket has, or send what it will take
+    def service(self, request: StatsRequest, events: int) -> None:
+        if request.response is None and events & selectors.EVENT_READ:
+            try:
+                data = request.sock.recv(REQUEST_SIZE)
+            except BlockingIOError:
+                return
+            except OSError:
+                data = b""
+            request.received += data
+            # answered once the first line is in, or when no more of it will come
+            if not data or b"\r\n" in request.received or len(request.received) >= REQUEST_SIZE:
+                self.respond(request)
+        elif request.response is not None and events & selectors.EVENT_WRITE:
+            self.write(request)
+
+    def respond(self, request: StatsRequest) -> None:
+        request.response = self.answer(bytes(request.received).split(b"\r\n", 1)[0])
+        request.deadline = time.monotonic() + RESPONSE_TIMEOUT
+        self.selector.modify(request.sock, selectors.EVENT_WRITE, request)
+        self.write(request)
+
+    def write(self, request: StatsRequest) -> None:
+        try:
+            sent = request.sock.send(request.response)
+        except BlockingIOError:
+            return
+        except OSError:
+            self.close(request)
+            return
+        request.response = request.response[sent:]
+        if not request.response:
+            self.close(request)
+
+    def close(self, request: StatsRequest) -> None:
+        self.requests.remove(request)
+        self.selector.unregister(request.sock)
+        request.sock.close()
+
+    # answer requests that stopped arriving with what came, and drop readers that stopped reading
+    def expire(self) -> None:
+        now = time.monotonic()
+        for request in [request for request in self.requests if request.deadline <= now]:
+            if request.response is None:
+                self.respond(request)
+            else:
+                self.close(request)
+
+    # seconds until expire has something to do, None when nothing is open
+    def untilDeadline(self):
+        if not self.requests:
+            return None
+        return max(0.0, min(request.deadline for request in self.requests) - time.monotonic())
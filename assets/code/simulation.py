@@ -0,0 +1,244 @@
+# =================================================================================================
+# Purpose:                  The rules of the game with no pygame, display or sound involved
+# Misc:                     Reproduces exactly what Ball, Paddle and pygame.Rect did in playGame,
+#                           including integer positions and the order of the checks, so the
+#                           clients, the authoritative server, bots, tests and benchmarks all play
+#                           the same game and can run it as fast as the CPU allows. Only integer
+#                           arithmetic is used, so every machine that runs the same ticks with the
+#                           same inputs ends up with exactly the same state, which stateHash checks.
+# =================================================================================================
+
+import struct
+import zlib
+
+PADDLE_WIDTH = 10
+PADDLE_HEIGHT = 50
+PADDLE_SPEED = 5
+BALL_SIZE = 5
+BALL_SPEED = 5
+WALL_HEIGHT = 10
+WIN_SCORE = 5
+TICK_RATE = 60      # ticks a second the speeds above are per tick at, what sweep keeps the game's pace to
+DIRECTIONS = {'up': -1, 'down': 1}
+
+HASHED_FIELDS = struct.Struct("!9i")    # ballX ballY ballVX ballVY leftY rightY lScore rScore sync
+
+
+# =====================================================================
+# Purpose: Everything needed to carry on a match from one tick to the
+#          next.
+# Pre:  width and height are the screen size sent to the clients.
+# Post: Creates a match at its starting positions with the ball heading
+#       left and nobody scored.
+# =====================================================================
+class GameState:
+    __slots__ = ('width', 'height', 'ballX', 'ballY', 'ballVX', 'ballVY', 'leftY', 'rightY',
+                 'lScore', 'rScore', 'sync', 'bounced')
+
+    def __init__(self, width: int = 640, height: int = 480) -> None:
+        self.width = width
+        self.height = height
+        self.lScore = 0
+        self.rScore = 0
+        self.sync = 0
+        self.bounced = False    # whether the ball bounced during the last tick
+        self.leftY = self.rightY = paddleStartY(height)
+        resetBall(self, "left")
+
+    def copy(self) -> "GameState":
+        state = GameState.__new__(GameState)
+        for name in GameState.__slots__:
+            setattr(state, name, getattr(self, name))
+        return state
+
+    @property
+    def leftX(self) -> int:
+        return 10
+
+    @property
+    def rightX(self) -> int:
+        return self.width - 20
+
+
+# the y both paddles start at, where pygame.Rect truncated (height/2)-(PADDLE_HEIGHT/2) to
+def paddleStartY(height: int) -> int:
+    return height//2 - PADDLE_HEIGHT//2
+
+
+# a checksum of everything that decides the rest of the match, equal on every machine with the same state
+def stateHash(state: GameState) -> int:
+    return zlib.crc32(HASHED_FIELDS.pack(state.ballX, state.ballY, state.ballVX, state.ballVY, state.leftY,
+                                         state.rightY, state.lScore, state.rScore, state.sync))
+
+
+def isOver(state: GameState) -> bool:
+    return state.lScore >= WIN_SCORE or state.rScore >= WIN_SCORE
+
+
+# put the ball back in the middle, nowGoing is the direction it should be going after the reset
+def resetBall(state: GameState, nowGoing: str) -> None:
+    state.ballX = state.width//2
+    state.ballY = state.height//2
+    state.ballVX = -BALL_SPEED if nowGoing == "left" else BALL_SPEED
+    state.ballVY = 0
+
+
+# start a new match in place, for a rematch
+def restart(state: GameState) -> None:
+    state.lScore = 0
+    state.rScore = 0
+    state.sync = 0
+    state.bounced = False
+    state.leftY = state.rightY = paddleStartY(state.height)
+    resetBall(state, "left")
+
+
+# pygame.Rect.colliderect for two rectangles given as x, y, width, height
+def collides(ax: int, ay: int, aw: int, ah: int, bx: int, by: int, bw: int, bh: int) -> bool:
+    return ax < bx + bw and bx < ax + aw and ay < by + bh and by < ay + ah
+
+
+# where a paddle at y ends up after one tick of moving "up", "down" or ""
+def movePaddle(y: int, moving: str, height: int) -> int:
+    if moving == "down":
+        if y + PADDLE_HEIGHT < height-10:
+            return y + PADDLE_SPEED
+    elif moving == "up":
+        if y > 10:
+            return y - PADDLE_SPEED
+    return y
+
+
+# =====================================================================
+# Purpose: Advance a match by one tick in place. Paddles move first, then
+#          the ball moves, scores, and bounces off a paddle and the walls,
+#          the same order playGame has always used.
+# Pre:  inputs maps 'left' and 'right' to "up", "down" or "". A missing
+#       side is not moving.
+# Post: state is one tick later and its sync one higher. The ball does not
+#       move once the match is over.
+# =====================================================================
+def advance(state: GameState, inputs: dict) -> None:
+    height = state.height
+    state.bounced = False
+    state.leftY = movePaddle(state.leftY, inputs.get('left', ""), height)
+    state.rightY = movePaddle(state.rightY, inputs.get('right', ""), height)
+
+    if not isOver(state):
+        state.ballX += state.ballVX
+        state.ballY += state.ballVY
+
+        if state.ballX > state.width:
+            state.lScore += 1
+            resetBall(state, "left")
+        elif state.ballX < 0:
+            state.rScore += 1
+            resetBall(state, "right")
+
+        for paddleX, paddleY in [(state.leftX, state.leftY), (state.rightX, state.rightY)]:
+            if collides(state.ballX, state.ballY, BALL_SIZE, BALL_SIZE, paddleX, paddleY, PADDLE_WIDTH, PADDLE_HEIGHT):
+                state.bounced = True
+                state.ballVX *= -1
+                state.ballVY = ((state.ballY + BALL_SIZE//2) - (paddleY + PADDLE_HEIGHT//2))//2
+                break
+
+        wallWidth = state.width + 20
+        if (collides(state.ballX, state.ballY, BALL_SIZE, BALL_SIZE, -10, 0, wallWidth, WALL_HEIGHT) or
+                collides(state.ballX, state.ballY, BALL_SIZE, BALL_SIZE, -10, height-WALL_HEIGHT, wallWidth, WALL_HEIGHT)):
+            state.bounced = True
+            state.ballVY *= -1
+    state.sync += 1
+
+
+# =====================================================================
+# Purpose: The pure form of advance, for callers that keep old states.
+# Pre:  As for advance.
+# Post: Returns the state one tick later. state itself is not changed.
+# =====================================================================
+def step(state: GameState, inputs: dict) -> GameState:
+    state = state.copy()
+    advance(state, inputs)
+    return state
+
+
+# where a paddle at y ends up after moving distance pixels (negative is up), stopping at the walls like movePaddle
+def slidePaddle(y: int, distance: int, height: int) -> int:
+    if distance > 0:
+        return max(y, min(y + distance, height - WALL_HEIGHT - PADDLE_HEIGHT))
+    if distance < 0:
+        return min(y, max(y + distance, WALL_HEIGHT))
+    return y
+
+
+# move the ball distance pixels along x, and as far along y as that takes, reflected off the walls on the way
+def moveBall(state: GameState, distance: int, speed: int) -> None:
+    state.ballX += distance if state.ballVX > 0 else -distance
+    top = WALL_HEIGHT
+    span = state.height - WALL_HEIGHT - BALL_SIZE - top
+    bounces, offset = divmod(state.ballY + state.ballVY * distance // speed - top, span)
+    if bounces % 2:
+        state.ballY = top + span - offset
+        state.ballVY *= -1
+    else:
+        state.ballY = top + offset
+    if bounces:
+        state.bounced = True
+
+
+# =====================================================================
+# Purpose: Advance a match by several ticks at once, moving the ball
+#          continuously rather than a tick at a time: it scores, and
+#          bounces off a paddle's face or a wall, at the moment it gets
+#          there, so however far it moves in one call it can never pass
+#          through a paddle or a wall.
+# Pre:  As for advance. inputs hold for all of the ticks.
+# Post: state is ticks ticks later and its sync that much higher. Only
+#       integers are used, and while the ball's x stays a whole number of
+#       ball steps from the paddles (always, on the standard field) one
+#       call for several ticks ends in exactly the state one call per
+#       tick would, so a lower tick rate plays the same game.
+# =====================================================================
+def sweep(state: GameState, inputs: dict, ticks: int = 1) -> None:
+    height = state.height
+    state.bounced = False
+    moves = {role: DIRECTIONS.get(inputs.get(role, ""), 0) * PADDLE_SPEED for role in ('left', 'right')}
+    leftFrom, rightFrom = state.leftY, state.rightY
+    state.leftY = slidePaddle(leftFrom, moves['left'] * ticks, height)
+    state.rightY = slidePaddle(rightFrom, moves['right'] * ticks, height)
+
+    speed = abs(state.ballVX)
+    travel = speed * ticks      # how far the ball goes along x, which is also how time is measured here
+    moved = 0
+    while not isOver(state):
+        # the first of the paddle face it is heading for, if it is not past it yet, and the goal line
+        if state.ballVX < 0:
+            faceX, paddleFrom, paddleMove = state.leftX + PADDLE_WIDTH, leftFrom, moves['left']
+            toFace = state.ballX - faceX if state.ballX > faceX else None
+            toGoal = max(state.ballX + BALL_SIZE, 0)
+        else:
+            faceX, paddleFrom, paddleMove = state.rightX - BALL_SIZE, rightFrom, moves['right']
+            toFace = faceX - state.ballX if state.ballX < faceX else None
+            toGoal = max(state.width + BALL_SIZE - state.ballX, 0)
+        hitsFace = toFace is not None and toFace <= toGoal
+        distance = toFace if hitsFace else toGoal
+        if distance > travel - moved:
+            moveBall(state, travel - moved, speed)
+            break
+        moveBall(state, distance, speed)
+        moved += distance
+
+        if not hitsFace:
+            if state.ballVX > 0:
+                state.lScore += 1
+                resetBall(state, "left")
+            else:
+                state.rScore += 1
+                resetBall(state, "right")
+            continue
+        # the paddle is where it had got to by now, a ball that misses it carries on towards the goal
+        paddleY = slidePaddle(paddleFrom, paddleMove * moved // speed, height)
+        if state.ballY < paddleY + PADDLE_HEIGHT and paddleY < state.ballY + BALL_SIZE:
+            state.bounced = True
+            state.ballVX *= -1
+            state.ballVY = ((state.ballY + BALL_SIZE//2) - (paddleY + PADDLE_HEIGHT//2))//2
+    state.sync += ticks
@@ -0,0 +1,61 @@
+# =================================================================================================
+# Purpose:                  Run the game at a fixed tick rate whatever rate it is drawn at
+# Misc:                     FixedTimestep turns the time since it was last asked into whole ticks to
+#                           simulate and carries the remainder over, so a slow frame runs two ticks
+#                           next time instead of slowing the game down, and a fast one runs none.
+#                           alpha is how far the clock is into the next tick, for drawing between
+#                           the last two. Does not import pygame.
+# =================================================================================================
+
+import time
+
+MAX_STEPS = 5       # ticks one call runs at most, time further behind than that is dropped
+
+
+# =====================================================================
+# Purpose: Count the fixed-length ticks that are due.
+# Pre:  rate is the ticks per second.
+# Post: Creates a clock that starts counting at the first call to due.
+# =====================================================================
+class FixedTimestep:
+    def __init__(self, rate: float, maxSteps: int = MAX_STEPS) -> None:
+        self.interval = 1 / rate
+        self.maxSteps = maxSteps
+        self.accumulated = 0.0      # seconds not yet simulated
+        self.last = None
+        self.dropped = 0            # ticks skipped for falling too far behind
+
+    def reset(self) -> None:
+        self.accumulated = 0.0
+        self.last = None
+
+    # the ticks to run now, at most maxSteps so a long stall does not freeze the game catching up
+    def due(self, now: float = None) -> int:
+        now = time.monotonic() if now is None else now
+        if self.last is not None:
+            self.accumulated += now - self.last
+        self.last = now
+        steps = int(self.accumulated / self.interval)
+        if steps > self.maxSteps:
+            self.dropped += steps - self.maxSteps
+            steps = self.maxSteps
+            self.accumulated = steps * self.interval + self.accumulated % self.interval
+        self.accumulated -= steps * self.interval
+        return steps
+
+    # count ticks the game jumped ahead by as already run, so adopting a peer's newer state does not
+    # speed the game up; at most one tick is paid back, so catching up on a real lag never stalls
+    def skip(self, ticks: int) -> None:
+        self.accumulated = max(self.accumulated - ticks * self.interval, -self.interval)
+
+    # share of the next tick that has already passed, from 0 to 1
+    @property
+    def alpha(self) -> float:
+        return min(max(self.accumulated / self.interval, 0.0), 1.0)
+
+
+# ticks between state messages for a send rate, the tick rate itself if sendRate is not lower
+def ticksPerSend(tickRate: float, sendRate: float = None) -> int:
+    if not sendRate or sendRate >= tickRate:
+        return 1
+    return max(1, round(tickRate / sendRate))
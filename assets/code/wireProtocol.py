@@ -0,0 +1,495 @@
+# =================================================================================================
+# Purpose:                  Encode and decode the messages sent between pongClient and pongServer
+# Misc:                     Three formats are supported. "json" is the original newline-delimited
+#                           JSON. "bin1" is a length-prefixed binary format with a fixed layout for
+#                           the messages sent every frame; anything else is carried as JSON inside
+#                           a control frame. "bin2" is bin1 plus delta frames, which carry a state
+#                           as the changes from the previous state of the same stream (a player's
+#                           updates, or a server's snapshots). The format is picked during the join
+#                           handshake.
+# =================================================================================================
+
+import json
+import struct
+import socket
+import time
+
+PROTOCOL_JSON = "json"
+PROTOCOL_BINARY = "bin1"
+PROTOCOL_DELTA = "bin2"
+SUPPORTED_PROTOCOLS = [PROTOCOL_DELTA, PROTOCOL_BINARY, PROTOCOL_JSON]     # most preferred first
+BINARY_PROTOCOLS = frozenset([PROTOCOL_BINARY, PROTOCOL_DELTA])         # framed with HEADER
+
+# Every binary frame starts with this header:
+#   length   u16   number of bytes that follow the length field
+#   version  u8    BINARY_VERSION
+#   type     u8    one of the MSG_ values below
+HEADER = struct.Struct("!HBB")
+BINARY_VERSION = 1
+MAX_FRAME_SIZE = 65536      # larger frames are dropped rather than buffered
+
+MSG_STATE = 1       # a player's view of the game, relayed to the rest of the room
+MSG_INPUT = 2       # a player's paddle input, sent to an authoritative server
+MSG_SNAPSHOT = 3    # the full game from an authoritative server
+MSG_CONTROL = 4     # any other message, as UTF-8 JSON
+MSG_PING = 5        # a client's clock reading, for measuring round trip time
+MSG_PONG = 6        # the server's answer to a ping
+MSG_STATE_DELTA = 7     # bin2: a player's state as the changes from their previous one
+MSG_SNAPSHOT_DELTA = 8  # bin2: a snapshot as the changes from the previous one
+MSG_TURN = 9        # lockstep: the inputs in force from a tick on, from the server
+MSG_HASH = 10       # lockstep: a peer's hash of its game at a tick
+DELTA_TYPES = frozenset([MSG_STATE_DELTA, MSG_SNAPSHOT_DELTA])
+
+STATE_BODY = struct.Struct("!hhhhBBBI")     # ballX ballY paddleX paddleY lScore rScore role sync
+INPUT_BODY = struct.Struct("!BI")           # moving tick
+SNAPSHOT_BODY = struct.Struct("!hhhhBBBIII")    # ballX ballY leftY rightY lScore rScore flags sync leftAck rightAck
+PING_BODY = struct.Struct("!dI")            # ping (client clock, s) rtt (us)
+PONG_BODY = struct.Struct("!d")             # pong (the ping's clock reading)
+TURN_BODY = struct.Struct("!IBB")           # turn (sync) left right
+HASH_BODY = struct.Struct("!II")            # hash sync
+DELTA_HEAD = struct.Struct("!BbH")          # role (or snapshot flags) sync-step, then 2 bits per field:
+DELTA_WIDTHS = [None, struct.Struct("!b"), struct.Struct("!h"), struct.Struct("!i")]   # unchanged, or its change as one of these
+STATE_DELTA_FIELDS = ['ballX', 'ballY', 'paddleX', 'paddleY', 'lScore', 'rScore']
+SNAPSHOT_DELTA_FIELDS = ['ballX', 'ballY', 'leftY', 'rightY', 'lScore', 'rScore', 'leftAck', 'rightAck']
+KEYFRAME_EVERY = 60     # the first state of a stream in every this many ticks is sent whole, so nothing stays wrong for long
+
+STATE_KEYS = frozenset(['ballX', 'ballY', 'paddleX', 'paddleY', 'lScore', 'rScore', 'role', 'sync'])
+SNAPSHOT_KEYS = frozenset(['ballX', 'ballY', 'leftY', 'rightY', 'lScore', 'rScore', 'sync', 'leftAck', 'rightAck'])
+INPUT_KEYS = frozenset(['input', 'tick'])
+PING_KEYS = frozenset(['ping', 'rtt'])
+PONG_KEYS = frozenset(['pong'])
+TURN_KEYS = frozenset(['turn', 'left', 'right'])
+HASH_KEYS = frozenset(['hash', 'sync'])
+BOUNCE_SNAPSHOT_KEYS = SNAPSHOT_KEYS | {'bounce'}
+
+# Every UDP datagram starts with this header, followed by one frame in the agreed protocol:
+#   token    u32   the udpToken the server handed out in the game info
+#   sequence u32   counts up by one per datagram from each sender
+DATAGRAM_HEADER = struct.Struct("!II")
+UDP_HELLO = {'udp': 'hello'}    # sent until the server answers so it learns the client's address
+UDP_HELLO_INTERVAL = 0.5        # seconds between hellos
+
+ROLES = ['left', 'right', 'spectator']
+MOVES = ['', 'up', 'down']
+FLAG_BOUNCE = 1
+
+
+# =====================================================================
+# Purpose: Pick the format to talk in from the ones a client offered.
+# Pre:  offered is the 'protocols' list from a join request, or None for
+#       clients that predate the binary format.
+# Post: Returns the first of SUPPORTED_PROTOCOLS the client offered, or
+#       PROTOCOL_JSON when there is nothing in common.
+# =====================================================================
+def chooseProtocol(offered) -> str:
+    for protocol in SUPPORTED_PROTOCOLS:
+        if offered and protocol in offered:
+            return protocol
+    return PROTOCOL_JSON
+
+
+# =====================================================================
+# Purpose: Turn one message into the bytes to put on the socket.
+# Pre:  msg must be JSON serializable. protocol is PROTOCOL_JSON or
+#       PROTOCOL_BINARY.
+# Post: Returns a complete frame, newline-terminated for JSON or
+#       length-prefixed for binary. Never a delta frame, see encodeDelta.
+# =====================================================================
+def encodeMessage(msg: dict, protocol: str) -> bytes:
+    if protocol not in BINARY_PROTOCOLS:
+        return (json.dumps(msg) + "\n").encode()
+
+    keys = msg.keys()
+    body = None
+    try:
+        if keys == STATE_KEYS and msg['role'] in ROLES:
+            body = STATE_BODY.pack(msg['ballX'], msg['ballY'], msg['paddleX'], msg['paddleY'],
+                                   msg['lScore'], msg['rScore'], ROLES.index(msg['role']), msg['sync'])
+            msgType = MSG_STATE
+        elif keys == SNAPSHOT_KEYS or keys == BOUNCE_SNAPSHOT_KEYS:
+            flags = FLAG_BOUNCE if msg.get('bounce') else 0
+            body = SNAPSHOT_BODY.pack(msg['ballX'], msg['ballY'], msg['leftY'], msg['rightY'],
+                                      msg['lScore'], msg['rScore'], flags, msg['sync'],
+                                      msg['leftAck'], msg['rightAck'])
+            msgType = MSG_SNAPSHOT
+        elif keys == INPUT_KEYS and msg['input'] in MOVES:
+            body = INPUT_BODY.pack(MOVES.index(msg['input']), msg['tick'])
+            msgType = MSG_INPUT
+        elif keys == PING_KEYS:
+            body = PING_BODY.pack(msg['ping'], round(msg['rtt'] * 1000))
+            msgType = MSG_PING
+        elif keys == PONG_KEYS:
+            body = PONG_BODY.pack(msg['pong'])
+            msgType = MSG_PONG
+        elif keys == TURN_KEYS and msg['left'] in MOVES and msg['right'] in MOVES:
+            body = TURN_BODY.pack(msg['turn'], MOVES.index(msg['left']), MOVES.index(msg['right']))
+            msgType = MSG_TURN
+        elif keys == HASH_KEYS:
+            body = HASH_BODY.pack(msg['hash'], msg['sync'])
+            msgType = MSG_HASH
+    except (struct.error, TypeError):
+        body = None     # a value does not fit the fixed layout, send it as JSON instead
+    if body is None:
+        body = json.dumps(msg).encode()
+        msgType = MSG_CONTROL
+    return HEADER.pack(len(body) + 2, BINARY_VERSION, msgType) + body
+
+
+# =====================================================================
+# Purpose: Rebuild the exact bytes a frame from FrameReader was sent as, so
+#          it can be forwarded without decoding and encoding it again.
+# Pre:  frame was produced by FrameReader.nextFrame with the same protocol.
+# Post: Returns the frame ready to be written to a socket.
+# =====================================================================
+def wireBytes(frame: bytes, protocol: str) -> bytes:
+    return frame if protocol in BINARY_PROTOCOLS else frame + b"\n"
+
+
+# which stream a state message belongs to: the sending player's role, or the server's snapshots
+def streamKey(msg: dict):
+    if 'leftY' in msg:
+        return 'snapshot'
+    if 'ballX' in msg:
+        return msg.get('role')
+    return None
+
+
+# whether a frame is a bin2 delta, which only the stream's own reader can decode
+def isDelta(frame: bytes, protocol: str) -> bool:
+    return protocol == PROTOCOL_DELTA and len(frame) >= HEADER.size and frame[3] in DELTA_TYPES
+
+
+# =====================================================================
+# Purpose: Encode a state as the changes from the previous state of the
+#          same stream, for bin2.
+# Pre:  base and msg are state messages (or both snapshots) of one
+#       stream, base sent just before msg to the same recipient.
+# Post: Returns the delta frame, or None when msg should be sent whole:
+#       a keyframe is due, the sync jumped (a rematch), or msg carries
+#       fields the fixed layouts do not have.
+# =====================================================================
+def encodeDelta(base: dict, msg: dict):
+    keys = msg.keys()
+    try:
+        if keys == STATE_KEYS and base.get('role') == msg['role'] and msg['role'] in ROLES:
+            msgType, fields, tag = MSG_STATE_DELTA, STATE_DELTA_FIELDS, ROLES.index(msg['role'])
+        elif keys == SNAPSHOT_KEYS or keys == BOUNCE_SNAPSHOT_KEYS:
+            msgType, fields, tag = MSG_SNAPSHOT_DELTA, SNAPSHOT_DELTA_FIELDS, FLAG_BOUNCE if msg.get('bounce') else 0
+        else:
+            return None
+        step = msg['sync'] - base['sync']
+        if not -128 <= step <= 127 or msg['sync'] // KEYFRAME_EVERY != base['sync'] // KEYFRAME_EVERY:
+            return None
+        mask = 0
+        changes = []
+        for index, name in enumerate(fields):
+            change = msg[name] - base[name]
+            if change:
+                width = 1 if -128 <= change <= 127 else 2 if -32768 <= change <= 32767 else 3
+                mask |= width << (2 * index)
+                changes.append(DELTA_WIDTHS[width].pack(change))
+        body = DELTA_HEAD.pack(tag, step, mask) + b"".join(changes)
+    except (KeyError, TypeError, struct.error):
+        return None
+    return HEADER.pack(len(body) + 2, BINARY_VERSION, msgType) + body
+
+
+# =====================================================================
+# Purpose: Rebuild a state from a delta frame and the state before it.
+# Pre:  frame is a delta frame. base is the stream's previous state.
+# Post: Returns the new state, in the same form decodeFrame gives for a
+#       whole one. Raises struct.error or IndexError if it is malformed.
+# =====================================================================
+def applyDelta(base: dict, frame: bytes) -> dict:
+    tag, step, mask = DELTA_HEAD.unpack_from(frame, HEADER.size)
+    fields = STATE_DELTA_FIELDS if frame[3] == MSG_STATE_DELTA else SNAPSHOT_DELTA_FIELDS
+    msg = {name: base[name] for name in fields}
+    offset = HEADER.size + DELTA_HEAD.size
+    for index, name in enumerate(fields):
+        width = (mask >> (2 * index)) & 3
+        if width:
+            msg[name] += DELTA_WIDTHS[width].unpack_from(frame, offset)[0]
+            offset += DELTA_WIDTHS[width].size
+    msg['sync'] = base['sync'] + step
+    if frame[3] == MSG_STATE_DELTA:
+        msg['role'] = ROLES[tag]
+    elif tag & FLAG_BOUNCE:
+        msg['bounce'] = True
+    return msg
+
+
+# =====================================================================
+# Purpose: Encode everything one sender sends, turning each state into a
+#          delta from the one before it when the format is bin2.
+# Pre:  protocol is the agreed format. Only use it for a stream that
+#       arrives in order and whole, i.e. TCP; UDP datagrams can be lost.
+# Post: Creates an encoder that has sent nothing yet.
+# =====================================================================
+class DeltaEncoder:
+    def __init__(self, protocol: str) -> None:
+        self.protocol = protocol
+        self.last = {}      # stream key -> the last state sent, copied since callers reuse their dicts
+
+    def encode(self, msg: dict) -> bytes:
+        data = None
+        if self.protocol == PROTOCOL_DELTA:
+            key = streamKey(msg)
+            if key is not None:
+                base = self.last.get(key)
+                if base is not None:
+                    data = encodeDelta(base, msg)
+                self.last[key] = dict(msg)
+        return data or encodeMessage(msg, self.protocol)
+
+
+# =====================================================================
+# Purpose: Turn one frame from FrameReader back into a message.
+# Pre:  frame was produced by FrameReader.nextFrame with the same protocol.
+# Post: Returns the message, or None if the frame is empty, malformed,
+#       from an unknown binary version, or a delta (see FrameReader).
+# =====================================================================
+def decodeFrame(frame: bytes, protocol: str):
+    if protocol not in BINARY_PROTOCOLS:
+        if not frame.strip():
+            return None
+        try:
+            msg = json.loads(frame)
+        except ValueError:
+            return None
+        return msg if isinstance(msg, dict) else None
+
+    try:
+        size, version, msgType = HEADER.unpack_from(frame)
+        if version != BINARY_VERSION:
+            return None
+        if msgType == MSG_STATE:
+            ballX, ballY, paddleX, paddleY, lScore, rScore, role, sync = STATE_BODY.unpack_from(frame, HEADER.size)
+            return {'ballX': ballX, 'ballY': ballY, 'paddleX': paddleX, 'paddleY': paddleY,
+                    'lScore': lScore, 'rScore': rScore, 'role': ROLES[role], 'sync': sync}
+        if msgType == MSG_SNAPSHOT:
+            ballX, ballY, leftY, rightY, lScore, rScore, flags, sync, leftAck, rightAck = \
+                SNAPSHOT_BODY.unpack_from(frame, HEADER.size)
+            msg = {'ballX': ballX, 'ballY': ballY, 'leftY': leftY, 'rightY': rightY,
+                   'lScore': lScore, 'rScore': rScore, 'sync': sync, 'leftAck': leftAck, 'rightAck': rightAck}
+            if flags & FLAG_BOUNCE:
+                msg['bounce'] = True
+            return msg
+        if msgType == MSG_INPUT:
+            moving, tick = INPUT_BODY.unpack_from(frame, HEADER.size)
+            return {'input': MOVES[moving], 'tick': tick}
+        if msgType == MSG_PING:
+            sentAt, rtt = PING_BODY.unpack_from(frame, HEADER.size)
+            return {'ping': sentAt, 'rtt': rtt / 1000}
+        if msgType == MSG_PONG:
+            sentAt, = PONG_BODY.unpack_from(frame, HEADER.size)
+            return {'pong': sentAt}
+        if msgType == MSG_TURN:
+            sync, left, right = TURN_BODY.unpack_from(frame, HEADER.size)
+            return {'turn': sync, 'left': MOVES[left], 'right': MOVES[right]}
+        if msgType == MSG_HASH:
+            value, sync = HASH_BODY.unpack_from(frame, HEADER.size)
+            return {'hash': value, 'sync': sync}
+        if msgType == MSG_CONTROL:
+            msg = json.loads(frame[HEADER.size:])
+            return msg if isinstance(msg, dict) else None
+    except (struct.error, IndexError, ValueError):
+        pass
+    return None
+
+
+# =====================================================================
+# Purpose: Split the byte stream from one peer into frames and decode
+#          them. Keeps a single bytearray per connection and a read
+#          offset, so coalesced and partial reads cost no string
+#          concatenation or re-copying, and counts what it had to throw
+#          away. In bin2 it keeps the newest state of each stream, which
+#          the stream's delta frames are applied to.
+# Pre:  protocol is the format the peer is currently sending in. It may
+#       be changed between calls to next, e.g. after the join request.
+# Post: Creates an empty reader.
+# =====================================================================
+class FrameReader:
+    def __init__(self, protocol: str = PROTOCOL_JSON, maxFrameSize: int = MAX_FRAME_SIZE) -> None:
+        self.protocol = protocol
+        self.maxFrameSize = maxFrameSize
+        self.buffer = bytearray()
+        self.start = 0          # bytes at the front of buffer that were already read
+        self.skipping = False   # throwing away an oversized JSON line up to its newline
+        self.corrupt = False    # a binary length was impossible, the stream cannot be resynchronised
+        self.framesIn = 0       # frames decoded successfully
+        self.malformed = 0      # frames that could not be decoded
+        self.dropped = 0        # frames thrown away for being too large
+        self.baselines = {}     # bin2: newest state per stream key, what the next delta applies to
+        self.unmatched = 0      # bin2: deltas that arrived with no state of their stream before them
+
+    # add newly received bytes to the end of the stream
+    def feed(self, data: bytes) -> None:
+        if self.start:
+            del self.buffer[:self.start]
+            self.start = 0
+        self.buffer += data
+
+    def pending(self) -> int:
+        return len(self.buffer) - self.start
+
+    # cut the next complete frame off the stream, in the form decodeFrame expects
+    def nextFrame(self):
+        buffer = self.buffer
+        if self.protocol not in BINARY_PROTOCOLS:
+            end = buffer.find(b"\n", self.start)
+            if self.skipping:
+                if end < 0:
+                    self.start = len(buffer)
+                    return None
+                self.start = end + 1
+                self.skipping = False
+                end = buffer.find(b"\n", self.start)
+            if end < 0:
+                if self.pending() > self.maxFrameSize:
+                    self.dropped += 1
+                    self.skipping = True
+                    self.start = len(buffer)
+                return None
+            frame = bytes(buffer[self.start:end])
+            self.start = end + 1
+            return frame
+
+        if self.corrupt or self.pending() < 2:
+            return None
+        size = 2 + int.from_bytes(buffer[self.start:self.start + 2], "big")
+        if size < HEADER.size or size > self.maxFrameSize:
+            self.malformed += 1
+            self.corrupt = True
+            return None
+        if self.pending() < size:
+            return None
+        frame = bytes(buffer[self.start:self.start + size])
+        self.start += size
+        return frame
+
+    # return the next decodable message and its frame, or None once the stream runs dry
+    def next(self):
+        while True:
+            frame = self.nextFrame()
+            if frame is None:
+                return None
+            if isDelta(frame, self.protocol):
+                msg = self.applyDelta(frame)
+                if msg is None:
+                    continue    # already counted
+            else:
+                msg = decodeFrame(frame, self.protocol)
+                if msg is not None and self.protocol == PROTOCOL_DELTA:
+                    self.keepBaseline(msg)
+            if msg is not None:
+                self.framesIn += 1
+                return msg, frame
+            if frame.strip():
+                self.malformed += 1
+
+    # remember a whole state for the deltas that follow it, only the fields they change
+    def keepBaseline(self, msg: dict) -> None:
+        key = streamKey(msg)
+        if key is not None:
+            fields = SNAPSHOT_DELTA_FIELDS if key == 'snapshot' else STATE_DELTA_FIELDS
+            try:
+                self.baselines[key] = {name: msg[name] for name in fields} | {'sync': msg['sync']}
+            except KeyError:
+                pass
+
+    def applyDelta(self, frame: bytes):
+        key = 'snapshot' if frame[3] == MSG_SNAPSHOT_DELTA else None
+        try:
+            if key is None:
+                key = ROLES[DELTA_HEAD.unpack_from(frame, HEADER.size)[0]]
+            base = self.baselines.get(key)
+            if base is None:
+                self.unmatched += 1
+                return None
+            msg = applyDelta(base, frame)
+        except (struct.error, IndexError):
+            self.malformed += 1
+            return None
+        self.baselines[key] = msg       # shared with the caller, received messages are never changed
+        return msg
+
+    def messages(self) -> list[dict]:
+        messages = []
+        while (item := self.next()) is not None:
+            messages.append(item[0])
+        return messages
+
+
+# =====================================================================
+# Purpose: Split a UDP datagram into its header and message.
+# Pre:  data is one datagram. protocol is the sender's wire format.
+# Post: Returns (token, sequence, message, frame), or None if the
+#       datagram is too short or its message cannot be decoded. frame is
+#       the message as it would appear on a TCP stream, so it can be
+#       forwarded with wireBytes.
+# =====================================================================
+def decodeDatagram(data: bytes, protocol: str):
+    if len(data) <= DATAGRAM_HEADER.size:
+        return None
+    token, seq = DATAGRAM_HEADER.unpack_from(data)
+    frame = data[DATAGRAM_HEADER.size:]
+    if protocol not in BINARY_PROTOCOLS:
+        frame = frame.rstrip(b"\n")
+    msg = decodeFrame(frame, protocol)
+    if msg is None:
+        return None
+    return token, seq, msg, frame
+
+
+# =====================================================================
+# Purpose: The client's end of the optional UDP channel used for per-tick
+#          game state. Numbers every datagram it sends and throws away
+#          any that arrive out of order, since only the newest state
+#          matters and a late one would move things backwards.
+# Pre:  sock is a non-blocking UDP socket connected to the server. token
+#       and protocol come from the server's game info.
+# Post: Creates a channel that has not heard from the server yet.
+# =====================================================================
+class DatagramChannel:
+    def __init__(self, sock: socket.socket, token: int, protocol: str) -> None:
+        self.sock = sock
+        self.token = token
+        self.protocol = protocol
+        self.seqOut = 0         # sequence number of the last datagram sent
+        self.seqIn = 0          # newest sequence number received
+        self.heard = False      # the server knows our address once it has answered
+        self.lastHello = 0.0
+        self.stale = 0          # datagrams dropped for arriving after a newer one
+        self.lost = 0           # datagrams that never arrived, judging by gaps in the sequence
+
+    def send(self, msg: dict) -> None:
+        self.seqOut += 1
+        try:
+            self.sock.send(DATAGRAM_HEADER.pack(self.token, self.seqOut) + encodeMessage(msg, self.protocol))
+        except OSError:
+            pass    # the channel is unreliable by design, the next tick replaces this one
+
+    # return every new message waiting on the socket, oldest first
+    def receive(self) -> list[dict]:
+        if not self.heard and time.monotonic() - self.lastHello > UDP_HELLO_INTERVAL:
+            self.lastHello = time.monotonic()
+            self.send(UDP_HELLO)
+
+        messages = []
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except OSError:
+                return messages     # nothing waiting, or an ICMP error from a previous send
+            item = decodeDatagram(data, self.protocol)
+            if item is None or item[0] != self.token:
+                continue
+            token, seq, msg, frame = item
+            self.heard = True
+            if seq <= self.seqIn:
+                self.stale += 1
+                continue
+            self.lost += seq - self.seqIn - 1
+            self.seqIn = seq
+            if msg != UDP_HELLO:
+                messages.append(msg)
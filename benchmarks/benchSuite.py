@@ -0,0 +1,228 @@
+# =================================================================================================
+# Purpose:                  Run the hot path benchmarks together and catch regressions between runs
+# Misc:                     Run from the repository root:
+#                               python benchmarks/benchSuite.py --output baseline.json
+#                               python benchmarks/benchSuite.py --baseline baseline.json
+#                           The second form exits with status 1 if any metric got worse by more than
+#                           its tolerance, so it can gate a change. Compare runs from the same machine.
+#                           How Python hashes strings changes from process to process and moves the
+#                           dict-heavy hot paths by a third, so the groups timed in-process run once
+#                           in each of several processes with fixed hash seeds, and the median counts.
+# =================================================================================================
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from assets.code.wireProtocol import PROTOCOL_BINARY, PROTOCOL_DELTA, PROTOCOL_JSON, DeltaEncoder, FrameReader
+from protocolBench import GAME_STATE, benchProtocol
+from serverBench import benchRelay
+from simulationBench import benchScalar, makeMoves
+
+SUITE_VERSION = 2           # 2: medians over HASH_SEEDS rather than one process
+GROUPS = ['simulation', 'protocol', 'split', 'relay']
+HASH_SEEDS = [0, 1, 2, 3, 4]    # one process per seed for the in-process groups, an odd count so the median is a run
+RECEIVE_SIZE = 4096         # what checkServer asks recv for each frame
+REPEATS = 5                 # timing runs per measurement, the best one counts
+TOLERANCE = 0.15            # share a metric may get worse before it is called a regression
+GROUP_TOLERANCE = {'relay': 0.50}   # latency over real sockets moves around a lot more between runs
+SHORT_CALL_US = 2.0         # per-call times under this are a few hundred instructions, cache and frequency swings dominate
+SHORT_CALL_TOLERANCE = 0.35
+
+
+# =====================================================================
+# Purpose: Time the game rules: how many ticks of one match run per
+#          second, with the paddles chasing the ball.
+# Pre:  None.
+# Post: Returns the metrics, the best of REPEATS runs.
+# =====================================================================
+def benchSimulation(ticks: int) -> dict:
+    moves = makeMoves(1, ticks, seed=1)
+    rate = max(benchScalar(1, moves)[0] for _ in range(REPEATS))
+    return {'ticks_per_sec': round(rate)}
+
+
+# =====================================================================
+# Purpose: Time encoding and decoding the gameState message playGame
+#          sends every frame, in each wire format.
+# Pre:  None.
+# Post: Returns the metrics in microseconds per message.
+# =====================================================================
+def benchEncoding(number: int) -> dict:
+    metrics = {}
+    for protocol in [PROTOCOL_JSON, PROTOCOL_BINARY]:
+        result = benchProtocol(protocol, 10, number)
+        for name in ['encode_us', 'decode_us', 'relay_once_us']:
+            metrics[f"{protocol}.{name}"] = result[name]
+    return metrics
+
+
+# =====================================================================
+# Purpose: Time what checkServer does with each recv: feed a chunk of
+#          the stream to the FrameReader and split it into messages.
+# Pre:  None.
+# Post: Returns messages and megabytes split per second, per format.
+# =====================================================================
+def benchSplit(messages: int) -> dict:
+    metrics = {}
+    for protocol in [PROTOCOL_JSON, PROTOCOL_BINARY, PROTOCOL_DELTA]:
+        states = []
+        encoder = DeltaEncoder(protocol)    # as playGame sends them, deltas in bin2
+        for sync in range(messages):
+            state = dict(GAME_STATE, sync=sync)
+            states.append(encoder.encode(state))
+        stream = b"".join(states)
+        # recv hands back whatever has arrived, so messages are cut at arbitrary points
+        chunks = [stream[i:i + RECEIVE_SIZE] for i in range(0, len(stream), RECEIVE_SIZE)]
+
+        best = None
+        for _ in range(REPEATS):
+            reader = FrameReader(protocol)
+            count = 0
+            start = time.perf_counter()
+            for chunk in chunks:
+                reader.feed(chunk)
+                count += len(reader.messages())
+            elapsed = time.perf_counter() - start
+            if count != messages:
+                raise RuntimeError(f"{protocol} split {count} messages out of {messages}")
+            best = elapsed if best is None else min(best, elapsed)
+        metrics[f"{protocol}.messages_per_sec"] = round(messages / best)
+        metrics[f"{protocol}.mb_per_sec"] = round(len(stream) / best / 1e6, 2)
+    return metrics
+
+
+# =====================================================================
+# Purpose: Time state updates from one player to the opponent and every
+#          spectator through a real server, in each server mode.
+# Pre:  None.
+# Post: Returns latency percentiles and the share delivered, per mode.
+# =====================================================================
+def benchRelayLatency(spectators: int, messages: int) -> dict:
+    metrics = {}
+    for mode in ['threaded', 'eventloop']:
+        result = benchRelay(mode, spectators, messages, 1/60)
+        for name in ['delivered_pct', 'latency_ms_p50', 'latency_ms_p99']:
+            metrics[f"{mode}.{name}"] = result[name]
+    return metrics
+
+
+# run the chosen groups in this process, with names prefixed by their group
+def runGroups(groups: list[str], quick: bool, spectators: int) -> dict:
+    scale = 10 if quick else 1
+    benches = {
+        'simulation': lambda: benchSimulation(100000 // scale),
+        'protocol': lambda: benchEncoding(20000 // scale),
+        'split': lambda: benchSplit(200000 // scale),
+        'relay': lambda: benchRelayLatency(spectators, 600 // scale),
+    }
+    metrics = {}
+    for group in groups:
+        for name, value in benches[group]().items():
+            metrics[f"{group}.{name}"] = value
+    return metrics
+
+
+# =====================================================================
+# Purpose: Run the chosen groups and collect their metrics.
+# Pre:  groups is a subset of GROUPS. quick runs smaller workloads.
+# Post: Returns the results document that --output saves. The groups
+#       timed in-process are the median of one run per hash seed, the
+#       relay, which times real servers in processes of their own, runs
+#       once.
+# =====================================================================
+def runSuite(groups: list[str], quick: bool, spectators: int) -> dict:
+    timed = [group for group in GROUPS if group in groups and group != 'relay']
+    metrics = {}
+    if timed:
+        runs = []
+        for seed in HASH_SEEDS:
+            command = [sys.executable, os.path.abspath(__file__), "--worker", "--groups", *timed] + (["--quick"] if quick else [])
+            result = subprocess.run(command, env=dict(os.environ, PYTHONHASHSEED=str(seed)),
+                                    capture_output=True, text=True, check=True)
+            runs.append(json.loads(result.stdout))
+        metrics = {name: statistics.median(run[name] for run in runs) for name in runs[0]}
+    if 'relay' in groups:
+        metrics.update(runGroups(['relay'], quick, spectators))
+    return {
+        'suite': SUITE_VERSION,
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'quick': quick,
+        'hashSeeds': HASH_SEEDS,
+        'spectators': spectators,
+        'metrics': metrics,
+    }
+
+
+# whether a bigger value of a metric is an improvement, judged by its unit
+def higherIsBetter(name: str) -> bool:
+    return name.endswith(('_per_sec', '_pct'))
+
+
+# =====================================================================
+# Purpose: Compare a run against a saved baseline.
+# Pre:  Both are results documents from runSuite.
+# Post: Returns one row per metric found in both: (name, baseline,
+#       current, change as a share, status). status is 'ok', 'better'
+#       or 'REGRESSION'.
+# =====================================================================
+def compare(baseline: dict, current: dict, tolerance: float) -> list[tuple]:
+    rows = []
+    for name, value in current['metrics'].items():
+        old = baseline['metrics'].get(name)
+        if old is None or value is None or not old:
+            continue
+        change = (value - old) / old
+        worse = -change if higherIsBetter(name) else change
+        allowed = max(tolerance, GROUP_TOLERANCE.get(name.split('.')[0], 0))
+        if name.endswith('_us') and min(old, value) < SHORT_CALL_US:
+            allowed = max(allowed, SHORT_CALL_TOLERANCE)
+        status = 'REGRESSION' if worse > allowed else 'better' if worse < -allowed else 'ok'
+        rows.append((name, old, value, change, status))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the pong benchmark suite")
+    parser.add_argument("--groups", nargs="+", choices=GROUPS, default=GROUPS, help="benchmarks to run")
+    parser.add_argument("--quick", action="store_true", help="smaller workloads, for a fast check")
+    parser.add_argument("--spectators", type=int, default=10, help="spectators watching the relay benchmark")
+    parser.add_argument("--output", help="save the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against results saved earlier with --output")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="share a metric may get worse before it fails")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)     # one hash seed's run, for runSuite
+    args = parser.parse_args()
+    if args.worker:
+        print(json.dumps(runGroups(args.groups, args.quick, args.spectators)))
+        sys.exit(0)
+    if args.quick and args.baseline:
+        parser.error("--quick runs are too short to tell a regression from noise, compare full runs")
+
+    results = runSuite(args.groups, args.quick, args.spectators)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if not args.baseline:
+        print(json.dumps(results, indent=2))
+        sys.exit(0)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('suite') != SUITE_VERSION or baseline.get('quick') != results['quick']:
+        print("warning: the baseline was measured differently, save a new one with this version")
+    rows = compare(baseline, results, args.tolerance)
+    for name, old, value, change, status in rows:
+        print(f"{name:40} {old:>14} {value:>14} {change:>+8.1%}  {status}")
+    regressions = [row[0] for row in rows if row[4] == 'REGRESSION']
+    print(f"{len(regressions)} regression(s) out of {len(rows)} metrics")
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,236 @@
+# =================================================================================================
+# Purpose:                  Put a pongServer under load from many headless bots and report how it copes
+# Misc:                     Run from the repository root: python benchmarks/loadGen.py --players 1000
+#                           Starts its own server unless --port is given, spreads the bots over
+#                           several processes, and prints one JSON result with relay throughput,
+#                           latency percentiles, dropped frames and the server's CPU and memory.
+# =================================================================================================
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from pongBot import Bot, BotStats, runBots
+from serverBench import processStats, startServer
+
+SETTLE_TIME = 5.0       # seconds for every bot to join and count down before measuring starts
+
+
+# =====================================================================
+# Purpose: Let one process open as many sockets as the system allows.
+# Pre:  None.
+# Post: Raises the soft open file limit to the hard limit where the
+#       platform supports it.
+# =====================================================================
+def raiseFileLimit() -> None:
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+# =====================================================================
+# Purpose: Read the CPU seconds a process and any worker processes it
+#          started have used so far.
+# Pre:  Linux /proc must be available.
+# Post: Returns user plus system seconds, or 0.0 when unavailable.
+# =====================================================================
+def processCpu(pid: int) -> float:
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(child) for child in f.read().split()]
+    except OSError:
+        return 0.0
+    # utime and stime are the 14th and 15th fields, counted from after the command name
+    seconds = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    return seconds + sum(processCpu(child) for child in children)
+
+
+# =====================================================================
+# Purpose: One load generator process. Connects its share of the bots,
+#          lets them play, and reports what they saw.
+# Pre:  players and spectators are this process's share. rooms is how
+#       many matches the whole run makes, for picking rooms to watch.
+#       measureAt is the time.time() every process starts measuring at,
+#       and barrier is shared by all of them.
+# Post: Puts two BotStats dictionaries on results, one for the settle
+#       period and one for the measured period with the tick counts from
+#       runBots added, the number of spectators in each room and the
+#       states each player in a room sent while measuring. Closes
+#       the bots once every process has stopped measuring, since the two
+#       players of a match are often in different processes.
+# =====================================================================
+def runLoad(host: str, port: int, players: int, spectators: int, rooms: int, connectRate: float,
+            measureAt: float, duration: float, tickRate: int, results, barrier) -> None:
+    raiseFileLimit()
+    settleStats = BotStats()
+    bots = []
+    for i in range(players + spectators):
+        spectate = i >= players
+        room = random.randint(1, rooms) if spectate and rooms else None
+        try:
+            bots.append(Bot(host, port, settleStats, spectate=spectate, room=room))
+        except OSError:
+            settleStats.disconnected += 1
+        time.sleep(1 / connectRate)
+    runBots(bots, max(0.0, measureAt - time.time()), tickRate, closeAfter=False)
+
+    # count the measured period on its own, so joins and countdowns do not skew it
+    stats = BotStats()
+    watchers = {}
+    for bot in bots:
+        bot.stats = stats
+        if bot.spectate and not bot.closed:
+            watchers[bot.room] = watchers.get(bot.room, 0) + 1
+    sentBefore = [bot.statesSent for bot in bots]
+    ticks, skipped = runBots(bots, duration, tickRate, closeAfter=False)
+    sent = {}
+    for bot, before in zip(bots, sentBefore):
+        if not bot.spectate:
+            sent.setdefault(bot.room, []).append(bot.statesSent - before)
+    results.put((settleStats.asDict(), stats.asDict() | {'ticks': ticks, 'skipped': skipped}, watchers, sent))
+    # a bot closed while its opponent in another process is still measuring would count as a disconnect there
+    barrier.wait()
+    for bot in bots:
+        bot.close()
+
+
+# the value at a share of the way through sorted values
+def percentile(values: list[float], share: float):
+    if not values:
+        return None
+    return round(values[min(len(values) - 1, int(len(values) * share))], 3)
+
+
+# =====================================================================
+# Purpose: Run the whole load test.
+# Pre:  args are the parsed command line arguments.
+# Post: Returns the result dictionary. A server started here is stopped.
+# =====================================================================
+def runLoadTest(args) -> dict:
+    proc = None
+    port = args.port
+    serverArgs = list(args.server_args)
+    spectatorRate = args.spectator_rate
+    if spectatorRate is None and "--spectator-rate" in serverArgs[:-1]:
+        spectatorRate = float(serverArgs[serverArgs.index("--spectator-rate") + 1])
+    elif spectatorRate:
+        serverArgs += ["--spectator-rate", str(spectatorRate)]
+    if port is None:
+        proc, port = startServer("eventloop", serverArgs)
+    serverPid = proc.pid if proc else args.server_pid
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    barrier = context.Barrier(args.processes)
+    share = lambda total, i: total // args.processes + (1 if i < total % args.processes else 0)
+    rooms = args.players // 2
+    connectRate = args.connect_rate / args.processes
+    measureAt = time.time() + (args.players + args.spectators) / args.connect_rate + SETTLE_TIME
+    workers = [context.Process(target=runLoad, args=(args.host, port, share(args.players, i),
+                                                     share(args.spectators, i), rooms, connectRate,
+                                                     measureAt, args.duration, args.tick_rate, results, barrier))
+               for i in range(args.processes)]
+    try:
+        for worker in workers:
+            worker.start()
+        # measure the server over the same window the bots count
+        time.sleep(max(0.0, measureAt - time.time()))
+        cpuStart = processCpu(serverPid) if serverPid else 0.0
+        time.sleep(args.duration)
+        cpuUsed = processCpu(serverPid) - cpuStart if serverPid else 0.0
+        threads, rss = processStats(serverPid) if serverPid else (0, 0)
+        reports = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+    finally:
+        if proc:
+            proc.kill()
+            proc.wait()
+
+    joined = {key: sum(report[0][key] for report in reports) for key in ('connected', 'started', 'disconnected')}
+    totals = {key: sum(report[1][key] for report in reports)
+              for key in ('messagesIn', 'bytesIn', 'messagesOut', 'bytesOut', 'dropped', 'malformed', 'disconnected',
+                          'resyncs', 'ticks', 'skipped')}
+    latencies = sorted(value for report in reports for value in report[1]['latencies'])
+    rtts = sorted(value for report in reports for value in report[1]['rtts'])
+
+    # every relayed state should reach the opponent, and each spectator in its room unless the server thins them out
+    watchers, statesOut, statesIn, watchedIn, sent = {}, {}, {}, {}, {}
+    for _, stats, roomWatchers, roomSent in reports:
+        for counts, field in [(watchers, roomWatchers), (statesOut, stats['statesOut']), (statesIn, stats['statesIn']),
+                              (watchedIn, stats['watchedIn'])]:
+            for room, count in field.items():
+                counts[room] = counts.get(room, 0) + count
+        for room, counts in roomSent.items():
+            sent.setdefault(room, []).extend(counts)
+    expected = sum(statesOut.values())
+    relayDropped = max(0, expected - sum(statesIn.values()))
+    # at a spectator rate each flush only sends each player's newest state, so at most that many of a player's
+    flushed = spectatorRate * args.duration if spectatorRate else None
+    watchedExpected = sum(watchers.get(room, 0) * sum(min(count, flushed) if flushed else count for count in counts)
+                          for room, counts in sent.items())
+    watchedDropped = max(0, round(watchedExpected - sum(watchedIn.values())))
+    return {
+        "players": args.players,
+        "spectators": args.spectators,
+        "processes": args.processes,
+        "duration_s": args.duration,
+        "connected": joined['connected'],
+        "started": joined['started'],
+        "disconnected": joined['disconnected'] + totals['disconnected'],
+        "sent_per_sec": round(totals['messagesOut'] / args.duration, 1),
+        "received_per_sec": round(totals['messagesIn'] / args.duration, 1),
+        "received_kb_per_sec": round(totals['bytesIn'] / 1024 / args.duration, 1),
+        "relay_dropped": relayDropped,
+        "relay_dropped_pct": round(100 * relayDropped / expected, 3) if expected else None,
+        "spectator_rate": spectatorRate,
+        "spectator_dropped": watchedDropped,
+        "spectator_dropped_pct": round(100 * watchedDropped / watchedExpected, 3) if watchedExpected else None,
+        "snapshots_dropped": totals['dropped'],
+        "malformed": totals['malformed'],
+        "lockstep_resyncs": totals['resyncs'],
+        "latency_samples": len(latencies),
+        "latency_ms_p50": percentile(latencies, 0.5),
+        "latency_ms_p90": percentile(latencies, 0.9),
+        "latency_ms_p99": percentile(latencies, 0.99),
+        "latency_ms_max": percentile(latencies, 1.0),
+        "rtt_ms_p50": percentile(rtts, 0.5),
+        "rtt_ms_p99": percentile(rtts, 0.99),
+        # above a few percent the bots themselves are overloaded, add processes or machines
+        "bot_ticks_skipped_pct": round(100 * totals['skipped'] / (totals['ticks'] + totals['skipped']), 2),
+        "server_cpu_pct": round(100 * cpuUsed / args.duration, 1) if serverPid else None,
+        "server_threads": threads,
+        "server_rss_kb": rss,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test pongServer.py with headless bots")
+    parser.add_argument("--players", type=int, default=200, help="bot players, two per match")
+    parser.add_argument("--spectators", type=int, default=200, help="bot spectators, spread over the matches")
+    parser.add_argument("--duration", type=float, default=10, help="seconds to measure for")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="processes to run the bots in")
+    parser.add_argument("--connect-rate", type=float, default=500, help="new connections per second, over all processes")
+    parser.add_argument("--tick-rate", type=int, default=60, help="state updates each player sends per second")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=None, help="test a server that is already running")
+    parser.add_argument("--server-pid", type=int, default=None, help="pid of that server, for its CPU and memory")
+    parser.add_argument("--spectator-rate", type=float, default=None,
+                        help="the server's --spectator-rate, passed to a server started here (default: read from --server-args)")
+    parser.add_argument("--server-args", nargs=argparse.REMAINDER, default=[],
+                        help="arguments for the server this starts, e.g. --server-args --workers 4")
+    args = parser.parse_args()
+    print(json.dumps(runLoadTest(args)))
@@ -0,0 +1,136 @@
+# =================================================================================================
+# Purpose:                  Compare the JSON, binary and delta wire formats on the per-frame messages
+# Misc:                     Run from the repository root: python benchmarks/protocolBench.py
+# =================================================================================================
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from assets.code.wireProtocol import (PROTOCOL_JSON, PROTOCOL_BINARY, PROTOCOL_DELTA, DeltaEncoder, FrameReader,
+                                      encodeMessage, wireBytes)
+from assets.code.simulation import GameState, advance, isOver, restart
+
+# the gameState dictionary playGame sends every frame
+GAME_STATE = {'ballX': 318, 'ballY': 207, 'paddleX': 10, 'paddleY': 190,
+              'lScore': 2, 'rScore': 3, 'role': 'left', 'sync': 4521}
+
+
+# =====================================================================
+# Purpose: Time a function and report the cost of one call.
+# Pre:  fn takes no arguments.
+# Post: Returns the best per-call time in microseconds over a few runs.
+# =====================================================================
+def perCall(fn, number: int) -> float:
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+# =====================================================================
+# Purpose: Measure encode, decode and server relay cost for one format.
+# Pre:  protocol is one of SUPPORTED_PROTOCOLS. recipients is how
+#       many other clients the server relays each update to.
+# Post: Returns a result dictionary with times in microseconds.
+# =====================================================================
+def benchProtocol(protocol: str, recipients: int, number: int) -> dict:
+    encoded = encodeMessage(GAME_STATE, protocol)
+
+    reader = FrameReader(protocol)
+
+    def decode():
+        reader.feed(encoded)
+        reader.next()
+
+    queues = [[] for _ in range(recipients)]
+
+    # the old relay: decode the update, then encode it again for each recipient
+    def relayPerRecipient():
+        reader.feed(encoded)
+        data, frame = reader.next()
+        for queue in queues:
+            queue.append(encodeMessage(data, protocol))
+            queue.clear()
+
+    # the server's relay: decode the update once and queue the received bytes for everyone
+    def relayOnce():
+        reader.feed(encoded)
+        msg, frame = reader.next()
+        data = wireBytes(frame, protocol)
+        for queue in queues:
+            queue.append(data)
+            queue.clear()
+
+    return {
+        "protocol": protocol,
+        "bytes_per_message": len(encoded),
+        "encode_us": round(perCall(lambda: encodeMessage(GAME_STATE, protocol), number), 3),
+        "decode_us": round(perCall(decode, number), 3),
+        "relay_per_recipient_us": round(perCall(relayPerRecipient, max(1, number // recipients)), 3),
+        "relay_once_us": round(perCall(relayOnce, max(1, number // recipients)), 3),
+        "recipients": recipients,
+    }
+
+
+# =====================================================================
+# Purpose: Play a match between two ball-following paddles and collect
+#          the states the left player would send, one per tick.
+# Pre:  ticks is how many states to collect.
+# Post: Returns the states, restarting the match whenever it ends.
+# =====================================================================
+def matchStates(ticks: int) -> list[dict]:
+    game = GameState()
+    states = []
+    while len(states) < ticks:
+        if isOver(game):
+            restart(game)
+        moves = {role: "down" if game.ballY > getattr(game, role + 'Y') + 20 else "up" for role in ('left', 'right')}
+        advance(game, moves)
+        states.append({'ballX': game.ballX, 'ballY': game.ballY, 'paddleX': game.leftX, 'paddleY': game.leftY,
+                       'lScore': game.lScore, 'rScore': game.rScore, 'role': 'left', 'sync': game.sync})
+    return states
+
+
+# =====================================================================
+# Purpose: Measure one player's stream of states, which is where delta
+#          frames save bytes: most ticks only the ball and sync move.
+# Pre:  states come from matchStates.
+# Post: Returns the average bytes, encode and decode time per state.
+# =====================================================================
+def benchStream(protocol: str, states: list[dict], number: int) -> dict:
+    encoder = DeltaEncoder(protocol)
+    frames = [encoder.encode(state) for state in states]
+    stream = b"".join(frames)
+    repeats = max(1, number // len(states))
+
+    def encode():
+        encoder = DeltaEncoder(protocol)
+        for state in states:
+            encoder.encode(state)
+
+    def decode():
+        reader = FrameReader(protocol)
+        reader.feed(stream)
+        while reader.next() is not None:
+            pass
+
+    return {
+        "protocol": protocol,
+        "stream_bytes_per_message": round(len(stream) / len(states), 2),
+        "stream_encode_us": round(perCall(encode, repeats) / len(states), 3),
+        "stream_decode_us": round(perCall(decode, repeats) / len(states), 3),
+        "states": len(states),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pong wire formats")
+    parser.add_argument("--recipients", type=int, default=10, help="clients each relayed update is sent to")
+    parser.add_argument("--number", type=int, default=20000, help="calls per timing run")
+    args = parser.parse_args()
+
+    states = matchStates(3600)
+    for protocol in [PROTOCOL_JSON, PROTOCOL_BINARY, PROTOCOL_DELTA]:
+        print(json.dumps(benchProtocol(protocol, args.recipients, args.number) | benchStream(protocol, states, args.number)))
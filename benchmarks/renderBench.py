@@ -0,0 +1,128 @@
+# =================================================================================================
+# Purpose:                  Compare drawing every frame whole with the client's FieldRenderer
+# Misc:                     Run from the repository root: python benchmarks/renderBench.py
+#                           Draws without a window (SDL's dummy video driver) unless --window is
+#                           given, which times the real display, vsync and all, and needs pygame.
+# =================================================================================================
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from assets.code.simulation import BALL_SIZE, PADDLE_HEIGHT, PADDLE_WIDTH, GameState, advance, isOver, restart
+
+WHITE = (255, 255, 255)
+BG_COLOR = (24, 61, 26)
+RED = (255, 0, 0)
+BLUE = (0, 0, 255)
+
+
+# =====================================================================
+# Purpose: Play a match between two ball-following paddles and keep
+#          what each frame shows.
+# Pre:  None.
+# Post: Returns (ballX, ballY, leftY, rightY, lScore, rScore) per frame.
+# =====================================================================
+def matchFrames(frames: int) -> list[tuple]:
+    game = GameState()
+    shown = []
+    while len(shown) < frames:
+        if isOver(game):
+            restart(game)
+        advance(game, {role: "down" if game.ballY > getattr(game, role + 'Y') + 20 else "up" for role in ('left', 'right')})
+        shown.append((game.ballX, game.ballY, game.leftY, game.rightY, game.lScore, game.rScore))
+    return shown
+
+
+# =====================================================================
+# Purpose: Time the draw loop playGame had before FieldRenderer: fill,
+#          every center line dash, both walls, render the score, flip.
+# Pre:  pygame is initialized and screen is the display surface.
+# Post: Returns the seconds taken to draw every frame.
+# =====================================================================
+def benchFullRedraw(screen, scoreFont, frames: list[tuple]) -> float:
+    import pygame
+    from assets.code.helperCode import updateScore
+    width, height = screen.get_size()
+    topWall = pygame.Rect(-10, 0, width+20, 10)
+    bottomWall = pygame.Rect(-10, height-10, width+20, 10)
+    centerLine = [pygame.Rect((width/2)-5, i, 5, 5) for i in range(0, height, 10)]
+    ball = pygame.Rect(0, 0, BALL_SIZE, BALL_SIZE)
+    leftPaddle = pygame.Rect(10, 0, PADDLE_WIDTH, PADDLE_HEIGHT)
+    rightPaddle = pygame.Rect(width-20, 0, PADDLE_WIDTH, PADDLE_HEIGHT)
+    start = time.perf_counter()
+    for ballX, ballY, leftY, rightY, lScore, rScore in frames:
+        screen.fill(BG_COLOR)
+        ball.topleft, leftPaddle.y, rightPaddle.y = (ballX, ballY), leftY, rightY
+        pygame.draw.rect(screen, WHITE, ball)
+        for dash in centerLine:
+            pygame.draw.rect(screen, WHITE, dash)
+        pygame.draw.rect(screen, RED, leftPaddle)
+        pygame.draw.rect(screen, BLUE, rightPaddle)
+        pygame.draw.rect(screen, WHITE, topWall)
+        pygame.draw.rect(screen, WHITE, bottomWall)
+        updateScore(lScore, rScore, screen, WHITE, scoreFont)
+        pygame.display.flip()
+        pygame.event.pump()
+    return time.perf_counter() - start
+
+
+# =====================================================================
+# Purpose: Time the same frames drawn with FieldRenderer.
+# Pre:  As for benchFullRedraw.
+# Post: Returns the seconds taken and the share of the window updated
+#       on an average frame.
+# =====================================================================
+def benchRenderer(screen, scoreFont, frames: list[tuple]) -> tuple[float, float]:
+    import pygame
+    from assets.code.renderer import FieldRenderer
+    width, height = screen.get_size()
+    renderer = FieldRenderer(screen, BG_COLOR, WHITE)
+    ball = pygame.Rect(0, 0, BALL_SIZE, BALL_SIZE)
+    leftPaddle = pygame.Rect(10, 0, PADDLE_WIDTH, PADDLE_HEIGHT)
+    rightPaddle = pygame.Rect(width-20, 0, PADDLE_WIDTH, PADDLE_HEIGHT)
+    updated = 0
+    start = time.perf_counter()
+    for ballX, ballY, leftY, rightY, lScore, rScore in frames:
+        renderer.begin()
+        ball.topleft, leftPaddle.y, rightPaddle.y = (ballX, ballY), leftY, rightY
+        renderer.rect(WHITE, ball)
+        renderer.rect(RED, leftPaddle)
+        renderer.rect(BLUE, rightPaddle)
+        renderer.score(scoreFont, lScore, rScore, WHITE)
+        updated += sum(area.w * area.h for area in renderer.erased + renderer.drawn)
+        renderer.present()
+        pygame.event.pump()
+    return time.perf_counter() - start, updated / len(frames) / (width * height)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark drawing the game field")
+    parser.add_argument("--frames", type=int, default=3000)
+    parser.add_argument("--window", action="store_true", help="draw to a real window instead of SDL's dummy driver")
+    args = parser.parse_args()
+
+    if not args.window:
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import pygame
+    pygame.init()
+    screen = pygame.display.set_mode((640, 480))
+    scoreFont = pygame.font.Font("./assets/fonts/pong-score.ttf", 32)
+    frames = matchFrames(args.frames)
+
+    fullTime = benchFullRedraw(screen, scoreFont, frames)
+    rendererTime, updatedShare = benchRenderer(screen, scoreFont, frames)
+    pygame.quit()
+    print(json.dumps({
+        "frames": len(frames),
+        "full_redraw_ms_per_frame": round(fullTime / len(frames) * 1000, 4),
+        "renderer_ms_per_frame": round(rendererTime / len(frames) * 1000, 4),
+        "full_redraw_fps": round(len(frames) / fullTime),
+        "renderer_fps": round(len(frames) / rendererTime),
+        "speedup": round(fullTime / rendererTime, 2),
+        "window_share_updated": round(updatedShare, 4),
+    }))
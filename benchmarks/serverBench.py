@@ -0,0 +1,239 @@
+# =================================================================================================
+# Purpose:                  Compare the threaded and event loop pongServer modes
+# Misc:                     Run from the repository root: python benchmarks/serverBench.py
+# =================================================================================================
+
+import argparse
+import json
+import os
+import selectors
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_SCRIPT = os.path.join(REPO_ROOT, "pongServer.py")
+
+
+# =====================================================================
+# Purpose: Find a loopback port nobody is listening on.
+# Pre:  None.
+# Post: Returns a port number that was free a moment ago.
+# =====================================================================
+def freePort() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# =====================================================================
+# Purpose: Start pongServer.py in its own process and wait until it
+#          accepts connections.
+# Pre:  mode must be one of the server's --mode choices.
+# Post: Returns the running process and the port it listens on.
+# =====================================================================
+def startServer(mode: str, extraArgs: list[str] = []) -> tuple[subprocess.Popen, int]:
+    port = freePort()
+    proc = subprocess.Popen([sys.executable, "-u", SERVER_SCRIPT, "--mode", mode, "--host", "127.0.0.1",
+                             "--port", str(port)] + extraArgs,
+                            cwd=REPO_ROOT, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    for line in proc.stdout:
+        if "listening" in line:
+            break
+    else:
+        proc.wait()
+        raise RuntimeError(f"{mode} server did not start")
+    # keep reading the connection log so the server never blocks on a full pipe
+    threading.Thread(target=proc.stdout.read, daemon=True).start()
+    return proc, port
+
+
+# =====================================================================
+# Purpose: Read the thread count and resident memory of a process and
+#          any worker processes it started.
+# Pre:  Linux /proc must be available.
+# Post: Returns (threads, rss in KB), or (0, 0) when unavailable.
+# =====================================================================
+def processStats(pid: int) -> tuple[int, int]:
+    threads = rss = 0
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("Threads:"):
+                    threads = int(line.split()[1])
+                elif line.startswith("VmRSS:"):
+                    rss = int(line.split()[1])
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(child) for child in f.read().split()]
+    except OSError:
+        return threads, rss
+    for child in children:
+        childThreads, childRss = processStats(child)
+        threads += childThreads
+        rss += childRss
+    return threads, rss
+
+
+# =====================================================================
+# Purpose: Blocking helper that reads one newline-terminated JSON message.
+# Pre:  sock must be a connected blocking socket. buffers maps each
+#       socket to the bytes received but not yet consumed.
+# Post: Returns the decoded message.
+# =====================================================================
+def readMessage(sock: socket.socket, buffers: dict) -> dict:
+    buffer = buffers.setdefault(sock, bytearray())
+    while b"\n" not in buffer:
+        data = sock.recv(4096)
+        if not data:
+            raise ConnectionError("server closed the connection")
+        buffer += data
+    end = buffer.index(b"\n")
+    line = bytes(buffer[:end])
+    del buffer[:end + 1]
+    return json.loads(line)
+
+
+# =====================================================================
+# Purpose: Connect a client, ask to play or watch, and read its game info.
+# Pre:  A server must be listening on port.
+# Post: Returns the socket and the role the server assigned.
+# =====================================================================
+def connectClient(port: int, buffers: dict, join: str = "play") -> tuple[socket.socket, str]:
+    sock = socket.create_connection(("127.0.0.1", port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.sendall((json.dumps({'join': join}) + "\n").encode())
+    info = readMessage(sock, buffers)
+    return sock, info['role']
+
+
+# =====================================================================
+# Purpose: Measure how many idle connections one server process holds
+#          and what each costs in threads and memory.
+# Pre:  mode must be one of the server's --mode choices.
+# Post: Returns a result dictionary. All sockets are closed.
+# =====================================================================
+def benchConnections(mode: str, count: int, workers: int = 1) -> dict:
+    proc, port = startServer(mode, ["--workers", str(workers)] if workers > 1 else [])
+    buffers = {}
+    sockets = []
+    try:
+        baseThreads, baseRss = processStats(proc.pid)
+        start = time.perf_counter()
+        for _ in range(count):
+            sock, _ = connectClient(port, buffers)
+            sockets.append(sock)
+        elapsed = time.perf_counter() - start
+        time.sleep(0.2)
+        threads, rss = processStats(proc.pid)
+        return {
+            "mode": mode,
+            "workers": workers,
+            "connections": count,
+            "accept_per_sec": round(count / elapsed, 1),
+            "server_threads": threads,
+            "server_rss_kb": rss,
+            "rss_kb_per_connection": round((rss - baseRss) / count, 2),
+        }
+    finally:
+        for sock in sockets:
+            sock.close()
+        proc.kill()
+        proc.wait()
+
+
+# =====================================================================
+# Purpose: Measure the time from one player sending a state update to
+#          every other client receiving it.
+# Pre:  mode must be one of the server's --mode choices.
+# Post: Returns a result dictionary with latency percentiles in ms.
+# =====================================================================
+def benchRelay(mode: str, spectators: int, messages: int, interval: float, workers: int = 1) -> dict:
+    proc, port = startServer(mode, ["--workers", str(workers)] if workers > 1 else [])
+    buffers = {}
+    sockets = []
+    try:
+        left, _ = connectClient(port, buffers)
+        right, _ = connectClient(port, buffers)
+        watchers = [connectClient(port, buffers, "spectate")[0] for _ in range(spectators)]
+        receivers = [right] + watchers
+        sockets = [left] + receivers
+        for sock in sockets:
+            while 'start_game' not in readMessage(sock, buffers):
+                pass
+        time.sleep(4)       # the threaded server waits out the countdown before reading
+
+        selector = selectors.DefaultSelector()
+        for sock in receivers:
+            sock.setblocking(False)
+            selector.register(sock, selectors.EVENT_READ)
+
+        latencies = []
+        expected = messages * len(receivers)
+        state = {'ballX': 320, 'ballY': 240, 'paddleX': 10, 'paddleY': 215,
+                 'lScore': 0, 'rScore': 0, 'role': 'left', 'sync': 0}
+        nextSend = time.perf_counter()
+        sent = 0
+        deadline = time.perf_counter() + messages * interval + 10
+        while len(latencies) < expected and time.perf_counter() < deadline:
+            now = time.perf_counter()
+            if sent < messages and now >= nextSend:
+                state['sync'] = sent + 1
+                state['sentAt'] = now
+                left.sendall((json.dumps(state) + "\n").encode())
+                sent += 1
+                nextSend += interval
+            for key, _ in selector.select(timeout=max(0.0, nextSend - time.perf_counter()) if sent < messages else 0.05):
+                buffer = buffers.setdefault(key.fileobj, bytearray())
+                try:
+                    data = key.fileobj.recv(65536)
+                except BlockingIOError:
+                    continue
+                if not data:
+                    selector.unregister(key.fileobj)
+                    continue
+                buffer += data
+                received = time.perf_counter()
+                while b"\n" in buffer:
+                    end = buffer.index(b"\n")
+                    msg = json.loads(bytes(buffer[:end]))
+                    del buffer[:end + 1]
+                    if 'sentAt' in msg:
+                        latencies.append((received - msg['sentAt']) * 1000)
+        latencies.sort()
+        return {
+            "mode": mode,
+            "workers": workers,
+            "spectators": spectators,
+            "messages": messages,
+            "delivered_pct": round(100 * len(latencies) / expected, 2),
+            "latency_ms_mean": round(statistics.fmean(latencies), 3) if latencies else None,
+            "latency_ms_p50": round(latencies[len(latencies) // 2], 3) if latencies else None,
+            "latency_ms_p99": round(latencies[int(len(latencies) * 0.99) - 1], 3) if latencies else None,
+        }
+    finally:
+        for sock in sockets:
+            sock.close()
+        proc.kill()
+        proc.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark pongServer.py threaded vs event loop modes")
+    parser.add_argument("--modes", nargs="+", default=["threaded", "eventloop"])
+    parser.add_argument("--connections", type=int, default=500, help="idle clients for the connection test")
+    parser.add_argument("--spectators", type=int, default=100, help="spectators watching the relay test")
+    parser.add_argument("--messages", type=int, default=300, help="state updates sent in the relay test")
+    parser.add_argument("--interval", type=float, default=1/60, help="seconds between state updates")
+    parser.add_argument("--workers", type=int, default=1, help="also run the eventloop server with this many worker processes")
+    args = parser.parse_args()
+
+    runs = [(mode, 1) for mode in args.modes]
+    if args.workers > 1 and "eventloop" in args.modes:
+        runs.append(("eventloop", args.workers))
+    for mode, workers in runs:
+        print(json.dumps(benchConnections(mode, args.connections, workers)))
+    for mode, workers in runs:
+        print(json.dumps(benchRelay(mode, args.spectators, args.messages, args.interval, workers)))
@@ -0,0 +1,97 @@
+# =================================================================================================
+# Purpose:                  Compare stepping matches one at a time with the numpy batch simulator
+# Misc:                     Run from the repository root: python benchmarks/simulationBench.py
+#                           The batch half is skipped when numpy is not installed.
+# =================================================================================================
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from assets.code.simulation import GameState, advance
+from assets.code.batchSimulation import MOVES, BatchSimulation, np
+
+
+# =====================================================================
+# Purpose: Pick paddle inputs that keep the ball in play, so the run
+#          covers paddle hits and not just scoring, with some noise.
+# Pre:  rng is a random.Random.
+# Post: Returns the move code for one paddle.
+# =====================================================================
+def chooseMove(rng: random.Random, ballY: int, paddleY: int) -> int:
+    if rng.random() < 0.2:
+        return rng.randrange(len(MOVES))
+    return 2 if ballY > paddleY + 25 else 1
+
+
+# =====================================================================
+# Purpose: Draw every input for a run up front from a reference run, so
+#          each path being timed sees exactly the same ones.
+# Pre:  None.
+# Post: Returns a list with (left, right) move code lists for each tick.
+# =====================================================================
+def makeMoves(matches: int, ticks: int, seed: int) -> list:
+    rng = random.Random(seed)
+    reference = [GameState() for _ in range(matches)]
+    moves = []
+    for _ in range(ticks):
+        left = [chooseMove(rng, s.ballY, s.leftY) for s in reference]
+        right = [chooseMove(rng, s.ballY, s.rightY) for s in reference]
+        for i, state in enumerate(reference):
+            advance(state, {'left': MOVES[left[i]], 'right': MOVES[right[i]]})
+        moves.append((left, right))
+    return moves
+
+
+# =====================================================================
+# Purpose: Step matches one at a time with simulation.advance.
+# Pre:  moves[t] holds (left, right) move code lists for tick t.
+# Post: Returns the matches stepped per second and the final states.
+# =====================================================================
+def benchScalar(matches: int, moves: list) -> tuple[float, list]:
+    states = [GameState() for _ in range(matches)]
+    start = time.perf_counter()
+    for left, right in moves:
+        for i, state in enumerate(states):
+            advance(state, {'left': MOVES[left[i]], 'right': MOVES[right[i]]})
+    return matches * len(moves) / (time.perf_counter() - start), states
+
+
+# =====================================================================
+# Purpose: Step the same matches together with BatchSimulation.
+# Pre:  As for benchScalar. numpy must be installed.
+# Post: Returns the matches stepped per second and the batch.
+# =====================================================================
+def benchBatch(matches: int, moves: list) -> tuple[float, BatchSimulation]:
+    batch = BatchSimulation(matches)
+    arrays = [(np.array(left, dtype=np.int8), np.array(right, dtype=np.int8)) for left, right in moves]
+    start = time.perf_counter()
+    for left, right in arrays:
+        batch.advance(left, right)
+    return matches * len(moves) / (time.perf_counter() - start), batch
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the scalar and batch game simulations")
+    parser.add_argument("--matches", type=int, nargs="+", default=[1, 100, 1000, 5000])
+    parser.add_argument("--ticks", type=int, default=600, help="ticks per run")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    for matches in args.matches:
+        moves = makeMoves(matches, args.ticks, args.seed)
+        result = {"matches": matches, "ticks": args.ticks}
+        scalarRate, states = benchScalar(matches, moves)
+        result["scalar_matches_per_sec"] = round(scalarRate)
+        if np is not None:
+            batchRate, batch = benchBatch(matches, moves)
+            result["batch_matches_per_sec"] = round(batchRate)
+            result["speedup"] = round(batchRate / scalarRate, 2)
+            result["identical"] = all(getattr(batch.state(i), name) == getattr(state, name)
+                                      for i, state in enumerate(states) for name in GameState.__slots__)
+        print(json.dumps(result))
@@ -0,0 +1,146 @@
+# =================================================================================================
+# Purpose:                  Compare ticking the game with simulation.advance and with simulation.sweep
+#                           at lower tick rates
+# Misc:                     Run from the repository root: python benchmarks/sweptBench.py
+#                           For each tick rate it reports how many of 40 serves at a paddle, and of
+#                           520 at the walls, the ball passes through, whether sweep plays exactly
+#                           the same matches as it does at 60 ticks a second, and what a second of
+#                           one match costs.
+# =================================================================================================
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from assets.code.simulation import BALL_SIZE, PADDLE_HEIGHT, TICK_RATE, GameState, advance, isOver, restart, sweep
+
+FIELDS = ['ballX', 'ballY', 'ballVX', 'ballVY', 'leftY', 'rightY', 'lScore', 'rScore', 'sync']
+
+
+# =====================================================================
+# Purpose: Count the serves that pass through a paddle or a wall when the
+#          game ticks rate times a second. advance needs the ball to move
+#          TICK_RATE / rate times as far each tick to keep its pace, so it
+#          can jump over either; sweep covers the ticks in one call.
+# Pre:  rate divides TICK_RATE.
+# Post: Returns, for advance and then sweep, how many of the flat serves
+#       at a paddle in the ball's way scored, and how many of the steep
+#       serves with nobody in the way left the field through a wall.
+# =====================================================================
+def benchTunnelling(rate: int) -> tuple[int, int, int, int]:
+    steps = TICK_RATE // rate
+    results = []
+    for move, pace in ((advance, steps), (sweep, 1)):
+        scored = escaped = 0
+        for ballY in range(100, 380, 7):
+            # flat, straight at paddles centered on the ball
+            state = GameState()
+            state.ballY = ballY
+            state.ballVX *= pace
+            state.leftY = state.rightY = ballY + BALL_SIZE//2 - PADDLE_HEIGHT//2
+            move(state, {}, *([steps] if move is sweep else []))
+            for _ in range(TICK_RATE):
+                if state.lScore + state.rScore:
+                    scored += 1
+                    break
+                move(state, {}, *([steps] if move is sweep else []))
+            for slope in range(1, 14):
+                # steep, both paddles out of the way at the top
+                state = GameState()
+                state.leftY = state.rightY = 10
+                state.ballY, state.ballVY = ballY, slope * pace
+                state.ballVX *= pace
+                for _ in range(TICK_RATE):
+                    move(state, {}, *([steps] if move is sweep else []))
+                    if state.ballY + BALL_SIZE <= 0 or state.ballY >= state.height:
+                        escaped += 1
+                        break
+                    if state.lScore + state.rScore:
+                        break
+        results += [scored, escaped]
+    return tuple(results)
+
+
+# =====================================================================
+# Purpose: Play seeded matches with sweep, the inputs changing rate times
+#          a second, once a call per tick and once a call per 1 / rate s.
+# Pre:  As for benchTunnelling.
+# Post: Returns whether every state at every input change was the same,
+#       and the points played.
+# =====================================================================
+def benchIdentical(rate: int, seconds: int, seed: int) -> tuple[bool, int]:
+    steps = TICK_RATE // rate
+    rng = random.Random(seed)
+    perTick, perCall = GameState(), GameState()
+    points = 0
+    for _ in range(seconds * rate):
+        if isOver(perTick):
+            restart(perTick)
+            restart(perCall)
+        inputs = {role: rng.choice(['', 'up', 'down']) if rng.random() < 0.3 else
+                  ("down" if perTick.ballY > getattr(perTick, role + 'Y') + 20 else "up") for role in ('left', 'right')}
+        scores = perTick.lScore + perTick.rScore
+        for _ in range(steps):
+            sweep(perTick, inputs)
+        sweep(perCall, inputs, steps)
+        points += perTick.lScore + perTick.rScore != scores
+        if any(getattr(perTick, name) != getattr(perCall, name) for name in FIELDS):
+            return False, points
+    return True, points
+
+
+# =====================================================================
+# Purpose: Time a second of one match: TICK_RATE calls to advance,
+#          against rate calls to sweep.
+# Pre:  As for benchTunnelling.
+# Post: Returns microseconds per match second for each.
+# =====================================================================
+def benchCost(rate: int, seconds: int) -> tuple[float, float]:
+    steps = TICK_RATE // rate
+    inputs = {'left': "up", 'right': "down"}
+    state = GameState()
+    start = time.perf_counter()
+    for _ in range(seconds * TICK_RATE):
+        advance(state, inputs)
+        if isOver(state):
+            restart(state)
+    ticked = time.perf_counter() - start
+    state = GameState()
+    start = time.perf_counter()
+    for _ in range(seconds * rate):
+        sweep(state, inputs, steps)
+        if isOver(state):
+            restart(state)
+    swept = time.perf_counter() - start
+    return ticked / seconds * 1e6, swept / seconds * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark per-tick and swept collision at lower tick rates")
+    parser.add_argument("--rates", type=int, nargs="+", default=[60, 30, 20, 15, 12, 10])
+    parser.add_argument("--seconds", type=int, default=600, help="match seconds per run")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    for rate in args.rates:
+        if TICK_RATE % rate:
+            parser.error(f"every rate must divide {TICK_RATE}")
+        tickedScored, tickedEscaped, sweptScored, sweptEscaped = benchTunnelling(rate)
+        identical, points = benchIdentical(rate, args.seconds, args.seed)
+        tickedUs, sweptUs = benchCost(rate, args.seconds)
+        print(json.dumps({
+            "tick_rate": rate,
+            "advance_through_paddle": tickedScored,
+            "sweep_through_paddle": sweptScored,
+            "advance_through_wall": tickedEscaped,
+            "sweep_through_wall": sweptEscaped,
+            "sweep_identical_to_60": identical,
+            "points_compared": points,
+            "advance_us_per_match_second": round(tickedUs, 1),
+            "sweep_us_per_match_second": round(sweptUs, 1),
+        }))
@@ -0,0 +1,336 @@
+# =================================================================================================
+# Purpose:                  A pong client with no window, for load tests and for filling empty rooms
+# Misc:                     Speaks the same protocol as pongClient.py: join request, game info,
+#                           start_game, per-tick state (or input against an authoritative server,
+#                           plus hash reports in lockstep) and rematch. Run one with: python pongBot.py --host 127.0.0.1
+#                           Many bots can share one selector, see benchmarks/loadGen.py.
+# =================================================================================================
+
+import argparse
+import json
+import selectors
+import socket
+import time
+
+from assets.code.wireProtocol import PROTOCOL_JSON, SUPPORTED_PROTOCOLS, DeltaEncoder, FrameReader
+from assets.code.clockSync import ClockSync
+from assets.code.simulation import BALL_SIZE, PADDLE_HEIGHT, GameState, advance, isOver, movePaddle, restart
+from assets.code.timestep import ticksPerSend
+from assets.code.lockstep import LockstepPeer
+
+COUNTDOWN = 3.0         # seconds pongClient spends on its countdown after start_game
+LATENCY_SAMPLE = 10     # every this many state messages carries a send time
+RECEIVE_SIZE = 65536
+MAX_OUTBOX = 4096       # bytes waiting to be sent before new state is skipped
+
+
+# =====================================================================
+# Purpose: Counters shared by every bot in a process, so a load test
+#          can add them up at the end.
+# Pre:  None.
+# Post: Creates zeroed counters.
+# =====================================================================
+class BotStats:
+    def __init__(self) -> None:
+        self.connected = 0
+        self.started = 0            # bots that got start_game
+        self.disconnected = 0       # connections the server closed or that failed
+        self.messagesIn = 0
+        self.bytesIn = 0
+        self.messagesOut = 0
+        self.bytesOut = 0
+        self.statesOut = {}         # relayed state messages sent, by room
+        self.statesIn = {}          # relayed state messages players received, by room
+        self.watchedIn = {}         # relayed state messages spectators received, by room
+        self.dropped = 0            # snapshots skipped over, judging by gaps in the server's sync
+        self.malformed = 0
+        self.latencies = []         # ms from a player sending a sampled state to another bot receiving it
+        self.rtts = []              # ms, round trips of pings to the server
+        self.resyncs = 0            # whole states from a lockstep server, on joining a started match or after a bad hash
+
+    def asDict(self) -> dict:
+        return dict(vars(self))
+
+
+# =====================================================================
+# Purpose: One headless player or spectator. Owns a non-blocking socket
+#          that the caller watches for reads, and plays a tick whenever
+#          tick is called.
+# Pre:  A pongServer must be listening on host and port.
+# Post: Connects and sends the join request. The bot is in the
+#       'joining' phase until the game info arrives.
+# =====================================================================
+class Bot:
+    def __init__(self, host: str, port: int, stats: BotStats, spectate: bool = False, room: int = None,
+                 protocols: list = SUPPORTED_PROTOCOLS, countdown: float = COUNTDOWN) -> None:
+        self.stats = stats
+        self.spectate = spectate
+        self.countdown = countdown
+        self.sock = socket.create_connection((host, port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        request = {'join': 'spectate' if spectate else 'play', 'protocols': protocols}
+        if room is not None:
+            request['room'] = room
+        self.sock.sendall((json.dumps(request) + "\n").encode())
+        self.sock.setblocking(False)
+        stats.connected += 1
+
+        self.reader = FrameReader()
+        self.encoder = DeltaEncoder(PROTOCOL_JSON)  # the join request is JSON whatever format is agreed
+        self.outbox = bytearray()   # bytes the socket would not take yet, kept so frames stay whole
+        self.phase = 'joining'      # then 'waiting' for the opponent, 'countdown' and 'playing'
+        self.role = None
+        self.room = None
+        self.authoritative = False
+        self.peer = None            # LockstepPeer when the server runs the match in lockstep
+        self.sendEvery = 1          # ticks between state messages, from the server's send rate
+        self.owedTick = False       # the opponent's newer state already moved us a tick ahead
+        self.sentSync = 0           # sync of the last state sent
+        self.playAt = 0.0
+        self.game = GameState()
+        self.sentInput = ""
+        self.inputTick = 0
+        self.rematchSent = False
+        self.lastSync = None        # sync of the last snapshot from an authoritative server
+        self.statesSent = 0         # state messages this player sent, its share of stats.statesOut
+        self.clock = ClockSync()
+        self.closed = False
+
+    def fileno(self) -> int:
+        return self.sock.fileno()
+
+    # lost is True when the connection failed rather than being closed by us
+    def close(self, lost: bool = False) -> None:
+        if not self.closed:
+            self.closed = True
+            self.stats.disconnected += lost
+            self.sock.close()
+
+    # count a relayed state, apart for spectators since a server's --spectator-rate may thin theirs out
+    def countStateIn(self) -> None:
+        counts = self.stats.watchedIn if self.spectate else self.stats.statesIn
+        counts[self.room] = counts.get(self.room, 0) + 1
+
+    # queue a message and write what the socket will take, returns whether it was queued
+    def send(self, msg: dict) -> bool:
+        if len(self.outbox) >= MAX_OUTBOX:
+            return False    # the server is not reading, this tick is lost like a dropped frame
+        data = self.encoder.encode(msg)
+        self.outbox += data
+        self.stats.messagesOut += 1
+        self.stats.bytesOut += len(data)
+        self.flush()
+        return True
+
+    def flush(self) -> None:
+        try:
+            sent = self.sock.send(self.outbox)
+        except BlockingIOError:
+            return
+        except OSError:
+            self.close(lost=True)
+            return
+        del self.outbox[:sent]
+
+    # read whatever the server sent
+    def onReadable(self) -> None:
+        try:
+            raw = self.sock.recv(RECEIVE_SIZE)
+        except BlockingIOError:
+            return
+        except OSError:
+            raw = b""
+        if not raw:
+            self.close(lost=True)
+            return
+        now = time.time()
+        self.stats.bytesIn += len(raw)
+        malformed = self.reader.malformed
+        self.reader.feed(raw)
+        while (item := self.reader.next()) is not None:
+            self.stats.messagesIn += 1
+            self.handleMessage(item[0], now)
+        self.stats.malformed += self.reader.malformed - malformed
+        if self.reader.corrupt:
+            self.close(lost=True)
+
+    def handleMessage(self, msg: dict, now: float) -> None:
+        if self.phase == 'joining':
+            # game info is always JSON, the agreed format is used from the next message on
+            self.role = msg.get('role')
+            self.room = msg.get('room')
+            self.authoritative = msg.get('authoritative', False)
+            self.sendEvery = ticksPerSend(msg.get('tickRate', 60), msg.get('sendRate'))
+            if msg.get('lockstep'):
+                self.peer = LockstepPeer(self.game, msg.get('tickRate', 60), msg.get('sendRate'), msg.get('swept', False))
+            self.reader.protocol = msg.get('protocol', PROTOCOL_JSON)
+            self.encoder = DeltaEncoder(self.reader.protocol)
+            self.phase = 'waiting'
+            return
+        if msg.get('start_game'):
+            if self.phase == 'waiting':
+                self.phase = 'countdown'
+                self.playAt = time.monotonic() + self.countdown
+                self.stats.started += 1
+            return
+        if 'pong' in msg:
+            self.clock.onPong(msg)
+            self.stats.rtts.append(self.clock.lastRtt)
+            return
+        if msg.get('rematch'):
+            restart(self.game)
+            if self.peer is not None:
+                self.peer.clear()
+            self.sentSync = 0
+            self.rematchSent = False
+            self.lastSync = None
+            return
+
+        game = self.game
+        if self.peer is not None:
+            if 'turn' in msg:
+                self.countStateIn()
+            self.stats.resyncs += 'resync' in msg
+            self.peer.receive(msg)
+        elif 'leftY' in msg:
+            # snapshot from an authoritative server
+            if self.lastSync is not None and msg['sync'] > self.lastSync + self.sendEvery:
+                self.stats.dropped += (msg['sync'] - self.lastSync) // self.sendEvery - 1
+            self.lastSync = msg['sync']
+            game.ballX, game.ballY = msg['ballX'], msg['ballY']
+            game.leftY, game.rightY = msg['leftY'], msg['rightY']
+            game.lScore, game.rScore, game.sync = msg['lScore'], msg['rScore'], msg['sync']
+        elif 'ballX' in msg:
+            # another player's state, handled the way playGame does
+            self.countStateIn()
+            if 'sentAt' in msg:
+                self.stats.latencies.append((now - msg['sentAt']) * 1000)
+            if msg.get('role') in ('left', 'right') and msg['role'] != self.role:
+                setattr(game, msg['role'] + 'Y', msg['paddleY'])
+            if msg['sync'] > game.sync:
+                self.owedTick = True    # as playGame's FixedTimestep.skip, so adopting it does not speed the game up
+                game.ballX, game.ballY = msg['ballX'], msg['ballY']
+                game.lScore, game.rScore, game.sync = msg['lScore'], msg['rScore'], msg['sync']
+
+    # the move a simple player makes: follow the ball
+    def chooseMove(self) -> str:
+        game = self.game
+        paddleCenter = getattr(game, self.role + 'Y') + PADDLE_HEIGHT//2
+        ballCenter = game.ballY + BALL_SIZE//2
+        if ballCenter > paddleCenter + 5:
+            return "down"
+        if ballCenter < paddleCenter - 5:
+            return "up"
+        return ""
+
+    # play one tick, called at the tick rate by whoever drives the bot
+    def tick(self) -> None:
+        if self.closed or self.phase == 'joining':
+            return
+        if self.outbox:
+            self.flush()
+        ping = self.clock.pingDue()
+        if ping is not None:
+            self.send(ping)
+        if self.peer is not None:
+            # every lockstep peer runs the match, spectators too, one tick per tick when the turns allow
+            for _ in range(self.peer.due(1)):
+                report = self.peer.tick()
+                if report is not None:
+                    self.send(report)
+        if self.spectate or self.role not in ('left', 'right'):
+            return
+        if self.phase == 'countdown' and time.monotonic() >= self.playAt:
+            self.phase = 'playing'
+        if self.phase != 'playing':
+            return
+
+        game = self.game
+        if isOver(game):
+            if not self.rematchSent:
+                self.rematchSent = True
+                self.send({'rematch': True, 'role': self.role})
+            return
+        move = self.chooseMove()
+        if self.authoritative or self.peer is not None:
+            # the server moves everything, it only needs to hear when our input changes
+            self.inputTick += 1
+            if move != self.sentInput:
+                self.sentInput = move
+                self.send({'input': move, 'tick': self.inputTick})
+            return
+
+        if self.owedTick:
+            # the opponent's state already ran this tick for the ball, our paddle still moves in it and gets sent
+            self.owedTick = False
+            setattr(game, self.role + 'Y', movePaddle(getattr(game, self.role + 'Y'), move, game.height))
+        else:
+            advance(game, {self.role: move})
+        if game.sync - self.sentSync < self.sendEvery and not isOver(game):
+            return
+        self.sentSync = game.sync
+        state = {'ballX': game.ballX, 'ballY': game.ballY, 'paddleX': getattr(game, self.role + 'X'),
+                 'paddleY': getattr(game, self.role + 'Y'), 'lScore': game.lScore, 'rScore': game.rScore,
+                 'role': self.role, 'sync': game.sync}
+        if game.sync % LATENCY_SAMPLE == 0:
+            state['sentAt'] = time.time()   # only on some messages, the rest keep their compact binary form
+        if self.send(state):
+            self.statesSent += 1
+            self.stats.statesOut[self.room] = self.stats.statesOut.get(self.room, 0) + 1
+
+
+# =====================================================================
+# Purpose: Drive a set of bots from one selector until a deadline.
+# Pre:  bots are connected Bots. tickRate is how often players send.
+# Post: Returns once duration seconds have passed or every bot closed.
+#       The bots are closed too unless closeAfter is False. Returns the
+#       ticks played and the ticks skipped for running late, which is
+#       how a load test knows the bots, not the server, fell behind.
+# =====================================================================
+def runBots(bots: list[Bot], duration: float, tickRate: int = 60, closeAfter: bool = True) -> tuple[int, int]:
+    selector = selectors.DefaultSelector()
+    for bot in bots:
+        if not bot.closed:
+            selector.register(bot, selectors.EVENT_READ, bot)
+    tickInterval = 1 / tickRate
+    nextTick = time.monotonic()
+    deadline = time.monotonic() + duration
+    ticks = skipped = 0
+    while time.monotonic() < deadline:
+        for key, _ in selector.select(max(0.0, nextTick - time.monotonic())):
+            bot = key.data
+            bot.onReadable()
+            if bot.closed:
+                selector.unregister(bot)
+        now = time.monotonic()
+        if now >= nextTick:
+            behind = int((now - nextTick) / tickInterval)
+            if behind:
+                skipped += behind
+                nextTick += behind * tickInterval   # skip ticks rather than burst
+            nextTick += tickInterval
+            ticks += 1
+            for bot in bots:
+                bot.tick()
+        if not selector.get_map():
+            break
+    selector.close()
+    if closeAfter:
+        for bot in bots:
+            bot.close()
+    return ticks, skipped
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless pong bot")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=65432)
+    parser.add_argument("--watch", action="store_true", help="join as a spectator instead of a player")
+    parser.add_argument("--room", type=int, default=None, help="room to watch")
+    parser.add_argument("--duration", type=float, default=60, help="seconds to stay connected")
+    args = parser.parse_args()
+
+    stats = BotStats()
+    bot = Bot(args.host, args.port, stats, spectate=args.watch, room=args.room)
+    runBots([bot], args.duration)
+    print(json.dumps(stats.asDict() | {'latencies': len(stats.latencies)}))
@@ -9,6 +9,7 @@
 
 import pygame
 import tkinter as tk
+import argparse
 import sys
 import socket
 import json
@@ -20,7 +21,15 @@ class State(Enum):
     WIN = 2
     REMATCH = 3
 
-from assets.code.helperCode import *
+from assets.code.wireProtocol import PROTOCOL_JSON, SUPPORTED_PROTOCOLS, DatagramChannel, DeltaEncoder, FrameReader, encodeMessage
+from assets.code.netSmoothing import PaddlePredictor, SnapshotBuffer, VisualOffset, interpDelay, lerp
+from assets.code.clockSync import ClockSync
+from assets.code.renderer import FieldRenderer
+from assets.code.replay import MatchEvents, Replay, replayStats, scanArchive
+from assets.code.simulation import BALL_SIZE, PADDLE_HEIGHT, PADDLE_WIDTH, WIN_SCORE
+from assets.code.simulation import GameState, advance, isOver, movePaddle, paddleStartY, restart
+from assets.code.timestep import FixedTimestep, ticksPerSend
+from assets.code.lockstep import LockstepPeer
 
 clientBuffer = ""       # buffer to hold received updates
 # colors
@@ -30,37 +39,70 @@ RED = (255,0,0)
 BLUE = (0,0,255)
 
 curState = State.INITIAL
+frameRate = 60      # frames drawn per second, set with --fps; the game itself runs at the server's tick rate
+REPLAY_SPEEDS = [-16, -4, -1, 1, 4, 16]     # playback speeds the arrow keys go through, negative is rewinding
 
 
 
 # =====================================================================
 # Author: Kiara Johnson
 # Purpose: Read any available messages from the server, assemble them
-#          using a buffer, and return complete newline-terminated JSON
-#          messages to the caller.
+#          using the connection's frame reader, and return the complete
+#          messages, decoded, to the caller.
 # Pre: The client socket must be connected and set to non-blocking mode.
-#      The buffer string passed in must contain any previously incomplete data.
-# Post: Returns a list of fully assembled messages and an updated buffer.
-#       Does not modify any global game state.
+#      The reader must hold any previously incomplete data and be set to
+#      the wire format the server picked at join time. udp is the
+#      DatagramChannel carrying game state, or None when it all uses TCP.
+#      latency, if given, is the ClockSync to ping the server for.
+# Post: Returns a list of fully assembled messages, TCP ones first.
+#       Answers to pings go to latency instead of the list. Does not
+#       modify any global game state.
 # =====================================================================
-def checkServer(client: socket.socket, buffer: str) -> tuple[list[str], str]:
+def checkServer(client: socket.socket, reader: FrameReader, udp: DatagramChannel = None,
+                latency: ClockSync = None) -> list[dict]:
     try:                                    # try to receive data from server
-        data = client.recv(4096).decode()       
-        if not data:
-            return [], buffer  
-
-        buffer += data                      # add new update to buffer
-        updates = []
-
-        while "\n" in buffer:
-            msg, buffer = buffer.split("\n", 1)
-            if msg.strip():
-                updates.append(msg)
+        data = client.recv(4096)
+        if data:
+            reader.feed(data)               # add new update to the reader
+    except BlockingIOError:
+        pass
+    messages = reader.messages()
+    if udp is not None:
+        messages.extend(udp.receive())      # state datagrams, already in order and deduplicated
+    if latency is not None:
+        if any('pong' in msg for msg in messages):
+            for msg in messages:
+                if 'pong' in msg:
+                    latency.onPong(msg)
+            messages = [msg for msg in messages if 'pong' not in msg]
+        ping = latency.pingDue()
+        if ping is not None:
+            try:
+                client.send(encodeMessage(ping, reader.protocol))
+            except BlockingIOError:
+                pass    # try again with the next ping
+    return messages
 
-        return updates, buffer
+# =====================================================================
+# Purpose: Show the round trip time to the server in the bottom corner.
+# Pre:  latency is the game's ClockSync. font is the font to use.
+# Post: Draws with renderer. Nothing is drawn before the first answer.
+# =====================================================================
+def drawLatency(renderer: FieldRenderer, font: pygame.font.Font, latency: ClockSync) -> None:
+    if latency.rtt is None:
+        return
+    renderer.text(font, f"{round(latency.rtt)} ms", WHITE, bottomleft=(15, renderer.screen.get_height() - 15))
 
-    except BlockingIOError:
-        return [], buffer  
+# =====================================================================
+# Purpose: Move the rectangles the game is drawn with to where the game
+#          state has the ball and paddles.
+# Pre:  game is the GameState being shown.
+# Post: ball, leftPaddle and rightPaddle are updated in place.
+# =====================================================================
+def placeRects(game: GameState, ball: pygame.Rect, leftPaddle: pygame.Rect, rightPaddle: pygame.Rect) -> None:
+    ball.topleft = (game.ballX, game.ballY)
+    leftPaddle.topleft = (game.leftX, game.leftY)
+    rightPaddle.topleft = (game.rightX, game.rightY)
 
 # =====================================================================
 # Author: Andy Zheng
@@ -68,15 +110,18 @@ def checkServer(client: socket.socket, buffer: str) -> tuple[list[str], str]:
 #          assigned to. Waits for server signal that both players are 
 #          connected before starting countdown.
 # Pre: The client socket must be connected. Role must be "left", "right",
-#      or "spectator". The tk app window must exist.
+#      or "spectator". The tk app window must exist. room is the
+#      server's room number, or None if the server has no rooms.
+#      reader holds anything received after the game info.
 # Post: Displays role assignment screen, waits for start signal from 
 #       server, shows 3-second countdown, then closes window to begin game.
+#       Anything received after the start signal stays in reader.
 # =====================================================================
 
-def showRoleScreen(role: str, app: tk.Tk, client: socket.socket) -> None:
+def showRoleScreen(role: str, app: tk.Tk, client: socket.socket, reader: FrameReader, room: int = None) -> None:
     # Create new window for role display
     roleWindow = tk.Toplevel(app)
-    roleWindow.title("Player Assignment")
+    roleWindow.title("Player Assignment" if room is None else f"Player Assignment - Room {room}")
     roleWindow.geometry("400x300")
     
     # Role-specific colors and text
@@ -154,14 +199,20 @@ def showRoleScreen(role: str, app: tk.Tk, client: socket.socket) -> None:
     # Function to check for server start signal
     def check_for_start():
         try:
-            data = client.recv(1024).decode()
-            if data:
-                msg = json.loads(data.strip())
+            # the start signal may have arrived together with the game info
+            item = reader.next()
+            if item is None:
+                reader.feed(client.recv(1024))
+                item = reader.next()
+            while item is not None:
+                msg = item[0]
                 if 'start_game' in msg and msg['start_game']:
+                    # anything sent after the start signal stays in the reader for the game loop
                     # Both players connected, start countdown
                     waitLabel.config(text="Both players connected!")
                     countdown(3)
                     return
+                item = reader.next()
         except BlockingIOError:
             pass
         except:
@@ -196,13 +247,27 @@ def showRoleScreen(role: str, app: tk.Tk, client: socket.socket) -> None:
 # Pre:     The client socket must be connected and non-blocking.
 #          screenWidth and screenHeight must match the server-provided
 #          dimensions. playerPaddle must be "left" or "right".
-# Post:    Sends continuous game state updates to the server.
-#          Returns only when the user quits the window.   
+#          authoritative is True when the server runs the physics.
+#          udp is the DatagramChannel for game state, or None.
+#          tickRate is how many sync steps the game makes per second,
+#          and sendRate how many game states are sent per second (every
+#          tick when None). lockstep is True when the server sends
+#          turns and the game is run here from the inputs in them, and
+#          swept when it runs the match with simulation.sweep.
+# Post:    Runs the game tickRate times a second and draws it frameRate
+#          times a second. Sends game state updates to the server
+#          sendRate times a second, or only paddle input changes when
+#          the server is authoritative or runs the match in lockstep.
+#          Returns only when the user quits the window.
 # =====================================================================
 
-def playGame(screenWidth:int, screenHeight:int, playerPaddle:str, client:socket.socket) -> None:
+def playGame(screenWidth:int, screenHeight:int, playerPaddle:str, client:socket.socket, reader:FrameReader = None,
+             authoritative:bool = False, udp:DatagramChannel = None, tickRate:int = 60, sendRate:float = None,
+             lockstep:bool = False, swept:bool = False) -> None:
     
-    clientBuffer = ""   # buffer used for checking server
+    reader = reader or FrameReader()    # data received but not yet processed
+    protocol = reader.protocol
+    stateEncoder = DeltaEncoder(protocol)   # in bin2, sends only what changed since the last state
     # Pygame inits
     pygame.mixer.pre_init(44100, -16, 2, 2048)
     pygame.init()
@@ -210,48 +275,50 @@ def playGame(screenWidth:int, screenHeight:int, playerPaddle:str, client:socket.
     # Constants
     clock = pygame.time.Clock()
     scoreFont = pygame.font.Font("./assets/fonts/pong-score.ttf", 32)
+    latencyFont = pygame.font.Font("./assets/fonts/visitor.ttf", 16)
     winFont = pygame.font.Font("./assets/fonts/visitor.ttf", 48)
     pointSound = pygame.mixer.Sound("./assets/sounds/point.wav")
     bounceSound = pygame.mixer.Sound("./assets/sounds/bounce.wav")
 
     # Display objects
     screen = pygame.display.set_mode((screenWidth, screenHeight))
-    winMessage = pygame.Rect(0,0,0,0)
-    topWall = pygame.Rect(-10,0,screenWidth+20, 10)
-    bottomWall = pygame.Rect(-10, screenHeight-10, screenWidth+20, 10)
-    centerLine = []
-    for i in range(0, screenHeight, 10):
-        centerLine.append(pygame.Rect((screenWidth/2)-5,i,5,5))
-
-    # Paddle properties and init
-    paddleHeight = 50
-    paddleWidth = 10
-    paddleStartPosY = (screenHeight/2)-(paddleHeight/2)
-    leftPaddle = Paddle(pygame.Rect(10,paddleStartPosY, paddleWidth, paddleHeight))
-    rightPaddle = Paddle(pygame.Rect(screenWidth-20, paddleStartPosY, paddleWidth, paddleHeight))
-
-    ball = Ball(pygame.Rect(screenWidth/2, screenHeight/2, 5, 5), -5, 0)
-
-    if playerPaddle == "left":
-        opponentPaddleObj = rightPaddle
-        playerPaddleObj = leftPaddle
-    else:
-        opponentPaddleObj = leftPaddle
-        playerPaddleObj = rightPaddle
+    renderer = FieldRenderer(screen, BG_COLOR, WHITE)   # the walls and center line are drawn once, in here
+
+    # the game itself lives in game, these rectangles only show it
+    game = GameState(screenWidth, screenHeight)
+    leftPaddle = pygame.Rect(game.leftX, game.leftY, PADDLE_WIDTH, PADDLE_HEIGHT)
+    rightPaddle = pygame.Rect(game.rightX, game.rightY, PADDLE_WIDTH, PADDLE_HEIGHT)
+    ball = pygame.Rect(game.ballX, game.ballY, BALL_SIZE, BALL_SIZE)
+    opponentPaddle = "right" if playerPaddle == "left" else "left"
+    ownPaddle = leftPaddle if playerPaddle == "left" else rightPaddle
+    moving = ""     # our paddle input, "up", "down" or ""
+
+    # the game moves a fixed tick at a time however long frames take, and is drawn between the last two ticks
+    physics = FixedTimestep(tickRate)
+    sendEvery = ticksPerSend(tickRate, sendRate)    # ticks between our game state updates
+    drawnFrom = None    # ball x, ball y and our paddle's y before the last tick
+    sentSync = 0        # sync of the last game state we sent
+
+    # whatever the network moves is drawn from a buffer of updates rather than snapped to the newest one
+    remote = SnapshotBuffer(tickRate, interpDelay(sendRate))    # the opponent's paddle, and the ball when the server is authoritative
+    ballOffset = VisualOffset()         # eases out corrections to our own ball
+    predictor = None                    # moves our paddle before an authoritative server hears about it
+    if authoritative:
+        predictor = PaddlePredictor(paddleStartY(screenHeight), screenHeight, tickRate)
+    latency = ClockSync()               # round trip time to the server
+    peer = LockstepPeer(game, tickRate, sendRate, swept) if lockstep else None     # runs the game from the server's turns
 
     # game state information
-    lScore = 0
-    rScore = 0
-    sync = 0
     gameState = {}
     requestSent = False
+    sentInput = ""      # last paddle input sent to an authoritative server
     curState = State.PLAYING
 
     while True:
         # game loop
         if curState == State.PLAYING: 
-            # Wiping the screen
-            screen.fill(BG_COLOR)
+            # Wiping what the last frame drew
+            renderer.begin()
 
             # Getting keypress events
             for event in pygame.event.get():
@@ -260,166 +327,192 @@ def playGame(screenWidth:int, screenHeight:int, playerPaddle:str, client:socket.
                     sys.exit()
                 elif event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_DOWN or event.key == pygame.K_s:
-                        playerPaddleObj.moving = "down"
+                        moving = "down"
 
                     elif event.key == pygame.K_UP or event.key == pygame.K_w:
-                        playerPaddleObj.moving = "up"
+                        moving = "up"
 
                 elif event.type == pygame.KEYUP:
-                    playerPaddleObj.moving = ""
+                    moving = ""
+
+            # an authoritative or lockstep server only needs to hear when our input changes
+            if (authoritative or lockstep) and moving != sentInput:
+                sentInput = moving
+                client.send(encodeMessage({'input': sentInput, 'tick': predictor.tick if predictor else game.sync}, protocol))
 
             # =========================================================================================
             # Get updates from server
-            updates, clientBuffer = checkServer(client, clientBuffer)
-            for newGameState in updates:
-                newStateJSON = json.loads(newGameState)
+            updates = checkServer(client, reader, udp, latency)
+            adopted = False     # took a newer sync from the opponent, which our state has to follow
+            for newStateJSON in updates:
+
+                # turns and resyncs drive the game below
+                if lockstep:
+                    peer.receive(newStateJSON)
+                    continue
+
+                # server snapshots hold the whole game, use them as they are
+                if authoritative:
+                    if 'leftY' not in newStateJSON:
+                        continue
+                    if newStateJSON['lScore'] != game.lScore or newStateJSON['rScore'] != game.rScore:
+                        pointSound.play()
+                    if newStateJSON.get('bounce'):
+                        bounceSound.play()
+                    remote.push(newStateJSON['sync'], {'ballX': newStateJSON['ballX'], 'ballY': newStateJSON['ballY'],
+                                                       'paddleY': newStateJSON[opponentPaddle + 'Y']})
+                    if playerPaddle + 'Ack' in newStateJSON:
+                        predictor.reconcile(newStateJSON[playerPaddle + 'Y'], newStateJSON[playerPaddle + 'Ack'])
+                    else:
+                        predictor.reset(newStateJSON[playerPaddle + 'Y'])   # server too old to predict against
+                    game.lScore = newStateJSON['lScore']
+                    game.rScore = newStateJSON['rScore']
+                    game.sync = newStateJSON['sync']
+                    continue
 
                 # parse received information
                 oppBallX = newStateJSON['ballX']
                 oppBallY = newStateJSON['ballY']
-                oppX = newStateJSON['paddleX']
                 oppY = newStateJSON['paddleY']
                 oppLscore = newStateJSON['lScore']
                 oppRscore = newStateJSON['rScore']
                 oppSync = newStateJSON['sync']
 
-                # update opponent's paddle coordinates regardless of sync
-                opponentPaddleObj.rect.x = oppX
-                opponentPaddleObj.rect.y = oppY
+                # update opponent's paddle regardless of sync, it is taken from the buffer below
+                remote.push(oppSync, {'paddleY': oppY})
 
                 # update ball position, scores, and sync only if received sync is greater than client's sync
-                if oppSync > sync:
-                    ball.rect.x = oppBallX
-                    ball.rect.y = oppBallY
-                    lScore = oppLscore
-                    rScore = oppRscore
-                    sync = oppSync
+                if oppSync > game.sync:
+                    physics.skip(oppSync - game.sync)
+                    # the ticks we skip are ours too, our paddle still moves in them
+                    ownY = getattr(game, playerPaddle + 'Y')
+                    for _ in range(oppSync - game.sync):
+                        ownY = movePaddle(ownY, moving, screenHeight)
+                    setattr(game, playerPaddle + 'Y', ownY)
+                    adopted = True
+                    ballOffset.correct(game.ballX, game.ballY, oppBallX, oppBallY)
+                    game.ballX = oppBallX
+                    game.ballY = oppBallY
+                    game.lScore = oppLscore
+                    game.rScore = oppRscore
+                    game.sync = oppSync
             # =========================================================================================
 
-            # Update the player paddle and opponent paddle's location on the screen
-            for paddle in [playerPaddleObj, opponentPaddleObj]:
-                if paddle.moving == "down":
-                    if paddle.rect.bottomleft[1] < screenHeight-10:
-                        paddle.rect.y += paddle.speed
-                elif paddle.moving == "up":
-                    if paddle.rect.topleft[1] > 10:
-                        paddle.rect.y -= paddle.speed
+            # remote objects where they were a moment ago, between the updates on either side
+            smoothed = remote.sample()
+            if smoothed is not None:
+                setattr(game, opponentPaddle + 'Y', round(smoothed['paddleY']))
+                if authoritative:
+                    game.ballX = round(smoothed['ballX'])
+                    game.ballY = round(smoothed['ballY'])
+            if authoritative:
+                predictor.advance(moving)
+                setattr(game, playerPaddle + 'Y', round(predictor.y))
 
             # If the game is over, display the win message
-            if lScore > 4 or rScore > 4:
+            if isOver(game):
                 curState = State.WIN
 
-            else:
-
-                # ==== Ball Logic =====================================================================
-                ball.updatePos()
+            # the authoritative server runs the game, otherwise move the paddles and ball ourselves,
+            # as many ticks as are due. The state goes to the opponent every sendEvery ticks, and when it ends the match
+            ticks = physics.due()
+            if lockstep:
+                # both paddles and the ball, as far as the server's turns go
+                for _ in range(peer.due(ticks)):
+                    drawnFrom = (game.ballX, game.ballY, getattr(game, playerPaddle + 'Y'))
+                    scores = (game.lScore, game.rScore)
+                    report = peer.tick()
+                    if report is not None:
+                        client.send(encodeMessage(report, protocol))
+                    if (game.lScore, game.rScore) != scores:
+                        pointSound.play()
+                    if game.bounced:
+                        bounceSound.play()
+            elif not authoritative:
+                for _ in range(ticks):
+                    drawnFrom = (game.ballX, game.ballY, getattr(game, playerPaddle + 'Y'))
+                    scores = (game.lScore, game.rScore)
+                    advance(game, {playerPaddle: moving})
+                    if (game.lScore, game.rScore) != scores:
+                        pointSound.play()
+                    if game.bounced:
+                        bounceSound.play()
 
-                # If the ball makes it past the edge of the screen, update score, etc.
-                if ball.rect.x > screenWidth:
-                    lScore += 1
-                    pointSound.play()
-                    ball.reset(nowGoing="left")
-                elif ball.rect.x < 0:
-                    rScore += 1
-                    pointSound.play()
-                    ball.reset(nowGoing="right")
-                
-                # If the ball hits a paddle
-                if ball.rect.colliderect(playerPaddleObj.rect):
-                    bounceSound.play()
-                    ball.hitPaddle(playerPaddleObj.rect.center[1])
-                elif ball.rect.colliderect(opponentPaddleObj.rect):
-                    bounceSound.play()
-                    ball.hitPaddle(opponentPaddleObj.rect.center[1])
-                
-                # If the ball hits a wall
-                if ball.rect.colliderect(topWall) or ball.rect.colliderect(bottomWall):
-                    bounceSound.play()
-                    ball.hitWall()
-            
-                
-                # ==== End Ball Logic =================================================================
             # Drawing
-            pygame.draw.rect(screen, WHITE, ball)
-            # Drawing the dotted line in the center
-            for i in centerLine:
-                pygame.draw.rect(screen, WHITE, i)
+            placeRects(game, ball, leftPaddle, rightPaddle)
+            if drawnFrom is not None:
+                # as far between the last two ticks as the clock is into the next one
+                alpha = physics.alpha
+                ball.topleft = (round(lerp(drawnFrom[0], game.ballX, alpha)), round(lerp(drawnFrom[1], game.ballY, alpha)))
+                ownPaddle.y = round(lerp(drawnFrom[2], ownPaddle.y, alpha))
+            renderer.rect(WHITE, ball.move(ballOffset.step()))
         
             # Drawing the player's new location
-            pygame.draw.rect(screen, RED, leftPaddle)
-            pygame.draw.rect(screen, BLUE, rightPaddle)
+            renderer.rect(RED, leftPaddle)
+            renderer.rect(BLUE, rightPaddle)
+
+            renderer.score(scoreFont, game.lScore, game.rScore, WHITE)
+            drawLatency(renderer, latencyFont, latency)
+            renderer.present()
 
-            pygame.draw.rect(screen, WHITE, topWall)
-            pygame.draw.rect(screen, WHITE, bottomWall)
-            scoreRect = updateScore(lScore, rScore, screen, WHITE, scoreFont)
-            pygame.display.flip()
+            clock.tick(frameRate)
 
-            clock.tick(60)
+            # the authoritative server keeps sync and the game state itself, a lockstep one only needs our input
+            if authoritative or lockstep or not (ticks or adopted) or (game.sync - sentSync < sendEvery and not isOver(game)):
+                continue
+            sentSync = game.sync - (game.sync - sentSync) % sendEvery    # keep to the cadence when a frame ran several ticks
         
-            # This number should be synchronized between you and your opponent.  If your number is larger
-            # then you are ahead of them in time, if theirs is larger, they are ahead of you, and you need to
-            # catch up (use their info)
-            sync += 1
+            # sync was advanced with the game above. This number should be synchronized between you and
+            # your opponent.  If your number is larger then you are ahead of them in time, if theirs is
+            # larger, they are ahead of you, and you need to catch up (use their info)
             # =========================================================================================
             # Send your server update here at the end of the game loop to sync your game with your
             # opponent's game
 
             # pack game state information into a dictionary
-            gameState['ballX'] = ball.rect.x
-            gameState['ballY'] = ball.rect.y
-            gameState['paddleX'] = playerPaddleObj.rect.x
-            gameState['paddleY'] = playerPaddleObj.rect.y
-            gameState['lScore'] = lScore
-            gameState['rScore'] = rScore
+            gameState['ballX'] = game.ballX
+            gameState['ballY'] = game.ballY
+            gameState['paddleX'] = getattr(game, playerPaddle + 'X')
+            gameState['paddleY'] = getattr(game, playerPaddle + 'Y')
+            gameState['lScore'] = game.lScore
+            gameState['rScore'] = game.rScore
             gameState['role'] = playerPaddle
-            gameState['sync'] = sync
-            gameStateStr = json.dumps(gameState)    # stringify dictionary and send to server
-            client.send((gameStateStr + "\n").encode())
+            gameState['sync'] = game.sync
+            if udp is not None:
+                udp.send(gameState)     # a lost update is replaced by the next frame's
+            else:
+                client.send(stateEncoder.encode(gameState))     # encode dictionary and send to server
 
         elif curState == State.WIN:
-            pygame.draw.rect(screen, WHITE, ball)
-            # Drawing the dotted line in the center
-            for i in centerLine:
-                pygame.draw.rect(screen, WHITE, i)
+            renderer.begin()
+            renderer.rect(WHITE, ball)
         
             # Drawing the player's new location
-            pygame.draw.rect(screen, RED, leftPaddle)
-            pygame.draw.rect(screen, BLUE, rightPaddle)
-
-            pygame.draw.rect(screen, WHITE, topWall)
-            pygame.draw.rect(screen, WHITE, bottomWall)
-            scoreRect = updateScore(lScore, rScore, screen, WHITE, scoreFont)
-            winText = "Player 1 Wins! " if lScore > 4 else "Player 2 Wins! "
-            winColor = RED if lScore > 4 else BLUE
-            textSurface = winFont.render(winText, False, winColor, BG_COLOR)
-            textRect = textSurface.get_rect()
-            textRect.center = ((screenWidth/2), screenHeight/2)
-            winMessage = screen.blit(textSurface, textRect)
-            pygame.display.flip()
+            renderer.rect(RED, leftPaddle)
+            renderer.rect(BLUE, rightPaddle)
+
+            renderer.score(scoreFont, game.lScore, game.rScore, WHITE)
+            winText = "Player 1 Wins! " if game.lScore >= WIN_SCORE else "Player 2 Wins! "
+            winColor = RED if game.lScore >= WIN_SCORE else BLUE
+            renderer.text(winFont, winText, winColor, BG_COLOR, center=((screenWidth/2), screenHeight/2))
+            renderer.present()
             pygame.time.wait(3000)
             curState = State.REMATCH
-            clock.tick(60)
+            clock.tick(frameRate)
 
         elif curState == State.REMATCH:
              # Drawing
-            pygame.draw.rect(screen, WHITE, ball)
-            # Drawing the dotted line in the center
-            for i in centerLine:
-                pygame.draw.rect(screen, WHITE, i)
+            renderer.begin()
+            renderer.rect(WHITE, ball)
         
             # Drawing the player's new location
-            pygame.draw.rect(screen, RED, leftPaddle)
-            pygame.draw.rect(screen, BLUE, rightPaddle)
+            renderer.rect(RED, leftPaddle)
+            renderer.rect(BLUE, rightPaddle)
 
-            pygame.draw.rect(screen, WHITE, topWall)
-            pygame.draw.rect(screen, WHITE, bottomWall)
-            scoreRect = updateScore(lScore, rScore, screen, WHITE, scoreFont)
+            renderer.score(scoreFont, game.lScore, game.rScore, WHITE)
             winText = "Press space to play again"
-            textSurface = winFont.render(winText, False, WHITE, BG_COLOR)
-            textRect = textSurface.get_rect()
-            textRect.center = ((screenWidth/2), screenHeight/2)
-            winMessage = screen.blit(textSurface, textRect)
-            pygame.display.flip()
+            renderer.text(winFont, winText, WHITE, BG_COLOR, center=((screenWidth/2), screenHeight/2))
+            renderer.present()
 
             
             for event in pygame.event.get():
@@ -432,26 +525,30 @@ def playGame(screenWidth:int, screenHeight:int, playerPaddle:str, client:socket.
                         rematchRequest = {}
                         rematchRequest['rematch'] = True
                         rematchRequest['role'] = playerPaddle
-                        rematchStr = json.dumps(rematchRequest)
-                        client.send((rematchStr + "\n").encode())
+                        client.send(encodeMessage(rematchRequest, protocol))
                         requestSent = True
             if requestSent:
-                updates, clientBuffer = checkServer(client, clientBuffer)
+                updates = checkServer(client, reader, udp, latency)
 
-                for rematchInfo in updates:
-                    rematchJSON = json.loads(rematchInfo)
+                for index, rematchJSON in enumerate(updates):
                     if 'rematch' in rematchJSON and rematchJSON['rematch']:
-                        lScore = 0
-                        rScore = 0
-                        sync = 0
+                        restart(game)
+                        placeRects(game, ball, leftPaddle, rightPaddle)
                         gameState = {}
-                        ball.reset("left")
-                        opponentPaddleObj.rect.y = paddleStartPosY
-                        playerPaddleObj.rect.y = paddleStartPosY
+                        remote.clear()
+                        physics.reset()
+                        drawnFrom = None
+                        sentSync = 0
+                        if predictor is not None:
+                            predictor.reset(game.leftY)
+                        if peer is not None:
+                            peer.clear()
+                            for turn in updates[index + 1:]:
+                                peer.receive(turn)  # the new match may already have started
                         curState = State.PLAYING
                         requestSent = False
                         break   # break out of the for loop
-            clock.tick(60)
+            clock.tick(frameRate)
 
                    
 
@@ -461,13 +558,21 @@ def playGame(screenWidth:int, screenHeight:int, playerPaddle:str, client:socket.
 # Purpose: Run a spectator view of the Pong game, receiving updates from
 #          the server and rendering the current game state without
 #          sending any inputs back.
-# Pre:  Client socket must be connected.
+# Pre:  Client socket must be connected. authoritative is True when the
+#       server runs the physics and sends full snapshots. udp is the
+#       DatagramChannel for game state, or None. tickRate is how many
+#       sync steps the server or players make per second, and sendRate
+#       how many updates of each kind arrive per second. lockstep is
+#       True when the server sends turns to run the game from, and
+#       swept when it runs the match with simulation.sweep.
 # Post: Continuously displays the latest server game state until the user
 #       closes the window, then exits the program.
 # =====================================================================
-def watchGame(screenWidth:int, screenHeight:int, client:socket.socket) -> None:
+def watchGame(screenWidth:int, screenHeight:int, client:socket.socket, reader:FrameReader = None,
+              authoritative:bool = False, udp:DatagramChannel = None, tickRate:int = 60, sendRate:float = None,
+              lockstep:bool = False, swept:bool = False) -> None:
     
-    clientBuffer = ""   # buffer for checking server
+    reader = reader or FrameReader()    # data received but not yet processed
     # Pygame inits
     pygame.mixer.pre_init(44100, -16, 2, 2048)
     pygame.init()
@@ -476,37 +581,35 @@ def watchGame(screenWidth:int, screenHeight:int, client:socket.socket) -> None:
     
     clock = pygame.time.Clock()
     scoreFont = pygame.font.Font("./assets/fonts/pong-score.ttf", 32)
+    latencyFont = pygame.font.Font("./assets/fonts/visitor.ttf", 16)
     winFont = pygame.font.Font("./assets/fonts/visitor.ttf", 48)
     pointSound = pygame.mixer.Sound("./assets/sounds/point.wav")
     bounceSound = pygame.mixer.Sound("./assets/sounds/bounce.wav")
 
     # Display objects
     screen = pygame.display.set_mode((screenWidth, screenHeight))
-    winMessage = pygame.Rect(0,0,0,0)
-    topWall = pygame.Rect(-10,0,screenWidth+20, 10)
-    bottomWall = pygame.Rect(-10, screenHeight-10, screenWidth+20, 10)
-    centerLine = []
-    for i in range(0, screenHeight, 10):
-        centerLine.append(pygame.Rect((screenWidth/2)-5,i,5,5))
-
-    # Paddle properties and init
-    paddleHeight = 50
-    paddleWidth = 10
-    paddleStartPosY = (screenHeight/2)-(paddleHeight/2)
-    leftPaddle = Paddle(pygame.Rect(10,paddleStartPosY, paddleWidth, paddleHeight))
-    rightPaddle = Paddle(pygame.Rect(screenWidth-20, paddleStartPosY, paddleWidth, paddleHeight))
-
-    ball = Ball(pygame.Rect(screenWidth/2, screenHeight/2, 5, 5), -5, 0)
-
-    # game state information
-    lScore = 0
-    rScore = 0
-    sync = 0    # used to ensure client is up-to-date, won't be sent to server
+    renderer = FieldRenderer(screen, BG_COLOR, WHITE)   # the walls and center line are drawn once, in here
+
+    # the game itself lives in game, these rectangles only show it
+    game = GameState(screenWidth, screenHeight)     # its sync is used to ensure client is up-to-date
+    leftPaddle = pygame.Rect(game.leftX, game.leftY, PADDLE_WIDTH, PADDLE_HEIGHT)
+    rightPaddle = pygame.Rect(game.rightX, game.rightY, PADDLE_WIDTH, PADDLE_HEIGHT)
+    ball = pygame.Rect(game.ballX, game.ballY, BALL_SIZE, BALL_SIZE)
+
+    # each sender's updates are buffered and drawn a moment behind, so late ones do not show
+    delay = interpDelay(sendRate)
+    buffers = {'left': SnapshotBuffer(tickRate, delay), 'right': SnapshotBuffer(tickRate, delay)}
+    snapshots = SnapshotBuffer(tickRate, delay)     # the whole game from an authoritative server
+    physics = FixedTimestep(tickRate)       # moves the ball between the players' updates
+    drawnFrom = None                        # the ball's x and y before the last tick
+    ballOffset = VisualOffset()
+    latency = ClockSync()                   # round trip time to the server
+    peer = LockstepPeer(game, tickRate, sendRate, swept) if lockstep else None     # runs the game from the server's turns
     
 
     while True:
-        # Wiping the screen
-        screen.fill(BG_COLOR)
+        # Wiping what the last frame drew
+        renderer.begin()
 
         # Getting keypress events
         for event in pygame.event.get():
@@ -517,106 +620,223 @@ def watchGame(screenWidth:int, screenHeight:int, client:socket.socket) -> None:
 
         # =========================================================================================
         # Get updates from server
-        updates, clientBuffer = checkServer(client, clientBuffer)  # get an update from the server
-        for newGameState in updates:
-            newStateJSON = json.loads(newGameState)
+        updates = checkServer(client, reader, udp, latency)    # get an update from the server
+        for newStateJSON in updates:
             # new game starting
             if 'rematch' in newStateJSON and newStateJSON['rematch']:
-                lScore = 0
-                rScore = 0
-                sync = 0
-                gameState = {}
-                ball.reset("left")
-                leftPaddle.rect.y = paddleStartPosY
-                rightPaddle.rect.y = paddleStartPosY
+                restart(game)
+                physics.reset()
+                drawnFrom = None
+                snapshots.clear()
+                for buffer in buffers.values():
+                    buffer.clear()
+                if peer is not None:
+                    peer.clear()
+
+            # a turn or a resync of a lockstep match
+            elif peer is not None:
+                peer.receive(newStateJSON)
+
+            # snapshot from an authoritative server, holds the whole game
+            elif 'leftY' in newStateJSON:
+                if newStateJSON['lScore'] != game.lScore or newStateJSON['rScore'] != game.rScore:
+                    pointSound.play()
+                if newStateJSON.get('bounce'):
+                    bounceSound.play()
+                snapshots.push(newStateJSON['sync'], {key: newStateJSON[key] for key in ('ballX', 'ballY', 'leftY', 'rightY')})
+                game.lScore = newStateJSON['lScore']
+                game.rScore = newStateJSON['rScore']
+                game.sync = newStateJSON['sync']
 
             # update for existing game
             else:
                 # parse received information
                 ballX = newStateJSON['ballX']
                 ballY = newStateJSON['ballY']
-                paddleX = newStateJSON['paddleX']
                 paddleY = newStateJSON['paddleY']
                 newLscore = newStateJSON['lScore']
                 newRScore = newStateJSON['rScore']
                 newSync = newStateJSON['sync']
                 side = newStateJSON['role']
 
-                # update paddle coordinates regardless of sync
-                if side == 'left':
-                    leftPaddle.rect.x = paddleX
-                    leftPaddle.rect.y = paddleY
-                elif side == 'right':
-                    rightPaddle.rect.x = paddleX
-                    rightPaddle.rect.y = paddleY
+                # update paddle regardless of sync, it is taken from the buffers below
+                if side in buffers:
+                    buffers[side].push(newSync, {'paddleY': paddleY})
 
                 # update ball coordinates, score, and sync only if received sync is greater than client's sync
-                if newSync > sync:
-                    ball.rect.x = ballX
-                    ball.rect.y = ballY
-                    lScore = newLscore
-                    rScore = newRScore
-                    sync = newSync
+                if newSync > game.sync:
+                    ballOffset.correct(game.ballX, game.ballY, ballX, ballY)
+                    drawnFrom = None    # the offset eases the jump already
+                    game.ballX = ballX
+                    game.ballY = ballY
+                    game.lScore = newLscore
+                    game.rScore = newRScore
+                    game.sync = newSync
         # =========================================================================================
 
+        # draw everything where it was a moment ago, between the updates on either side
+        smoothed = snapshots.sample()
+        if smoothed is not None:
+            game.ballX = round(smoothed['ballX'])
+            game.ballY = round(smoothed['ballY'])
+            game.leftY = round(smoothed['leftY'])
+            game.rightY = round(smoothed['rightY'])
+        for side, buffer in buffers.items():
+            smoothed = buffer.sample()
+            if smoothed is not None:
+                setattr(game, side + 'Y', round(smoothed['paddleY']))
 
         # If the game is over, display the win message
-        if lScore > 4 or rScore > 4:
-            winText = "Player 1 Wins! " if lScore > 4 else "Player 2 Wins! "
-            winColor = RED if lScore > 4 else BLUE
-            textSurface = winFont.render(winText, False, winColor, BG_COLOR)
-            textRect = textSurface.get_rect()
-            textRect.center = ((screenWidth/2), screenHeight/2)
-            winMessage = screen.blit(textSurface, textRect)
+        over = isOver(game)
+        if over:
+            winText = "Player 1 Wins! " if game.lScore >= WIN_SCORE else "Player 2 Wins! "
+            winColor = RED if game.lScore >= WIN_SCORE else BLUE
+            renderer.text(winFont, winText, winColor, BG_COLOR, center=((screenWidth/2), screenHeight/2))
+
+        elif lockstep:
+            # the whole game, as far as the server's turns go
+            for _ in range(peer.due(physics.due())):
+                drawnFrom = (game.ballX, game.ballY)
+                scores = (game.lScore, game.rScore)
+                report = peer.tick()
+                if report is not None:
+                    client.send(encodeMessage(report, reader.protocol))     # spectators are checked too
+                if (game.lScore, game.rScore) != scores:
+                    pointSound.play()
+                if game.bounced:
+                    bounceSound.play()
 
-        else:
+        elif not authoritative:
 
             # ==== Ball Logic =====================================================================
-            ball.updatePos()
-
-            # If the ball makes it past the edge of the screen, update score, etc.
-            if ball.rect.x > screenWidth:
-                lScore += 1
-                pointSound.play()
-                ball.reset(nowGoing="left")
-            elif ball.rect.x < 0:
-                rScore += 1
-                pointSound.play()
-                ball.reset(nowGoing="right")
-                
-            # If the ball hits a paddle
-            if ball.rect.colliderect(leftPaddle.rect):
-                bounceSound.play()
-                ball.hitPaddle(leftPaddle.rect.center[1])
-            elif ball.rect.colliderect(rightPaddle.rect):
-                bounceSound.play()
-                ball.hitPaddle(rightPaddle.rect.center[1])
-                
-            # If the ball hits a wall
-            if ball.rect.colliderect(topWall) or ball.rect.colliderect(bottomWall):
-                bounceSound.play()
-                ball.hitWall()
-            
-            pygame.draw.rect(screen, WHITE, ball)
+            # only the players count sync, keep ours at what they last sent
+            sync = game.sync
+            for _ in range(physics.due()):
+                drawnFrom = (game.ballX, game.ballY)
+                scores = (game.lScore, game.rScore)
+                advance(game, {})
+                if (game.lScore, game.rScore) != scores:
+                    pointSound.play()
+                if game.bounced:
+                    bounceSound.play()
+            game.sync = sync
             # ==== End Ball Logic =================================================================
 
-        # Drawing the dotted line in the center
-        for i in centerLine:
-            pygame.draw.rect(screen, WHITE, i)
+        placeRects(game, ball, leftPaddle, rightPaddle)
+        if drawnFrom is not None and not authoritative:
+            ball.topleft = (round(lerp(drawnFrom[0], game.ballX, physics.alpha)), round(lerp(drawnFrom[1], game.ballY, physics.alpha)))
+        if not over:
+            renderer.rect(WHITE, ball.move(ballOffset.step()))
         
         # Drawing the player's new location
-        pygame.draw.rect(screen, RED, leftPaddle)
-        pygame.draw.rect(screen, BLUE, rightPaddle)
-            
+        renderer.rect(RED, leftPaddle)
+        renderer.rect(BLUE, rightPaddle)
 
-        pygame.draw.rect(screen, WHITE, topWall)
-        pygame.draw.rect(screen, WHITE, bottomWall)
-        scoreRect = updateScore(lScore, rScore, screen, WHITE, scoreFont)
-        pygame.display.flip()
+        renderer.score(scoreFont, game.lScore, game.rScore, WHITE)
+        drawLatency(renderer, latencyFont, latency)
+        renderer.present()
 
-        clock.tick(60)
+        clock.tick(frameRate)
         
 
+# =====================================================================
+# Purpose: Play back a match recorded with pongServer.py --record, the
+#          third way into the game besides playing and watching.
+# Pre:  replay is an open Replay. speed is how many times faster than
+#       real time to start playing, negative to play backwards.
+# Post: Shows the match until the window is closed. Space pauses, the
+#       right and left arrows go through REPLAY_SPEEDS (fast-forward and
+#       rewind), Home goes back to the start, and 0-9 jump to that tenth
+#       of the recording.
+# =====================================================================
+def replayGame(replay: Replay, speed: float = 1.0) -> None:
+    screenWidth, screenHeight = replay.header['width'], replay.header['height']
+    # Pygame inits
+    pygame.mixer.pre_init(44100, -16, 2, 2048)
+    pygame.init()
+    pygame.display.set_caption(f"Replay - Room {replay.header['roomId']}")
+
+    clock = pygame.time.Clock()
+    scoreFont = pygame.font.Font("./assets/fonts/pong-score.ttf", 32)
+    infoFont = pygame.font.Font("./assets/fonts/visitor.ttf", 16)
+    winFont = pygame.font.Font("./assets/fonts/visitor.ttf", 48)
+    pointSound = pygame.mixer.Sound("./assets/sounds/point.wav")
+    bounceSound = pygame.mixer.Sound("./assets/sounds/bounce.wav")
+
+    # Display objects
+    screen = pygame.display.set_mode((screenWidth, screenHeight))
+    renderer = FieldRenderer(screen, BG_COLOR, WHITE)
+
+    game = replay.seek(0)
+    leftPaddle = pygame.Rect(game.leftX, game.leftY, PADDLE_WIDTH, PADDLE_HEIGHT)
+    rightPaddle = pygame.Rect(game.rightX, game.rightY, PADDLE_WIDTH, PADDLE_HEIGHT)
+    ball = pygame.Rect(game.ballX, game.ballY, BALL_SIZE, BALL_SIZE)
+
+    position = 0.0      # ms into the recording being shown
+    paused = False
+    events = MatchEvents()      # only for the sounds, at normal speed
+
+    while True:
+        renderer.begin()
+        jumped = False
+
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                pygame.quit()
+                sys.exit()
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_SPACE:
+                    paused = not paused
+                elif event.key in (pygame.K_RIGHT, pygame.K_LEFT):
+                    step = 1 if event.key == pygame.K_RIGHT else -1
+                    index = REPLAY_SPEEDS.index(speed) if speed in REPLAY_SPEEDS else REPLAY_SPEEDS.index(1)
+                    speed = REPLAY_SPEEDS[min(max(index + step, 0), len(REPLAY_SPEEDS) - 1)]
+                elif event.key == pygame.K_HOME:
+                    position, jumped = 0.0, True
+                elif pygame.K_0 <= event.key <= pygame.K_9:
+                    position, jumped = replay.duration * (event.key - pygame.K_0) / 10, True
+
+        if not paused:
+            position = min(max(position + clock.get_time() * speed, 0.0), float(replay.duration))
+        game = replay.seek(position)
+
+        # sounds only make sense when the match is heard as it was played
+        if speed == 1 and not paused and not jumped:
+            happened = events.observe(game)
+            if 'point' in happened:
+                pointSound.play()
+            if happened & {'hit', 'bounce'}:
+                bounceSound.play()
+        else:
+            events.forget()
+
+        over = isOver(game)
+        if over:
+            winText = "Player 1 Wins! " if game.lScore >= WIN_SCORE else "Player 2 Wins! "
+            winColor = RED if game.lScore >= WIN_SCORE else BLUE
+            renderer.text(winFont, winText, winColor, BG_COLOR, center=((screenWidth/2), screenHeight/2))
+
+        placeRects(game, ball, leftPaddle, rightPaddle)
+        if not over:
+            renderer.rect(WHITE, ball)
+        renderer.rect(RED, leftPaddle)
+        renderer.rect(BLUE, rightPaddle)
+        renderer.score(scoreFont, game.lScore, game.rScore, WHITE)
+
+        # where we are in the recording, in the corner the round trip time uses when playing
+        status = "paused" if paused else f"x{speed:g}"
+        renderer.text(infoFont, f"{formatTime(position)} / {formatTime(replay.duration)}  {status}", WHITE,
+                      bottomleft=(15, screenHeight - 15))
+        renderer.present()
+
+        clock.tick(frameRate)
+
+
+# ms as m:ss, for the replay's position
+def formatTime(millis: float) -> str:
+    seconds = int(millis // 1000)
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
 
 
 
@@ -624,28 +844,56 @@ def watchGame(screenWidth:int, screenHeight:int, client:socket.socket) -> None:
 # the screen width, height and player paddle (either "left" or "right")
 # If you want to hard code the screen's dimensions into the code, that's fine, but you will need to know
 # which client is which
-def joinServer(ip:str, port:str, errorLabel:tk.Label, app:tk.Tk) -> None:
-    # Purpose:      This method is fired when the join button is clicked
+def joinServer(ip:str, port:str, errorLabel:tk.Label, app:tk.Tk, spectate:bool = False, room:str = "") -> None:
+    # Purpose:      This method is fired when the join or watch button is clicked
     # Arguments:
     # ip            A string holding the IP address of the server
     # port          A string holding the port the server is using
     # errorLabel    A tk label widget, modify it's text to display messages to the user (example below)
     # app           The tk window object, needed to kill the window
+    # spectate      True to watch a match instead of playing in one
+    # room          Optional room number to watch, the newest match is used when blank
     
     
     # Create a socket and connect to the server
-    # You don't have to use SOCK_STREAM, use what you think is best
+    # TCP carries everything that must arrive, per-frame state can move to UDP below
     client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     client.connect((ip, int(port)))
+    # Tell the server whether we want a paddle or want to watch
+    joinRequest = {'join': 'spectate' if spectate else 'play', 'protocols': SUPPORTED_PROTOCOLS, 'udp': True}
+    if spectate and room.strip().isdigit():
+        joinRequest['room'] = int(room)
+    client.send((json.dumps(joinRequest) + "\n").encode())
     # Get the required information from your server (screen width, height & player paddle, "left or "right)
-    jsonData = client.recv(1024).decode()
-    data = json.loads(jsonData)
+    # Only the first message is game info, anything after it is kept in the reader for later
+    reader = FrameReader()
+    while (item := reader.next()) is None:
+        received = client.recv(1024)
+        if not received:
+            errorLabel.config(text="Server closed the connection")
+            errorLabel.update()
+            client.close()
+            return
+        reader.feed(received)
+    data = item[0]
     screenWidth = data['width']
     screenHeight = data['height']
     position = data['role']
+    authoritative = data.get('authoritative', False)
+    lockstep = data.get('lockstep', False)
+    swept = data.get('swept', False)
+    tickRate = data.get('tickRate', 60)     # servers from before the tick rate was set send neither
+    sendRate = data.get('sendRate')
+    reader.protocol = data.get('protocol', PROTOCOL_JSON)     # servers without the binary format never send this
+    udp = None
+    if 'udpToken' in data:      # only sent by servers started with --udp
+        udpSock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        udpSock.connect((ip, int(port)))
+        udpSock.setblocking(False)
+        udp = DatagramChannel(udpSock, data['udpToken'], reader.protocol)
 
     # Show the role assignment beofre going into the game
-    showRoleScreen(position, app, client)
+    showRoleScreen(position, app, client, reader, data.get('room'))
 
     client.setblocking(False)
     # If you have messages you'd like to show the user use the errorLabel widget like so
@@ -656,9 +904,9 @@ def joinServer(ip:str, port:str, errorLabel:tk.Label, app:tk.Tk) -> None:
     # Close this window and start the game with the info passed to you from the server
     app.withdraw()     # Hides the window (we'll kill it later)
     if (position == 'left' or position == 'right'):
-        playGame(screenWidth, screenHeight, position, client)  # User will be either left or right paddle
+        playGame(screenWidth, screenHeight, position, client, reader, authoritative, udp, tickRate, sendRate, lockstep, swept)  # User will be either left or right paddle
     else:
-        watchGame(screenWidth, screenHeight, client)           # User will watch the game
+        watchGame(screenWidth, screenHeight, client, reader, authoritative, udp, tickRate, sendRate, lockstep, swept)           # User will watch the game
     app.quit()         # Kills the window
 
 
@@ -684,15 +932,45 @@ def startScreen() -> None:
     portEntry = tk.Entry(app)
     portEntry.grid(column=1, row=2)
 
+    roomLabel = tk.Label(text="Room (to watch):")
+    roomLabel.grid(column=0, row=3, sticky="W", padx=8)
+
+    roomEntry = tk.Entry(app)
+    roomEntry.grid(column=1, row=3)
+
     errorLabel = tk.Label(text="")
-    errorLabel.grid(column=0, row=4, columnspan=2)
+    errorLabel.grid(column=0, row=5, columnspan=2)
 
     joinButton = tk.Button(text="Join", command=lambda: joinServer(ipEntry.get(), portEntry.get(), errorLabel, app))
-    joinButton.grid(column=0, row=3, columnspan=2)
+    joinButton.grid(column=0, row=4)
+
+    watchButton = tk.Button(text="Watch", command=lambda: joinServer(ipEntry.get(), portEntry.get(), errorLabel, app,
+                                                                     spectate=True, room=roomEntry.get()))
+    watchButton.grid(column=1, row=4)
 
     app.mainloop()
 
 if __name__ == "__main__":
-    startScreen()
+    parser = argparse.ArgumentParser(description="Pong client, or a player for recorded matches")
+    parser.add_argument("--replay", help="play back a recording made with pongServer.py --record")
+    parser.add_argument("--speed", type=float, default=1.0, help="with --replay, times faster than real time to play")
+    parser.add_argument("--stats", action="store_true",
+                        help="with --replay, play it without a window and print what happened as JSON")
+    parser.add_argument("--scan", help="print a JSON summary of every recording in this directory")
+    parser.add_argument("--fps", type=int, default=frameRate,
+                        help="frames drawn per second, the game runs at the server's tick rate whatever this is")
+    args = parser.parse_args()
+    frameRate = args.fps
+
+    if args.scan:
+        for summary in scanArchive(args.scan):
+            print(json.dumps(summary))
+    elif args.replay and args.stats:
+        print(json.dumps(replayStats(args.replay), indent=2))
+    elif args.replay:
+        with Replay(args.replay) as replay:
+            replayGame(replay, args.speed)
+    else:
+        startScreen()
     
 
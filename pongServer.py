@@ -7,9 +7,24 @@
 # =================================================================================================
 
 import socket
+import selectors
 import threading
+import argparse
 import json
 import time
+import random
+import multiprocessing
+from collections import deque
+from itertools import islice
+from assets.code.wireProtocol import (PROTOCOL_DELTA, PROTOCOL_JSON, SUPPORTED_PROTOCOLS, FrameReader, chooseProtocol,
+                                      encodeDelta, encodeMessage, isDelta, wireBytes)
+from assets.code.wireProtocol import DATAGRAM_HEADER, UDP_HELLO, decodeDatagram
+from assets.code.simulation import TICK_RATE, GameState, advance, isOver, restart, stateHash, sweep
+from assets.code.serverMetrics import ServerMetrics, StatsEndpoint, StatsRequest
+from assets.code.clockSync import pongFor, reportedRtt
+from assets.code.recording import MAX_FILE_BYTES, MatchRecorder, RecordingWriter
+from assets.code.timestep import ticksPerSend
+from assets.code.lockstep import HASH_EVERY, HASH_HISTORY, resyncMessage, turnMessage
 
 # Use this file to write your server logic
 # You will need to support at least two clients
@@ -22,8 +37,11 @@ clients = []  # list of connected clients
 roles = {}    # dictionary mapping socket.socket to string, maps clients to position (left, right, spectator)
 rematchRequests = {'left': False, 'right': False}
 bothPlayersConnected = False # Track when both players have joined
+latestStates = {}   # each player's newest game update as relayed, for spectators who join mid-match
+SEND_TIMEOUT = 2.0  # seconds a threaded relay send may block before the receiver is dropped
 SCREEN_WIDTH = 640
 SCREEN_HEIGHT = 480
+metrics = None      # ServerMetrics when the threaded server was asked for stats
 
 gameInfo = {}   # dictionary to send each client the game information needed to run playGame or watchGame
 gameInfo['width'] = SCREEN_WIDTH
@@ -47,6 +65,8 @@ def handle_client(conn, addr):
     elif clients[1] == conn:            # second client uses right paddle
         roles[conn] = 'right'
         bothPlayersConnected = True
+        if metrics is not None:
+            metrics.matchesStarted += 1
     else:
         roles[conn] = 'spectator'       # all other clients are spectators
     gameInfo['role'] = roles[conn]
@@ -57,47 +77,95 @@ def handle_client(conn, addr):
      # Send start signal to begin countdown
     startSignal = json.dumps({"start_game": True}) + "\n"
     conn.send(startSignal.encode())
+    if roles[conn] == 'spectator':
+        # a late spectator starts from both paddles and the ball as they are now, not the starting positions
+        for relayBytes in list(latestStates.values()):
+            conn.sendall(relayBytes)
     
     # Wait 3 seconds for countdown on client side
     time.sleep(3.5)
+    reader = FrameReader()  # splits the stream into whole messages, however recv cuts it up
+    conn.settimeout(SEND_TIMEOUT)   # so a receiver that stops reading cannot block our relay forever
     while True:
         # receive messages from clients
         try:
-            raw = conn.recv(1024)
+            try:
+                raw = conn.recv(4096)
+            except socket.timeout:
+                continue        # no news from this client, keep waiting
             if not raw:
                 break
-        
-            try:
-                data = json.loads(raw.decode().strip())
-            except:
-                continue
+            receivedAt = time.perf_counter()
+            reader.feed(raw)
+            if metrics is not None:
+                metrics.bytesIn += len(raw)
 
-            # player wants to play again
-            if 'rematch' in data:
-                playerRole = roles[conn]
+            while (item := reader.next()) is not None:
+                data, frame = item
+                if metrics is not None:
+                    metrics.messagesIn += 1
 
-                # record their request
-                rematchRequests[playerRole] = True
+                # join requests only matter to the event loop server's rooms
+                if 'join' in data:
+                    continue
 
-                # wait until both players want to play again
-                if rematchRequests['left'] and rematchRequests['right']:
-                
-                    # send approval to both
-                    approval = json.dumps({"rematch": True}) + "\n"
-                    for c in clients:
-                        c.send(approval.encode())
+                # answer pings straight away, they measure the time to us and back
+                if 'ping' in data:
+                    pong = pongFor(data)
+                    if pong is not None:
+                        conn.send(encodeMessage(pong, PROTOCOL_JSON))
+                    if metrics is not None and reportedRtt(data) is not None:
+                        metrics.clientRtt.observe(round(reportedRtt(data) * 1000))
+                    continue
 
-                    # reset flags for next round
-                    rematchRequests['left'] = False
-                    rematchRequests['right'] = False
+                # player wants to play again
+                if 'rematch' in data:
+                    playerRole = roles[conn]
 
-                continue
+                    # record their request
+                    rematchRequests[playerRole] = True
 
-            else:
-                # game update
-                for c in clients:
-                    if c != conn:
-                        c.send((json.dumps(data) + "\n").encode())
+                    # wait until both players want to play again
+                    if rematchRequests['left'] and rematchRequests['right']:
+                    
+                        # send approval to both
+                        approval = json.dumps({"rematch": True}) + "\n"
+                        for c in clients:
+                            c.send(approval.encode())
+                        if metrics is not None:
+                            metrics.rematches += 1
+                        latestStates.clear()
+
+                        # reset flags for next round
+                        rematchRequests['left'] = False
+                        rematchRequests['right'] = False
+
+                    continue
+
+                else:
+                    # game update, forward the bytes as received, no need to encode again
+                    relayBytes = wireBytes(frame, PROTOCOL_JSON)
+                    if 'ballX' in data:
+                        latestStates[roles[conn]] = relayBytes
+                    for c in list(clients):
+                        if c != conn:
+                            try:
+                                c.sendall(relayBytes)
+                            except OSError:
+                                # drop the receiver that cannot keep up, not this sender
+                                print(f"[EVICTED] {roles.get(c, 'unknown')} client could not keep up")
+                                if c in clients:
+                                    clients.remove(c)
+                                c.close()
+                                if metrics is not None:
+                                    metrics.evictions += 1
+                                continue
+                            if metrics is not None:
+                                metrics.messagesOut += 1
+                                metrics.bytesOut += len(relayBytes)
+                    if metrics is not None:
+                        metrics.relayed += 1
+                        metrics.relayLatency.observe(round((time.perf_counter() - receivedAt) * 1e6))
 
         except:
             break
@@ -106,25 +174,1297 @@ def handle_client(conn, addr):
     conn.close()
     if conn in clients:
         clients.remove(conn)
-    print(f"[DISCONNECTED] {addr}")
+    if metrics is not None:
+        metrics.connectionsClosed += 1
+    print(f"[DISCONNECTED] {addr} frames: {reader.framesIn}, malformed: {reader.malformed}, dropped: {reader.dropped}")
+
+MAX_GATHER = 64         # most queued messages handed to one sendmsg call
+HIGH_WATER = 256 * 1024 # bytes a client may have queued before it is evicted
+EVICT_AFTER = 5.0       # seconds a client's socket may accept nothing while data waits
+UDP_KEY = "udp"         # selector data marking the UDP socket
+HANDOFF_KEY = "handoff" # selector data marking a worker's link to the front door
+STATS_KEY = "stats"     # selector data marking the stats endpoint's listening socket
+UPSTREAM_KEY = "upstream"   # selector data marking a relay node's link to the server it mirrors
+UPSTREAM_TIMEOUT = 5.0  # seconds a relay node waits for the upstream server to answer its join request
+RECONNECT_DELAY = 2.0   # seconds a relay node waits before subscribing again after losing the upstream
+LOAD_FIELDS = 4         # per worker in the shared load array: rooms, open rooms, clients, handoffs adopted
+canGatherWrite = hasattr(socket.socket, "sendmsg")     # not available on Windows
+HELLO_TIMEOUT = 0.5     # seconds to wait for a join request before treating a client as a player
+COUNTDOWN_DELAY = 3.5   # seconds the clients spend counting down before a match starts
+
+# =====================================================================
+# Purpose: Run one match's ball and paddle physics on the server, using
+#          the same rules playGame uses on the client, so the server is
+#          the only place the game is simulated.
+# Pre:  width and height are the screen size sent to the clients.
+# Post: Creates a match at its starting positions with the ball heading
+#       left.
+# =====================================================================
+class MatchSimulation:
+    def __init__(self, width: int, height: int, lockstep: bool = False, sweptTicks: int = 0) -> None:
+        self.state = GameState(width, height)
+        self.inputs = {'left': "", 'right': ""}
+        self.acks = {'left': 0, 'right': 0}     # the client tick each paddle's position matches
+        self.bounced = False    # whether the ball bounced since the last snapshot, which may be ticks ago
+        self.lockstep = lockstep
+        self.sweptTicks = sweptTicks    # game ticks each tick sweeps over, 0 to run them one by one with advance
+        self.hashes = {}        # lockstep: our stateHash every HASH_EVERY ticks, by sync
+        self.turnInputs = None  # lockstep: the inputs the last turn announced
+
+    # tick is the client's tick count when it sent the input, for its paddle prediction
+    def setInput(self, role: str, moving: str, tick: int = None) -> None:
+        self.inputs[role] = moving if moving in ("up", "down") else ""
+        if isinstance(tick, int):
+            self.acks[role] = tick
+
+    def isOver(self) -> bool:
+        return isOver(self.state)
+
+    def reset(self) -> None:
+        restart(self.state)
+        self.inputs = {'left': "", 'right': ""}
+        self.hashes.clear()
+        self.turnInputs = None
+
+    # advance the match by one frame, several game ticks of it when swept
+    def tick(self) -> None:
+        state = self.state
+        if self.sweptTicks:
+            sweep(state, self.inputs, self.sweptTicks)
+        else:
+            advance(state, self.inputs)
+        self.bounced = self.bounced or state.bounced
+        for role in self.acks:
+            self.acks[role] += self.sweptTicks or 1
+        if self.lockstep and state.sync % HASH_EVERY == 0:
+            self.hashes[state.sync] = stateHash(state)
+            self.hashes.pop(state.sync - HASH_EVERY * HASH_HISTORY, None)
+
+    # lockstep: whether the inputs changed since the last turn, which must go out before the next tick
+    def inputsChanged(self) -> bool:
+        return self.inputs != self.turnInputs
+
+    # lockstep: the inputs in force from the next tick on, everything up to now is final
+    def turn(self) -> dict:
+        self.turnInputs = dict(self.inputs)
+        return turnMessage(self.state.sync, self.inputs)
+
+    def resync(self) -> dict:
+        return resyncMessage(self.state, self.inputs)
+
+    # lockstep: whether a peer's hash matches ours, None when we no longer (or never) had one for that sync
+    def checkHash(self, sync: int, value: int):
+        known = self.hashes.get(sync)
+        return None if known is None else known == value
+
+    def snapshot(self) -> dict:
+        state = self.state
+        snapshot = {
+            'ballX': state.ballX,
+            'ballY': state.ballY,
+            'leftY': state.leftY,
+            'rightY': state.rightY,
+            'lScore': state.lScore,
+            'rScore': state.rScore,
+            'sync': state.sync,
+            'leftAck': self.acks['left'],
+            'rightAck': self.acks['right'],
+        }
+        if self.bounced:
+            snapshot['bounce'] = True
+            self.bounced = False
+        return snapshot
+
+
+# =====================================================================
+# Purpose: Per-connection state for the event loop server. Holds the
+#          partial bytes read so far and the bytes still waiting to be
+#          written, since neither recv nor send is allowed to block.
+# Pre:  sock must be a connected, non-blocking socket.
+# Post: Creates an empty connection record with no role or room assigned.
+# =====================================================================
+class ClientConnection:
+    def __init__(self, sock: socket.socket, addr) -> None:
+        self.sock = sock
+        self.addr = addr
+        self.role = ""
+        self.room = None
+        self.protocol = PROTOCOL_JSON   # wire format agreed on in the join request
+        self.reader = FrameReader()     # bytes received but not yet split into messages
+        self.outQueue = deque()         # encoded messages waiting to be sent, shared between recipients
+        self.outOffset = 0              # bytes of outQueue[0] already sent
+        self.outBytes = 0               # bytes waiting in outQueue and pendingStates
+        self.pendingStates = {}         # newest state per coalesce key, held back while the socket is full
+        self.lastProgress = 0.0         # monotonic time the socket last accepted bytes
+        self.coalesced = 0              # state messages replaced by a newer one before being sent
+        self.sentStates = {}            # bin2: the last state queued per coalesce key, what the next delta is from
+        self.udpToken = None            # identifies this client's datagrams when it uses UDP
+        self.udpAddr = None             # where to send this client's datagrams, learned from its first one
+        self.udpSeqIn = 0               # newest datagram sequence number received from this client
+        self.udpSeqOut = 0              # sequence number of the last datagram sent to this client
+        self.staleDatagrams = 0         # datagrams dropped for arriving after a newer one
+        self.rtt = None                 # round trip time in ms, as the client last reported it
+        self.resyncedAt = -1            # lockstep: sync of the last resync sent, older hash reports are stale
+        self.helloDeadline = time.monotonic() + HELLO_TIMEOUT
+        self.closed = False
+
+
+# =====================================================================
+# Purpose: One independent match. Tracks its two paddles, its
+#          spectators and its rematch requests so many games can share
+#          one server process.
+# Pre:  roomId must be unique within the server.
+# Post: Creates an empty room waiting for two players.
+# =====================================================================
+class Room:
+    def __init__(self, roomId: int) -> None:
+        self.roomId = roomId
+        self.players = {'left': None, 'right': None}
+        self.spectators = []
+        self.rematchRequests = {'left': False, 'right': False}
+        self.started = False
+        self.simulation = None      # MatchSimulation when the server runs the physics
+        self.simulationStart = 0.0  # monotonic time the simulation may start ticking
+        self.recorder = None        # MatchRecorder while the match is being recorded
+        self.latest = {}            # coalesce key -> (newest state message, its bytes per wire format)
+        self.dirty = set()          # keys of latest the spectators have not been sent yet, with a spectator rate
+
+    def freeRole(self) -> str:
+        for role, conn in self.players.items():
+            if conn is None:
+                return role
+        return ""
+
+    def members(self) -> list:
+        return [c for c in self.players.values() if c is not None] + self.spectators
+
+    def isEmpty(self) -> bool:
+        return not self.members()
+
+    # a new match starts from scratch, nothing from the last one should reach spectators
+    def forgetStates(self) -> None:
+        self.latest.clear()
+        self.dirty.clear()
+
+
+# =====================================================================
+# Purpose: Serve every client from a single thread using a selector
+#          instead of one thread per socket. Accepts connections, pairs
+#          players into rooms, buffers reads until complete
+#          newline-terminated messages arrive, and relays game updates to
+#          the rest of the sender's room with non-blocking writes.
+#          With authoritative set, each room's physics runs on the server
+#          at tickRate and clients only send their paddle input. With
+#          lockstep set as well, the server sends turns (the inputs and
+#          the tick they apply from) instead of snapshots, every client
+#          runs the match itself, and one whose hash reports stop matching
+#          the server's is resynced with the whole state. With swept
+#          set too, the ball moves continuously over each tick, which
+#          covers TICK_RATE / tickRate game ticks, so a lower tickRate
+#          saves work without changing the game's pace. Players
+#          (or the server, for authoritative rooms) send a game state
+#          sendRate times a second, every tick unless it is lower.
+#          Each client has its own outbound queue. While a client is
+#          backed up only its newest state messages are kept, and clients
+#          that queue more than highWater bytes or stop reading for
+#          evictAfter seconds are disconnected, so one slow spectator
+#          cannot delay the players. Each room keeps its newest states so
+#          a spectator joining mid-match is sent them straight away.
+#          With a udpSock, clients that ask for it get their per-tick
+#          state over UDP while everything else stays on TCP.
+#          As a worker behind a FrontDoor it has no listening socket and
+#          takes its clients from handoff instead, numbering its rooms
+#          roomIds[0], roomIds[0] + roomIds[1], ... and publishing its
+#          load to slot loadIndex of the shared load array.
+#          With a statsPort it answers metrics requests there, and with a
+#          statsInterval it logs a line of metrics every that many
+#          seconds. Without either, nothing is measured.
+#          With a recordDir every match is recorded to a replay file there,
+#          continued in a new part once a file reaches recordMaxBytes.
+#          With a spectatorRate, spectators are sent the newest states
+#          that many times a second rather than every one.
+#          With an upstream (host, port) it is a relay node: it hosts no
+#          matches but watches upstreamRoom (or the newest match) on that
+#          server and passes it on to everyone who connects, so relay
+#          nodes can be chained into a tree to reach large audiences.
+# Pre:  server must be a bound, listening socket, or None for a worker.
+#       udpSock, if given, must be a UDP socket bound to the same port.
+# Post: Runs until the process is stopped. Rooms are torn down, and their
+#       sockets closed, as soon as their match can no longer continue.
+# =====================================================================
+class EventLoopServer:
+    def __init__(self, server: socket.socket, authoritative: bool = False, tickRate: int = 60,
+                 highWater: int = HIGH_WATER, evictAfter: float = EVICT_AFTER, udpSock: socket.socket = None,
+                 handoff: socket.socket = None, roomIds: tuple = (1, 1), load=None, loadIndex: int = 0,
+                 statsPort: int = None, statsHost: str = "127.0.0.1", statsInterval: float = 0,
+                 recordDir: str = None, recordMaxBytes: int = MAX_FILE_BYTES, spectatorRate: float = 0,
+                 upstream: tuple = None, upstreamRoom: int = None, sendRate: float = 0,
+                 lockstep: bool = False, swept: bool = False) -> None:
+        self.authoritative = authoritative or lockstep
+        self.lockstep = lockstep
+        self.sweptTicks = TICK_RATE // tickRate if swept else 0     # game ticks per server tick, when swept
+        self.highWater = highWater
+        self.evictAfter = evictAfter
+        self.evictions = 0
+        self.tickInterval = 1 / tickRate
+        self.nextTick = time.monotonic() + self.tickInterval
+        self.sendEvery = ticksPerSend(tickRate, sendRate)     # ticks between game states
+        self.server = server
+        self.selector = selectors.DefaultSelector()
+        if server is not None:
+            server.setblocking(False)
+            self.selector.register(server, selectors.EVENT_READ, None)
+        self.handoff = handoff
+        if handoff is not None:
+            handoff.setblocking(False)
+            self.selector.register(handoff, selectors.EVENT_READ, HANDOFF_KEY)
+        self.load = load
+        self.loadIndex = loadIndex
+        self.adopted = 0            # clients handed over by the front door
+        self.clientCount = 0
+        self.running = True
+        self.udpSock = udpSock
+        self.udpTokens = {}         # maps udpToken to ClientConnection
+        if udpSock is not None:
+            udpSock.setblocking(False)
+            self.selector.register(udpSock, selectors.EVENT_READ, UDP_KEY)
+        self.pending = deque()      # connections that have not sent a join request yet, oldest first
+        self.rooms = {}             # maps room id to Room
+        self.openRooms = {}         # rooms that still have a free paddle, oldest first
+        self.nextRoomId, self.roomIdStep = roomIds
+        self.framesIn = 0           # totals from clients that have disconnected
+        self.malformedFrames = 0
+        self.droppedFrames = 0
+
+        self.metrics = None
+        self.statsEndpoint = None
+        self.receivedAt = 0.0       # perf_counter time of the read being handled, for relay latency
+        self.statsInterval = statsInterval
+        self.nextLog = time.monotonic() + statsInterval
+        if statsPort is not None or statsInterval:
+            self.metrics = ServerMetrics(self.gauges, {'worker': loadIndex} if load is not None else None)
+        if statsPort is not None:
+            self.statsEndpoint = StatsEndpoint(self.metrics, statsHost, statsPort, self.selector)
+            self.selector.register(self.statsEndpoint.sock, selectors.EVENT_READ, STATS_KEY)
+
+        self.recordings = RecordingWriter(recordDir, recordMaxBytes) if recordDir else None
+
+        self.spectatorInterval = 1 / spectatorRate if spectatorRate else 0
+        self.nextSpectatorFlush = time.monotonic() + self.spectatorInterval
+
+        self.upstream = upstream
+        self.upstreamRoom = upstreamRoom
+        self.upstreamSock = None
+        self.upstreamReader = None
+        self.upstreamInfo = {}      # what the upstream's game info says about its match, passed on to our spectators
+        self.mirror = None          # the room mirroring the upstream's match, while subscribed
+        self.nextSubscribe = 0.0
+        if upstream is not None:
+            self.subscribe()
+
+    def serveForever(self) -> None:
+        try:
+            self.runLoop()
+        finally:
+            # whatever stopped us, finish the recordings so they can be replayed
+            if self.recordings is not None:
+                for room in self.rooms.values():
+                    if room.recorder is not None:
+                        room.recorder.close()
+                self.recordings.stop()
+
+    def runLoop(self) -> None:
+        while self.running:
+            timeout = None
+            if self.pending:
+                timeout = max(0.0, self.pending[0].helloDeadline - time.monotonic())
+            if self.authoritative:
+                untilTick = max(0.0, self.nextTick - time.monotonic())
+                timeout = untilTick if timeout is None else min(timeout, untilTick)
+            if self.statsInterval:
+                untilLog = max(0.0, self.nextLog - time.monotonic())
+                timeout = untilLog if timeout is None else min(timeout, untilLog)
+            if self.spectatorInterval:
+                untilFlush = max(0.0, self.nextSpectatorFlush - time.monotonic())
+                timeout = untilFlush if timeout is None else min(timeout, untilFlush)
+            if self.statsEndpoint is not None and self.statsEndpoint.requests:
+                untilStats = self.statsEndpoint.untilDeadline()
+                timeout = untilStats if timeout is None else min(timeout, untilStats)
+            if self.upstream is not None and self.upstreamSock is None:
+                untilSubscribe = max(0.0, self.nextSubscribe - time.monotonic())
+                timeout = untilSubscribe if timeout is None else min(timeout, untilSubscribe)
+            for key, events in self.selector.select(timeout):
+                if key.data is None:
+                    self.acceptClient()
+                    continue
+                if key.data is UDP_KEY:
+                    self.readDatagrams()
+                    continue
+                if key.data is HANDOFF_KEY:
+                    self.adoptClients()
+                    continue
+                if key.data is STATS_KEY:
+                    self.statsEndpoint.accept()
+                    continue
+                if type(key.data) is StatsRequest:
+                    self.statsEndpoint.service(key.data, events)
+                    continue
+                if key.data is UPSTREAM_KEY:
+                    self.readUpstream()
+                    continue
+                conn = key.data
+                if conn.closed:
+                    continue    # closed earlier in this batch of events
+                if events & selectors.EVENT_READ:
+                    self.readClient(conn)
+                if events & selectors.EVENT_WRITE and not conn.closed:
+                    self.flushClient(conn)
+            self.expireHellos()
+            if self.statsEndpoint is not None:
+                self.statsEndpoint.expire()
+            if self.authoritative:
+                self.runTicks()
+            if self.load is not None:
+                self.publishLoad()
+            if self.statsInterval and time.monotonic() >= self.nextLog:
+                self.nextLog = time.monotonic() + self.statsInterval
+                print(f"[STATS] {self.metrics.logLine()}")
+            if self.spectatorInterval and time.monotonic() >= self.nextSpectatorFlush:
+                # on a fixed cadence so the rate is the one spectators were told, without bursts after a stall
+                self.nextSpectatorFlush = max(self.nextSpectatorFlush + self.spectatorInterval, time.monotonic())
+                self.flushSpectators()
+            if self.upstream is not None and self.upstreamSock is None and time.monotonic() >= self.nextSubscribe:
+                self.subscribe()
+
+    # values for the metrics that are read rather than counted
+    def gauges(self) -> dict:
+        members = [c for room in self.rooms.values() for c in room.members()]
+        queued = [c.outBytes for c in members]
+        return {
+            'clients': self.clientCount,
+            'rooms': len(self.rooms),
+            'openRooms': len(self.openRooms),
+            'pendingJoins': len(self.pending),
+            'queuedBytes': sum(queued),
+            'maxClientQueueBytes': max(queued, default=0),
+            'maxClientRttMs': max((c.rtt for c in members if c.rtt is not None), default=0),
+        }
+
+    # let the front door see how busy this worker is
+    def publishLoad(self) -> None:
+        base = self.loadIndex * LOAD_FIELDS
+        self.load[base] = len(self.rooms)
+        self.load[base + 1] = len(self.openRooms)
+        self.load[base + 2] = self.clientCount
+        self.load[base + 3] = self.adopted
+
+    # step every running match at a fixed rate, however long select took
+    def runTicks(self) -> None:
+        now = time.monotonic()
+        if now < self.nextTick:
+            return
+        ticksDue = int((now - self.nextTick) / self.tickInterval) + 1
+        if ticksDue > 5:
+            # too far behind to catch up, drop the missed ticks rather than spiral
+            self.nextTick = now
+            ticksDue = 1
+        self.nextTick += ticksDue * self.tickInterval
+
+        for room in list(self.rooms.values()):
+            sim = room.simulation
+            if sim is None or not room.started or now < room.simulationStart or sim.isOver():
+                continue
+            before = sim.state.sync
+            if sim.lockstep and sim.inputsChanged():
+                # every peer has to hear about new inputs before it runs the tick they are used in
+                self.broadcast(room, sim.turn())
+            for _ in range(ticksDue):
+                sim.tick()
+            # only every sendEvery-th tick goes out, and the one that ends the match
+            sendSpan = self.sendEvery * (self.sweptTicks or 1)
+            if sim.state.sync // sendSpan != before // sendSpan or sim.isOver():
+                if sim.lockstep:
+                    self.broadcast(room, sim.turn())    # never coalesced, a lost turn would desync the peers
+                else:
+                    self.broadcast(room, sim.snapshot(), coalesceKey='snapshot')
+            if room.recorder is not None:
+                room.recorder.keyframe(sim.state)
+
+    def acceptClient(self) -> None:
+        try:
+            sock, addr = self.server.accept()
+        except BlockingIOError:
+            return
+        self.pending.append(self.addClient(sock, addr))
+        print(f"[NEW CONNECTION] {addr}")
+
+    def addClient(self, sock: socket.socket, addr) -> ClientConnection:
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = ClientConnection(sock, addr)
+        self.selector.register(sock, selectors.EVENT_READ, conn)
+        self.clientCount += 1
+        if self.metrics is not None:
+            self.metrics.connectionsAccepted += 1
+        return conn
+
+    # take over the clients the front door accepted, along with whatever they already sent
+    def adoptClients(self) -> None:
+        while True:
+            try:
+                data, fds, flags, _ = socket.recv_fds(self.handoff, 65536, 1)
+            except BlockingIOError:
+                return
+            if not fds:
+                if not data:
+                    # the front door is gone, nobody new can arrive
+                    self.selector.unregister(self.handoff)
+                    self.running = False
+                    return
+                continue
+            header, _, raw = data.partition(b"\n")
+            header = json.loads(header)
+            conn = self.addClient(socket.socket(fileno=fds[0]), tuple(header['addr']))
+            self.adopted += 1
+            if raw:
+                self.receivedAt = time.perf_counter()
+                self.receive(conn, raw)
+            if conn.room is None and not conn.closed:
+                if header['hello']:
+                    self.pending.append(conn)   # join request still on its way
+                else:
+                    self.joinRoom(conn, self.roomForPlayer())   # the front door already waited for one
+
+    # clients that never send a join request are treated as players
+    def expireHellos(self) -> None:
+        now = time.monotonic()
+        while self.pending and (self.pending[0].room is not None or self.pending[0].closed
+                                or self.pending[0].helloDeadline <= now):
+            conn = self.pending.popleft()
+            if conn.room is None and not conn.closed:
+                self.joinRoom(conn, self.roomForPlayer())
+
+    def roomForPlayer(self) -> Room:
+        if self.upstream is not None:
+            return self.mirror      # a relay node has no matches of its own, only the one it mirrors
+        return next(iter(self.openRooms.values()), None) or self.createRoom()
+
+    def roomForSpectator(self, roomId) -> Room:
+        if roomId in self.rooms:
+            return self.rooms[roomId]
+        # no room asked for, watch the newest match that is being played
+        for room in reversed(self.rooms.values()):
+            if room.started:
+                return room
+        return self.roomForPlayer()
+
+    def createRoom(self) -> Room:
+        room = Room(self.nextRoomId)
+        self.nextRoomId += self.roomIdStep
+        if self.authoritative:
+            room.simulation = MatchSimulation(SCREEN_WIDTH, SCREEN_HEIGHT, self.lockstep, self.sweptTicks)
+        self.rooms[room.roomId] = room
+        self.openRooms[room.roomId] = room
+        return room
+
+    def joinRoom(self, conn: ClientConnection, room: Room, spectate: bool = False) -> None:
+        if self.upstream is not None:
+            if room is None:
+                # nothing to watch until the upstream is back, turn the client away
+                self.closeClient(conn)
+                return
+            spectate = True
+        conn.room = room
+        conn.role = 'spectator' if spectate else room.freeRole()
+        if conn.role == 'spectator':
+            room.spectators.append(conn)
+        else:
+            room.players[conn.role] = conn
+            if not room.freeRole():
+                self.openRooms.pop(room.roomId, None)
+
+        info = dict(gameInfo)
+        info['role'] = conn.role
+        info['room'] = room.roomId
+        info['tickRate'] = round(1 / self.tickInterval)
+        info['sendRate'] = info['tickRate'] / self.sendEvery
+        if room.simulation is not None:
+            info['lockstep' if room.simulation.lockstep else 'authoritative'] = True
+            if room.simulation.sweptTicks:
+                # the game still counts TICK_RATE ticks a second, each of ours covers several
+                info['tickRate'] = TICK_RATE
+                info['swept'] = True
+        info.update(self.upstreamInfo)
+        if conn.role == 'spectator' and self.spectatorInterval:
+            # how far apart our spectators' states are, so they can buffer enough to smooth them
+            info['sendRate'] = min(info['sendRate'], 1 / self.spectatorInterval)
+        info['protocol'] = conn.protocol
+        if conn.udpToken is not None:
+            info['udpToken'] = conn.udpToken
+        # game info is always JSON, the agreed format is used from the next message on
+        self.queueSend(conn, encodeMessage(info, PROTOCOL_JSON))
+
+        startSignal = {"start_game": True}
+        if room.started:
+            self.sendMessage(conn, startSignal)
+            if room.simulation is not None and room.simulation.lockstep:
+                self.sendMessage(conn, room.simulation.resync())    # a lockstep peer carries on from here
+            elif conn.role == 'spectator':
+                self.sendLatest(conn, room)
+        elif not room.freeRole():
+            # both paddles are now taken, start everyone that is waiting
+            room.started = True
+            room.simulationStart = time.monotonic() + COUNTDOWN_DELAY
+            print(f"[ROOM {room.roomId}] match started")
+            if self.metrics is not None:
+                self.metrics.matchesStarted += 1
+            if self.recordings is not None:
+                room.recorder = MatchRecorder(self.recordings, room.roomId, SCREEN_WIDTH, SCREEN_HEIGHT,
+                                              TICK_RATE if self.sweptTicks else round(1 / self.tickInterval),
+                                              room.simulation is not None, self.sweptTicks > 0)
+                room.recorder.event({'start': True})
+                room.recorder.keyframe(room.simulation.state if room.simulation else None, force=True)
+            self.broadcast(room, startSignal)
+
+    def leaveRoom(self, conn: ClientConnection) -> None:
+        room = conn.room
+        conn.room = None
+        if room is None:
+            return
+        if conn in room.spectators:
+            room.spectators.remove(conn)
+        elif room.players.get(conn.role) is conn:
+            room.players[conn.role] = None
+            room.rematchRequests[conn.role] = False
+            if room.started:
+                # a match cannot continue without both players, close the room
+                self.closeRoom(room)
+                return
+            self.openRooms[room.roomId] = room
+        if room.isEmpty() and room is not self.mirror:
+            self.closeRoom(room)
+
+    def closeRoom(self, room: Room) -> None:
+        if self.rooms.pop(room.roomId, None) is None:
+            return
+        self.openRooms.pop(room.roomId, None)
+        print(f"[ROOM {room.roomId}] closed")
+        if room.recorder is not None:
+            room.recorder.close()
+            room.recorder = None
+        for c in room.members():
+            self.closeClient(c)
+
+    def readClient(self, conn: ClientConnection) -> None:
+        try:
+            raw = conn.sock.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            raw = b""
+        if not raw:
+            self.closeClient(conn)
+            return
+        if self.metrics is not None:
+            self.receivedAt = time.perf_counter()
+            self.metrics.bytesIn += len(raw)
+        self.receive(conn, raw)
+
+    def receive(self, conn: ClientConnection, raw: bytes) -> None:
+        conn.reader.feed(raw)
+        # decode one frame at a time, the join request can switch the format mid-buffer
+        while not conn.closed:
+            item = conn.reader.next()
+            if item is None:
+                break
+            self.handleMessage(conn, *item)
+        if conn.reader.corrupt:
+            self.closeClient(conn)      # lost track of the binary framing, nothing after this can be trusted
+
+    def handleMessage(self, conn: ClientConnection, data: dict, frame: bytes) -> None:
+        if self.metrics is not None:
+            self.metrics.messagesIn += 1
+        # join request, sent once right after connecting
+        if 'join' in data:
+            if conn.room is None:
+                conn.protocol = conn.reader.protocol = chooseProtocol(data.get('protocols'))
+                if data.get('udp') and self.udpSock is not None:
+                    conn.udpToken = random.getrandbits(32)
+                    while conn.udpToken in self.udpTokens:
+                        conn.udpToken = random.getrandbits(32)
+                    self.udpTokens[conn.udpToken] = conn
+                if data['join'] == 'spectate':
+                    self.joinRoom(conn, self.roomForSpectator(data.get('room')), spectate=True)
+                else:
+                    self.joinRoom(conn, self.roomForPlayer())
+            return
+        # answer pings straight away, they measure the time to us and back
+        if 'ping' in data:
+            pong = pongFor(data)
+            if pong is not None:
+                self.sendMessage(conn, pong)
+            rtt = reportedRtt(data)
+            if rtt is not None:
+                conn.rtt = rtt
+                if self.metrics is not None:
+                    self.metrics.clientRtt.observe(round(rtt * 1000))
+            return
+        if self.upstream is not None:
+            # everyone on a relay node is watching, there is nothing else for them to send
+            if conn.room is None:
+                self.joinRoom(conn, self.roomForPlayer())
+            return
+        if conn.room is None:
+            self.joinRoom(conn, self.roomForPlayer())
+        room = conn.room
 
-server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # a lockstep peer's hash of its game, one that differs from ours has gone wrong somewhere
+        if 'hash' in data:
+            sim = room.simulation
+            sync = data.get('sync')
+            if sim is None or not sim.lockstep or not isinstance(sync, int) or sync <= conn.resyncedAt:
+                return
+            if sim.checkHash(sync, data['hash']) is False:
+                print(f"[ROOM {room.roomId}] {conn.role} diverged by tick {sync}, resyncing")
+                conn.resyncedAt = sim.state.sync
+                self.sendMessage(conn, sim.resync())
+                if self.metrics is not None:
+                    self.metrics.resyncs += 1
+            return
 
-server.bind(("0.0.0.0", 65432))   # listen on all interfaces, port 65432
-server.listen()
+        # paddle input for a match simulated on the server
+        if 'input' in data:
+            if room.simulation is not None and conn.role in room.players:
+                room.simulation.setInput(conn.role, data['input'], data.get('tick'))
+                if room.recorder is not None:
+                    # it takes effect on the next tick, from the current sync
+                    room.recorder.input(conn.role, room.simulation.inputs[conn.role], room.simulation.state.sync)
+            return
 
-print("Server listening on port 65432 ...")
+        # player wants to play again
+        if 'rematch' in data:
+            if conn.role not in room.rematchRequests:
+                return
+            room.rematchRequests[conn.role] = True
 
-# print current IP for clients to use in command line
-s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-s.connect(("8.8.8.8", 80))  
-print("IP: " + s.getsockname()[0])
-s.close()
+            # wait until both players want to play again
+            if room.rematchRequests['left'] and room.rematchRequests['right']:
+                self.broadcast(room, {"rematch": True})
+                room.forgetStates()
+                if self.metrics is not None:
+                    self.metrics.rematches += 1
+                if room.simulation is not None:
+                    room.simulation.reset()
+                for c in room.members():
+                    c.resyncedAt = -1
+                if room.recorder is not None:
+                    room.recorder.rematch(room.simulation.state if room.simulation else None)
+                room.rematchRequests['left'] = False
+                room.rematchRequests['right'] = False
+            return
 
+        # game update, the server's own simulation wins in authoritative rooms
+        if room.simulation is not None:
+            return
+        self.broadcast(room, data, exclude=conn, frame=frame, frameProtocol=conn.protocol,
+                       coalesceKey=data.get('role') if 'ballX' in data else None)
+        if room.recorder is not None and 'ballX' in data:
+            room.recorder.state(data)
+        if self.metrics is not None:
+            self.metrics.relayed += 1
+            self.metrics.relayLatency.observe(round((time.perf_counter() - self.receivedAt) * 1e6))
 
-while True:
-    conn, addr = server.accept()    # accept new client
-    clients.append(conn)            # add new client to list of clients
-    thread = threading.Thread(target=handle_client, args=(conn, addr))  # use threads to handle multiple clients
-    thread.start()
\ No newline at end of file
+    def sendMessage(self, conn: ClientConnection, msg: dict) -> None:
+        self.queueSend(conn, encodeMessage(msg, conn.protocol))
+
+    # catch a late spectator up at once with the room's newest states, each encoded once per wire format
+    def sendLatest(self, conn: ClientConnection, room: Room) -> None:
+        for key, (msg, encoded) in room.latest.items():
+            self.deliver(conn, msg, encoded, key)
+
+    # send one of a room's newest states, encoding it only for the first recipient using each format
+    def deliver(self, conn: ClientConnection, msg: dict, encoded: dict, coalesceKey: str) -> None:
+        data = self.stateFrame(conn, msg, encoded, coalesceKey)
+        if conn.udpAddr is not None:
+            self.sendDatagram(conn, data)
+        else:
+            self.queueSend(conn, data, coalesceKey)
+
+    # send spectators the states that changed since last time, spectatorRate times a second
+    def flushSpectators(self) -> None:
+        for room in self.rooms.values():
+            if not room.dirty:
+                continue
+            for key in room.dirty:
+                msg, encoded = room.latest[key]
+                for c in list(room.spectators):
+                    self.deliver(c, msg, encoded, key)
+            room.dirty.clear()
+
+    # =====================================================================
+    # Purpose: Encode a state for one recipient. In bin2 it is a delta from
+    #          the last state of the same key queued to them, which TCP
+    #          delivers before this one.
+    # Pre:  encoded caches msg's encodings for the recipients of one
+    #       broadcast (or of one newest state).
+    # Post: Returns the bytes to send. A whole frame is sent over UDP,
+    #       to a recipient's first state of a key, when the last one is
+    #       still waiting to be coalesced away, and when a keyframe is due.
+    # =====================================================================
+    def stateFrame(self, conn: ClientConnection, msg: dict, encoded: dict, coalesceKey: str) -> bytes:
+        if conn.protocol == PROTOCOL_DELTA and coalesceKey is not None and conn.udpAddr is None:
+            base = conn.sentStates.get(coalesceKey)
+            conn.sentStates[coalesceKey] = msg
+            if base is not None and coalesceKey not in conn.pendingStates:
+                # recipients that were sent the same base share one delta, the cache keeps base alive so its id stays unique
+                cached = encoded.get(id(base))
+                if cached is None:
+                    cached = encoded[id(base)] = (base, encodeDelta(base, msg))
+                if cached[1] is not None:
+                    return cached[1]
+        data = encoded.get(conn.protocol)
+        if data is None:
+            data = encoded[conn.protocol] = encodeMessage(msg, conn.protocol)
+        return data
+
+    # encode msg at most once per wire format, however many clients are in the room
+    def broadcast(self, room: Room, msg: dict, exclude: ClientConnection = None,
+                  frame: bytes = None, frameProtocol: str = None, coalesceKey: str = None) -> None:
+        encoded = {}
+        if frame is not None and not isDelta(frame, frameProtocol):
+            # the sender's own bytes can be forwarded as they are, unless they only make sense after the sender's last
+            encoded[frameProtocol] = wireBytes(frame, frameProtocol)
+        recipients = room.members()
+        if coalesceKey is not None:
+            room.latest[coalesceKey] = (msg, encoded)   # filled in below, kept for spectators who join later
+            if self.spectatorInterval:
+                # spectators get it from flushSpectators at their own rate
+                room.dirty.add(coalesceKey)
+                recipients = [c for c in room.players.values() if c is not None]
+        for c in recipients:
+            if c is exclude:
+                continue
+            data = self.stateFrame(c, msg, encoded, coalesceKey)
+            if coalesceKey is not None and c.udpAddr is not None:
+                self.sendDatagram(c, data)  # per-tick state can be lost, the next tick replaces it
+            else:
+                self.queueSend(c, data, coalesceKey)
+
+    def sendDatagram(self, conn: ClientConnection, payload: bytes) -> None:
+        conn.udpSeqOut += 1
+        try:
+            sent = self.udpSock.sendto(DATAGRAM_HEADER.pack(conn.udpToken, conn.udpSeqOut) + payload, conn.udpAddr)
+        except OSError:
+            return  # a full socket buffer just loses this tick
+        if self.metrics is not None:
+            self.metrics.messagesOut += 1
+            self.metrics.bytesOut += sent
+
+    def readDatagrams(self) -> None:
+        while True:
+            try:
+                data, addr = self.udpSock.recvfrom(65536)
+            except BlockingIOError:
+                return
+            except OSError:
+                continue    # ICMP error left over from an earlier sendto
+            if self.metrics is not None:
+                self.receivedAt = time.perf_counter()
+                self.metrics.bytesIn += len(data)
+            if len(data) < DATAGRAM_HEADER.size:
+                continue
+            conn = self.udpTokens.get(DATAGRAM_HEADER.unpack_from(data)[0])
+            if conn is None or conn.closed:
+                continue
+            item = decodeDatagram(data, conn.protocol)
+            if item is None:
+                conn.reader.malformed += 1
+                continue
+            token, seq, msg, frame = item
+            conn.udpAddr = addr
+            if msg == UDP_HELLO:
+                self.sendDatagram(conn, encodeMessage(UDP_HELLO, conn.protocol))
+                continue
+            if seq <= conn.udpSeqIn:
+                conn.staleDatagrams += 1
+                continue
+            conn.udpSeqIn = seq
+            # only per-tick state may arrive over UDP, everything else must be reliable
+            if 'ballX' in msg and conn.room is not None:
+                self.handleMessage(conn, msg, frame)
+
+    # coalesceKey names messages where only the newest one matters, like one player's state
+    # or a snapshot. While the client is backed up a newer one replaces the one still waiting.
+    def queueSend(self, conn: ClientConnection, data: bytes, coalesceKey: str = None) -> None:
+        if conn.closed:
+            return
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.messagesOut += 1
+            metrics.queueDepth.observe(conn.outBytes)
+        backedUp = bool(conn.outQueue)
+        conn.outBytes += len(data)
+        if coalesceKey is not None and backedUp:
+            replaced = conn.pendingStates.pop(coalesceKey, None)
+            if replaced is not None:
+                conn.outBytes -= len(replaced)
+                conn.coalesced += 1
+                if metrics is not None:
+                    metrics.coalesced += 1
+            conn.pendingStates[coalesceKey] = data
+        else:
+            # anything held back was sent before this message, keep it in order
+            self.releaseStates(conn)
+            conn.outQueue.append(data)      # the same bytes object is queued for every recipient
+
+        if not backedUp:
+            # try to write straight away, only wait for EVENT_WRITE if the socket is full
+            conn.lastProgress = time.monotonic()
+            self.flushClient(conn)
+        elif conn.outBytes > self.highWater or time.monotonic() - conn.lastProgress > self.evictAfter:
+            self.evictClient(conn)
+
+    def releaseStates(self, conn: ClientConnection) -> None:
+        if conn.pendingStates:
+            conn.outQueue.extend(conn.pendingStates.values())
+            conn.pendingStates.clear()
+
+    def evictClient(self, conn: ClientConnection) -> None:
+        self.evictions += 1
+        if self.metrics is not None:
+            self.metrics.evictions += 1
+        print(f"[EVICTED] {conn.addr} fell behind with {conn.outBytes} bytes queued")
+        self.closeClient(conn)
+
+    def flushClient(self, conn: ClientConnection) -> None:
+        self.releaseStates(conn)
+        queue = conn.outQueue
+        try:
+            while queue:
+                if canGatherWrite:
+                    # hand the kernel every queued message in one call, the first may be part sent
+                    sent = conn.sock.sendmsg([memoryview(queue[0])[conn.outOffset:]] + list(islice(queue, 1, MAX_GATHER)))
+                else:
+                    sent = conn.sock.send(memoryview(queue[0])[conn.outOffset:])
+                if sent:
+                    conn.outBytes -= sent
+                    conn.lastProgress = time.monotonic()
+                    if self.metrics is not None:
+                        self.metrics.bytesOut += sent
+                sent += conn.outOffset
+                while queue and sent >= len(queue[0]):
+                    sent -= len(queue.popleft())
+                conn.outOffset = sent
+                if queue and sent:
+                    break       # the kernel buffer is full, wait for EVENT_WRITE
+        except BlockingIOError:
+            pass
+        except OSError:
+            self.closeClient(conn)
+            return
+
+        events = selectors.EVENT_READ
+        if queue:
+            events |= selectors.EVENT_WRITE
+        if self.selector.get_key(conn.sock).events != events:
+            self.selector.modify(conn.sock, events, conn)
+
+    # =====================================================================
+    # Purpose: Join the upstream server as a spectator, for a relay node.
+    # Pre:  self.upstream is the (host, port) to watch.
+    # Post: On success the upstream's match is mirrored in self.mirror and
+    #       its messages are read from the event loop. Otherwise another
+    #       try is made RECONNECT_DELAY seconds later.
+    # =====================================================================
+    def subscribe(self) -> None:
+        host, port = self.upstream
+        request = {'join': 'spectate', 'protocols': SUPPORTED_PROTOCOLS}
+        if self.upstreamRoom is not None:
+            request['room'] = self.upstreamRoom
+        reader = FrameReader()
+        try:
+            # blocking, but only while nobody can be watching anything here
+            sock = socket.create_connection((host, port), timeout=UPSTREAM_TIMEOUT)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.sendall((json.dumps(request) + "\n").encode())
+            while (item := reader.next()) is None:
+                raw = sock.recv(4096)
+                if not raw:
+                    raise ConnectionError("closed before sending game info")
+                reader.feed(raw)
+        except OSError as error:
+            print(f"[UPSTREAM] could not watch {host}:{port}: {error}")
+            self.nextSubscribe = time.monotonic() + RECONNECT_DELAY
+            return
+        info = item[0]
+        if info.get('lockstep'):
+            # its spectators would need the match's whole state to start from, which only a simulation has
+            print(f"[UPSTREAM] {host}:{port} runs lockstep matches, which cannot be relayed")
+            sock.close()
+            self.nextSubscribe = time.monotonic() + RECONNECT_DELAY
+            return
+        reader.protocol = info.get('protocol', PROTOCOL_JSON)
+        self.upstreamInfo = {key: info[key] for key in ('authoritative', 'tickRate', 'sendRate') if key in info}
+        room = Room(info.get('room', self.nextRoomId))
+        self.rooms[room.roomId] = room
+        self.mirror = room
+        sock.setblocking(False)
+        self.selector.register(sock, selectors.EVENT_READ, UPSTREAM_KEY)
+        self.upstreamSock, self.upstreamReader = sock, reader
+        print(f"[UPSTREAM] mirroring room {room.roomId} of {host}:{port}")
+        self.drainUpstream()    # anything that came in with the game info
+
+    def readUpstream(self) -> None:
+        try:
+            raw = self.upstreamSock.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            raw = b""
+        if not raw:
+            print(f"[UPSTREAM] lost {self.upstream[0]}:{self.upstream[1]}")
+            self.dropUpstream()
+            return
+        if self.metrics is not None:
+            self.receivedAt = time.perf_counter()
+            self.metrics.bytesIn += len(raw)
+        self.upstreamReader.feed(raw)
+        self.drainUpstream()
+
+    def drainUpstream(self) -> None:
+        reader = self.upstreamReader
+        while self.upstreamSock is not None and (item := reader.next()) is not None:
+            self.handleUpstream(*item)
+        if reader.corrupt:
+            self.dropUpstream()
+
+    # =====================================================================
+    # Purpose: Pass one message from the upstream on to the mirror room,
+    #          as the upstream's own rooms would have.
+    # Pre:  msg and frame come from the upstream's reader.
+    # Post: Start signals and rematches go to everyone at once, game
+    #       states go out as the newest state for their key, the upstream
+    #       bytes forwarded unchanged to clients using the same format.
+    # =====================================================================
+    def handleUpstream(self, msg: dict, frame: bytes) -> None:
+        room = self.mirror
+        if self.metrics is not None:
+            self.metrics.messagesIn += 1
+        if 'start_game' in msg:
+            if not room.started:
+                room.started = True
+                print(f"[ROOM {room.roomId}] match started upstream")
+                self.broadcast(room, msg)
+        elif 'rematch' in msg:
+            self.broadcast(room, msg)
+            room.forgetStates()
+        elif 'ballX' in msg:
+            # a player's relayed state, or an authoritative snapshot
+            self.broadcast(room, msg, frame=frame, frameProtocol=self.upstreamReader.protocol,
+                           coalesceKey=msg.get('role', 'snapshot'))
+            if self.metrics is not None:
+                self.metrics.relayed += 1
+                self.metrics.relayLatency.observe(round((time.perf_counter() - self.receivedAt) * 1e6))
+
+    # the upstream's match is over or unreachable, end ours the same way and look for the next
+    def dropUpstream(self) -> None:
+        self.selector.unregister(self.upstreamSock)
+        self.upstreamSock.close()
+        self.upstreamSock = self.upstreamReader = None
+        room, self.mirror = self.mirror, None
+        if room is not None:
+            self.closeRoom(room)
+        self.nextSubscribe = time.monotonic() + RECONNECT_DELAY
+
+    def closeClient(self, conn: ClientConnection) -> None:
+        if conn.closed:
+            return
+        conn.closed = True
+        self.clientCount -= 1
+        if self.metrics is not None:
+            self.metrics.connectionsClosed += 1
+        self.selector.unregister(conn.sock)
+        conn.sock.close()
+        self.udpTokens.pop(conn.udpToken, None)
+        self.leaveRoom(conn)
+        reader = conn.reader
+        self.framesIn += reader.framesIn
+        self.malformedFrames += reader.malformed
+        self.droppedFrames += reader.dropped
+        rtt = f", rtt: {conn.rtt:.1f} ms" if conn.rtt is not None else ""
+        print(f"[DISCONNECTED] {conn.addr} frames: {reader.framesIn}, malformed: {reader.malformed}, dropped: {reader.dropped}{rtt}")
+
+
+# =====================================================================
+# Purpose: Spread rooms over several worker processes so every core can
+#          run matches. The front door only accepts connections and reads
+#          each client's join request, then passes the socket, and the
+#          bytes read so far, to the worker that hosts (or will host) its
+#          room. Workers number their rooms so the room id names its
+#          worker, and publish their load to a shared array.
+# Pre:  server must be a bound, listening socket. handoffs holds one
+#       connected SOCK_SEQPACKET Unix socket per worker, and load is the
+#       shared array the workers publish to.
+# Post: Runs until the process is stopped.
+# =====================================================================
+class FrontDoor:
+    def __init__(self, server: socket.socket, handoffs: list[socket.socket], load) -> None:
+        self.server = server
+        self.server.setblocking(False)
+        self.handoffs = handoffs
+        self.load = load
+        self.sent = [0] * len(handoffs)     # clients handed to each worker
+        self.openWorker = None      # worker holding a player who is waiting for an opponent
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(server, selectors.EVENT_READ, None)
+        self.pending = {}           # maps socket to [addr, bytes received, hello deadline]
+
+    def serveForever(self) -> None:
+        while True:
+            timeout = None
+            if self.pending:
+                timeout = max(0.0, min(entry[2] for entry in self.pending.values()) - time.monotonic())
+            for key, events in self.selector.select(timeout):
+                if key.data is None:
+                    self.acceptClient()
+                else:
+                    self.readClient(key.fileobj)
+            now = time.monotonic()
+            for sock in [sock for sock, entry in self.pending.items() if entry[2] <= now]:
+                self.handOff(sock, None)
+
+    def acceptClient(self) -> None:
+        try:
+            sock, addr = self.server.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        self.selector.register(sock, selectors.EVENT_READ, addr)
+        self.pending[sock] = [addr, bytearray(), time.monotonic() + HELLO_TIMEOUT]
+        print(f"[NEW CONNECTION] {addr}")
+
+    def readClient(self, sock: socket.socket) -> None:
+        entry = self.pending[sock]
+        try:
+            raw = sock.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            raw = b""
+        if not raw:
+            self.selector.unregister(sock)
+            del self.pending[sock]
+            sock.close()
+            return
+        entry[1] += raw
+        if b"\n" not in entry[1]:
+            return
+        try:
+            request = json.loads(entry[1][:entry[1].index(b"\n")])
+        except ValueError:
+            request = None
+        self.handOff(sock, request if isinstance(request, dict) and 'join' in request else None)
+
+    # request is the client's join request, or None if it never sent one
+    def handOff(self, sock: socket.socket, request) -> None:
+        addr, raw, _ = self.pending.pop(sock)
+        self.selector.unregister(sock)
+        worker = self.chooseWorker(request)
+        header = json.dumps({'addr': list(addr[:2]), 'hello': request is not None}).encode()
+        try:
+            socket.send_fds(self.handoffs[worker], [header + b"\n" + bytes(raw)], [sock.fileno()])
+            self.sent[worker] += 1
+        except OSError:
+            print(f"[HANDOFF FAILED] {addr} could not be passed to worker {worker}")
+        sock.close()    # the worker has its own copy now
+
+    def workerLoad(self, worker: int) -> tuple[int, int, int, int]:
+        base = worker * LOAD_FIELDS
+        return tuple(self.load[base:base + LOAD_FIELDS])
+
+    # =====================================================================
+    # Purpose: Pick the worker a new client should go to.
+    # Pre:  request is the client's join request, or None.
+    # Post: Returns a worker index. Spectators go to the worker hosting
+    #       the room they asked for. Players go to a worker with someone
+    #       waiting for an opponent, otherwise to the least busy one.
+    # =====================================================================
+    def chooseWorker(self, request) -> int:
+        workers = range(len(self.handoffs))
+        if request is not None and request['join'] == 'spectate':
+            roomId = request.get('room')
+            if isinstance(roomId, int) and roomId > 0:
+                return (roomId - 1) % len(self.handoffs)
+            # no room asked for, any worker that has matches to watch
+            return max(workers, key=lambda w: self.workerLoad(w)[0])
+
+        if self.openWorker is not None:
+            worker, self.openWorker = self.openWorker, None
+            return worker
+        # a worker whose waiting player lost their opponent, only trusted once it has caught up with us
+        for worker in workers:
+            rooms, openRooms, clients, adopted = self.workerLoad(worker)
+            if openRooms and adopted == self.sent[worker]:
+                return worker
+        self.openWorker = min(workers, key=lambda w: self.workerLoad(w)[2] + self.sent[w] - self.workerLoad(w)[3])
+        return self.openWorker
+
+
+# =====================================================================
+# Purpose: Entry point of one worker process behind a FrontDoor.
+# Pre:  handoff is this worker's end of its link to the front door.
+#       ready is released once the worker can take clients. options
+#       holds EventLoopServer's remaining arguments. A statsPort in it is
+#       the first worker's, each later worker uses the next port up.
+# Post: Runs until the front door goes away.
+# =====================================================================
+def runWorker(index: int, workers: int, handoff: socket.socket, load, ready, options: dict) -> None:
+    if options.get('statsPort') is not None:
+        options = dict(options, statsPort=options['statsPort'] + index)
+    worker = EventLoopServer(None, handoff=handoff, roomIds=(index + 1, workers), load=load, loadIndex=index,
+                             **options)
+    ready.release()
+    worker.serveForever()
+
+
+# =====================================================================
+# Purpose: Accept clients forever, handing each one to its own
+#          handle_client thread.
+# Pre:  server must be a bound, listening socket.
+# Post: Runs until the process is stopped.
+# =====================================================================
+def runThreadedServer(server: socket.socket) -> None:
+    while True:
+        conn, addr = server.accept()    # accept new client
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)    # small replies like pongs go out at once
+        clients.append(conn)            # add new client to list of clients
+        if metrics is not None:
+            metrics.connectionsAccepted += 1
+        thread = threading.Thread(target=handle_client, args=(conn, addr))  # use threads to handle multiple clients
+        thread.start()
+
+
+# print a line of metrics every interval seconds, for the threaded server
+def logStats(interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        print(f"[STATS] {metrics.logLine()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pong relay server")
+    parser.add_argument("--host", default="0.0.0.0", help="interface to listen on")
+    parser.add_argument("--port", type=int, default=65432, help="port to listen on")
+    parser.add_argument("--mode", choices=["threaded", "eventloop"], default="eventloop",
+                        help="eventloop hosts many rooms from one thread, threaded runs a single match with one thread per client")
+    parser.add_argument("--authoritative", action="store_true",
+                        help="eventloop only: simulate every match on the server and send clients snapshots")
+    parser.add_argument("--lockstep", action="store_true",
+                        help="eventloop only: simulate every match on the server and on every client, sending only inputs and checking hashes")
+    parser.add_argument("--swept", action="store_true",
+                        help="with --authoritative or --lockstep: move the ball continuously over each tick, so a --tick-rate below 60 keeps the game's pace")
+    parser.add_argument("--tick-rate", type=int, default=60,
+                        help="eventloop only: simulation ticks per second, on the server in authoritative mode and on the players otherwise")
+    parser.add_argument("--send-rate", type=float, default=0,
+                        help="eventloop only: game states players (or the server, in authoritative mode) send per second (default: every tick)")
+    parser.add_argument("--high-water", type=int, default=HIGH_WATER,
+                        help="eventloop only: bytes a client may have queued before it is disconnected")
+    parser.add_argument("--evict-after", type=float, default=EVICT_AFTER,
+                        help="eventloop only: seconds a client may read nothing while messages wait before it is disconnected")
+    parser.add_argument("--udp", action="store_true",
+                        help="eventloop only: also listen for UDP on the same port and send per-tick state over it to clients that ask")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="eventloop only: spread rooms over this many processes, one per core is a good start")
+    parser.add_argument("--stats-port", type=int, default=None,
+                        help="serve metrics over HTTP on this port (Prometheus text at /, JSON at /json); with --workers, worker N uses this port + N")
+    parser.add_argument("--stats-host", default="127.0.0.1", help="interface the metrics are served on")
+    parser.add_argument("--stats-interval", type=float, default=0, help="print a JSON line of metrics every this many seconds")
+    parser.add_argument("--record", metavar="DIR", default=None,
+                        help="eventloop only: record every match to a replay file in this directory")
+    parser.add_argument("--record-max-mb", type=int, default=MAX_FILE_BYTES // 1024**2,
+                        help="continue a recording in a new part file once it reaches this size")
+    parser.add_argument("--spectator-rate", type=float, default=0,
+                        help="eventloop only: send spectators the newest game state this many times a second instead of every update")
+    parser.add_argument("--relay-from", metavar="HOST:PORT", default=None,
+                        help="eventloop only: host no matches, watch one on this server and pass it on to everyone who connects")
+    parser.add_argument("--relay-room", type=int, default=None,
+                        help="with --relay-from, the room to watch (default: the newest match)")
+    args = parser.parse_args()
+    if args.swept and (not (args.authoritative or args.lockstep) or TICK_RATE % args.tick_rate):
+        parser.error(f"--swept needs --authoritative or --lockstep and a --tick-rate that divides {TICK_RATE}")
+    upstream = None
+    if args.relay_from:
+        if args.mode != "eventloop" or args.workers > 1 or args.authoritative or args.lockstep or args.record:
+            parser.error("--relay-from needs eventloop mode without --workers, --authoritative, --lockstep or --record")
+        upstreamHost, _, upstreamPort = args.relay_from.rpartition(":")
+        if not upstreamHost or not upstreamPort.isdigit():
+            parser.error("--relay-from must be HOST:PORT")
+        upstream = (upstreamHost, int(upstreamPort))
+    if args.workers > 1 and args.mode == "eventloop":
+        if args.udp:
+            parser.error("--udp cannot be combined with --workers")
+        if not hasattr(socket, "send_fds"):
+            parser.error("--workers needs a system that can pass sockets between processes")
+
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+    server.bind((args.host, args.port))
+    server.listen(socket.SOMAXCONN)
+
+    if args.mode == "eventloop" and args.workers > 1:
+        options = {'authoritative': args.authoritative, 'lockstep': args.lockstep, 'swept': args.swept,
+                   'tickRate': args.tick_rate,
+                   'highWater': args.high_water, 'evictAfter': args.evict_after, 'statsPort': args.stats_port,
+                   'statsHost': args.stats_host, 'statsInterval': args.stats_interval,
+                   'recordDir': args.record, 'recordMaxBytes': args.record_max_mb * 1024**2,
+                   'spectatorRate': args.spectator_rate, 'sendRate': args.send_rate}
+        # spawn rather than fork, so workers do not inherit the listening socket or each other's links
+        context = multiprocessing.get_context("spawn")
+        load = context.Array('i', args.workers * LOAD_FIELDS, lock=False)
+        ready = context.Semaphore(0)
+        handoffs = []
+        for index in range(args.workers):
+            frontEnd, workerEnd = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+            context.Process(target=runWorker, args=(index, args.workers, workerEnd, load, ready, options),
+                            daemon=True).start()
+            workerEnd.close()
+            handoffs.append(frontEnd)
+        for _ in handoffs:
+            ready.acquire()     # clients are only accepted once every worker can take them
+        print(f"Started {args.workers} workers")
+
+    print(f"Server listening on port {args.port} ({args.mode}) ...")
+
+    # print current IP for clients to use in command line
+    try:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.connect(("8.8.8.8", 80))
+        print("IP: " + s.getsockname()[0])
+        s.close()
+    except OSError:
+        print("IP: could not be determined, use this machine's address")
+
+    udpSock = None
+    if args.udp and args.mode == "eventloop":
+        udpSock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        udpSock.bind((args.host, args.port))
+
+    if args.mode == "eventloop" and args.workers > 1:
+        FrontDoor(server, handoffs, load).serveForever()
+    elif args.mode == "eventloop":
+        EventLoopServer(server, args.authoritative, args.tick_rate, args.high_water, args.evict_after,
+                        udpSock, statsPort=args.stats_port, statsHost=args.stats_host,
+                        statsInterval=args.stats_interval, recordDir=args.record,
+                        recordMaxBytes=args.record_max_mb * 1024**2, spectatorRate=args.spectator_rate,
+                        upstream=upstream, upstreamRoom=args.relay_room, sendRate=args.send_rate,
+                        lockstep=args.lockstep, swept=args.swept).serveForever()
+    else:
+        if args.stats_port is not None or args.stats_interval:
+            metrics = ServerMetrics(lambda: {'clients': len(clients)})
+        if args.stats_port is not None:
+            endpoint = StatsEndpoint(metrics, args.stats_host, args.stats_port)
+            threading.Thread(target=endpoint.serveForever, daemon=True).start()
+        if args.stats_interval:
+            threading.Thread(target=logStats, args=(args.stats_interval,), daemon=True).start()
+        runThreadedServer(server)